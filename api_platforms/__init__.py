@@ -1,14 +1,19 @@
 from .siliconflow import SiliconFlow
 from .model_platform import ModelPlatform
-from .openai import OpenAI
+from .openai import OpenAIPlatform
 from .volcengine_ark import VolcengineArk
+from .client_pool import ClientPool
+from .resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+from .concurrency_limiter import AdaptiveLimiter
+from .tool_executor import ToolBudget, ToolExecutor
+from .platform_router import EndpointStats, ModelEndpoint, PlatformRouter
 
 PLATFORMNAMEMAP = {
     "SiliconFlow": SiliconFlow,
-    "OpenAI": OpenAI,
+    "OpenAI": OpenAIPlatform,
     "VolcengineArk": VolcengineArk
 }
 
-__all__ = ["ModelPlatform", "PLATFORMNAMEMAP",
-           "SiliconFlow", "OpenAI", "VolcengineArk"]
-
+__all__ = ["ModelPlatform", "PLATFORMNAMEMAP", "ClientPool",
+           "CircuitBreaker", "CircuitOpenError", "RetryPolicy", "AdaptiveLimiter", "ToolBudget", "ToolExecutor", "EndpointStats", "ModelEndpoint", "PlatformRouter",
+           "SiliconFlow", "OpenAIPlatform", "VolcengineArk"]
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import weakref
+from typing import Optional
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+_DEFAULT_BASE_URL = "https://api.openai.com/v1"
+_POOL_LIMITS = httpx.Limits(max_connections=256, max_keepalive_connections=64, keepalive_expiry=60)
+_POOL_TIMEOUT = httpx.Timeout(120, connect=10)
+
+
+class ClientPool:
+    """OpenAI SDK 客户端池，同一 base_url 的客户端共享一个 keep-alive 连接池
+
+    说明:
+        - 同步客户端按 base_url 共享 `httpx.Client`。
+        - 异步连接池绑定事件循环，因此按 (事件循环, base_url) 共享 `httpx.AsyncClient`，事件循环销毁后自动释放。
+        - SDK 客户端本身只是轻量封装，按 (base_url, api_key) 缓存复用。
+        - 关闭 SDK 自带的重试，统一由 `ModelPlatform` 的重试与熔断处理。
+    """
+    _lock = threading.Lock()
+    _http_clients: dict[str, httpx.Client] = {}
+    _clients: dict[tuple[str, str], OpenAI] = {}
+    _async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+    _async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple[str, str], AsyncOpenAI]]" = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def get_client(cls, api_key: str, base_url: Optional[str] = None) -> OpenAI:
+        """获取同步客户端"""
+        base_url = (base_url or _DEFAULT_BASE_URL).rstrip("/")
+        with cls._lock:
+            client = cls._clients.get((base_url, api_key))
+            if client is None:
+                http_client = cls._http_clients.get(base_url)
+                if http_client is None:
+                    http_client = httpx.Client(limits=_POOL_LIMITS, timeout=_POOL_TIMEOUT)
+                    cls._http_clients[base_url] = http_client
+                client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+                cls._clients[(base_url, api_key)] = client
+            return client
+
+    @classmethod
+    def get_async_client(cls, api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+        """获取绑定当前事件循环的异步客户端，必须在事件循环内调用"""
+        loop = asyncio.get_running_loop()
+        base_url = (base_url or _DEFAULT_BASE_URL).rstrip("/")
+        with cls._lock:
+            clients = cls._async_clients.setdefault(loop, {})
+            client = clients.get((base_url, api_key))
+            if client is None:
+                http_clients = cls._async_http_clients.setdefault(loop, {})
+                http_client = http_clients.get(base_url)
+                if http_client is None:
+                    http_client = httpx.AsyncClient(limits=_POOL_LIMITS, timeout=_POOL_TIMEOUT)
+                    http_clients[base_url] = http_client
+                client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+                clients[(base_url, api_key)] = client
+            return client
+
+    @classmethod
+    async def aclose_loop_clients(cls):
+        """关闭当前事件循环持有的异步连接池，应在事件循环退出前调用"""
+        loop = asyncio.get_running_loop()
+        with cls._lock:
+            http_clients = cls._async_http_clients.pop(loop, {})
+            cls._async_clients.pop(loop, None)
+        for http_client in http_clients.values():
+            await http_client.aclose()
+
+    @classmethod
+    def close(cls):
+        """关闭所有同步连接池"""
+        with cls._lock:
+            http_clients = list(cls._http_clients.values())
+            cls._http_clients.clear()
+            cls._clients.clear()
+        for http_client in http_clients:
+            http_client.close()
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from ..utils import TokenBucket
+
+
+class _Waiter:
+    __slots__ = ("cost", "wake", "granted")
+
+    def __init__(self, cost: float, wake: Callable[[], None]):
+        self.cost = cost
+        self.wake = wake
+        self.granted = False
+
+
+class AdaptiveLimiter:
+    """平台并发与 token 配额限制器
+
+    说明:
+        - 并发上限按 AIMD 调整：上限被用满时每个成功请求使上限增加 1/上限，即每轮约 +1；
+          收到 429 时上限乘以 `decrease_ratio`，`cooldown` 秒内的多次 429 只下调一次。
+        - `tpm` 大于 0 时另按每分钟 token 配额限流：请求前按估算值预扣，完成后按 `usage` 中的实际用量多退少补；
+          收到 429 时清空剩余额度。
+        - 同步与异步调用者在同一个先进先出队列中排队，队首拿不到名额时后面的请求也不插队。
+        - 通过 `for_key` 按平台地址共享，同一平台的所有模型共用一个限制器。
+    """
+
+    _registry: dict[str, "AdaptiveLimiter"] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, name: str, initial_limit: float = 4, min_limit: float = 1, max_limit: float = 32,
+                 tpm: float = 0, decrease_ratio: float = 0.5, cooldown: float = 1.0):
+        self.name = name
+        self._lock = threading.Lock()
+        self._queue: deque[_Waiter] = deque()
+        self._inflight = 0
+        self._timer: Optional[threading.Timer] = None
+        self._last_decrease = 0.0
+        self.configure(initial_limit, min_limit, max_limit, tpm, decrease_ratio, cooldown)
+
+    @classmethod
+    def for_key(cls, key: str) -> "AdaptiveLimiter":
+        with cls._registry_lock:
+            limiter = cls._registry.get(key)
+            if limiter is None:
+                limiter = cls._registry[key] = cls(key)
+            return limiter
+
+    def configure(self, initial_limit: float = 4, min_limit: float = 1, max_limit: float = 32,
+                  tpm: float = 0, decrease_ratio: float = 0.5, cooldown: float = 1.0):
+        with self._lock:
+            self.min_limit = max(min_limit, 1)
+            self.max_limit = max(max_limit, self.min_limit)
+            self.limit = min(max(initial_limit, self.min_limit), self.max_limit)
+            self.decrease_ratio = decrease_ratio
+            self.cooldown = cooldown
+            self._bucket = TokenBucket(tpm / 60, tpm)
+            self._grant_locked()
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "inflight": self._inflight,
+                "queued": len(self._queue),
+                "tokens": None if self._bucket.unlimited else int(self._bucket.tokens)
+            }
+
+    def _grant_locked(self):
+        """按队列顺序放行，队首因 token 不足等待时定时重试"""
+        while self._queue and self._inflight < int(self.limit):
+            waiter = self._queue[0]
+            # 单个请求的估算值超过桶容量时只要求桶满，避免永远等不到
+            delay = self._bucket.time_until(min(waiter.cost, self._bucket.capacity))
+            if delay > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(delay, self._on_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            self._queue.popleft()
+            self._bucket.take(waiter.cost)
+            self._inflight += 1
+            waiter.granted = True
+            waiter.wake()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._grant_locked()
+
+    def _enqueue(self, cost: float, wake: Callable[[], None]) -> _Waiter:
+        waiter = _Waiter(cost, wake)
+        with self._lock:
+            self._queue.append(waiter)
+            self._grant_locked()
+        return waiter
+
+    def acquire(self, cost: float = 0) -> float:
+        """阻塞等待一个并发名额并预扣 cost 个 token，返回值需原样传给 `release`"""
+        event = threading.Event()
+        self._enqueue(cost, event.set)
+        event.wait()
+        return cost
+
+    async def acquire_async(self, cost: float = 0) -> float:
+        """`acquire` 的异步版本，等待期间被取消时放弃排队或归还已分到的名额"""
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enqueue(cost, wake)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if not waiter.granted:
+                    self._queue.remove(waiter)
+                    self._grant_locked()
+                    raise
+            self.release(cost)
+            raise
+        return cost
+
+    def release(self, cost: float, used_tokens: Optional[int] = None, rate_limited: bool = False):
+        """请求结束后归还名额
+
+        Args:
+            cost: `acquire` 的返回值
+            used_tokens: 实际消耗的 token 数，为 None 时保留预扣值
+            rate_limited: 本次请求是否收到 429
+        """
+        with self._lock:
+            saturated = self._inflight >= int(self.limit)
+            self._inflight -= 1
+            if used_tokens is not None and not self._bucket.unlimited:
+                self._bucket.tokens = min(self._bucket.capacity, self._bucket.tokens + cost - used_tokens)
+            now = time.monotonic()
+            if rate_limited:
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_ratio)
+                    self._last_decrease = now
+                if not self._bucket.unlimited:
+                    self._bucket.tokens = min(self._bucket.tokens, 0)
+            elif saturated or self._queue:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._grant_locked()
@@ -1,9 +1,27 @@
+import asyncio
 import json
-from typing import Callable, Optional
-from openai import OpenAI
-from openai.types.chat import ChatCompletion, ChatCompletionMessageFunctionToolCall
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, TypeVar
+from openai import OpenAI, AsyncOpenAI
+from openai.types.chat import ChatCompletion
 
+from .client_pool import ClientPool
+from .concurrency_limiter import AdaptiveLimiter
+from .tool_executor import ToolBudget, ToolExecutor
+from .resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, is_rate_limited, is_retryable
 from ..message import ChatRequest
+from ..utils import estimate_tokens
+
+T = TypeVar("T")
+
+# 未指定 max_tokens 时按此估算输出的 token 数
+_DEFAULT_COMPLETION_TOKENS = 512
+
+
+def _used_tokens(result: Any) -> Optional[int]:
+    usage = getattr(result, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
 
 class ModelPlatform:
     def __init__(self, api_url: str, authorization: str, chat_api: str = "chat/completions", img_api: str = "images/generations"):
@@ -12,6 +30,123 @@ class ModelPlatform:
         self._chat_model_api = api_url + chat_api
         self._img_model_api = api_url + img_api
         self.custom_extra_body: Optional[Callable] = None
+        self.retry_policy = RetryPolicy()
+        self.breaker = CircuitBreaker.for_key(api_url)
+        self.limiter = AdaptiveLimiter.for_key(api_url)
+        self.tool_budget = ToolBudget()
+
+    @property
+    def name(self) -> str:
+        return self.__class__.__name__
+
+    def _init_sdk_client(self, base_url: Optional[str] = None):
+        """初始化 OpenAI SDK 客户端，相同 base_url 的平台共享同一个连接池"""
+        self._sdk_base_url = base_url
+        self._client = ClientPool.get_client(self._authorization, base_url)
+
+    def _get_async_client(self) -> AsyncOpenAI:
+        """获取绑定当前事件循环的异步客户端"""
+        if hasattr(self, "_sdk_base_url") is False:
+            raise NotImplementedError("子类需要实现 OpenAI SDK 客户端")
+        return ClientPool.get_async_client(self._authorization, self._sdk_base_url)
+
+    @staticmethod
+    def _estimate_cost(payload: dict) -> int:
+        """估算一次请求消耗的 token 数，用于配额预扣"""
+        prompt = sum(estimate_tokens(str(message.get("content") or "")) for message in payload.get("messages", []))
+        return prompt + (payload.get("max_tokens") or _DEFAULT_COMPLETION_TOKENS)
+
+    def _with_retry(self, call: Callable[[float], T], cost: int = 0) -> T:
+        """带限流、熔断与抖动退避重试地执行一次请求
+
+        Args:
+            call: 接收本次尝试可用的超时秒数
+            cost: 预估消耗的 token 数
+        """
+        policy = self.retry_policy
+        deadline = time.monotonic() + policy.deadline
+        attempt = 0
+        while True:
+            # 每次尝试单独排队，退避等待期间不占用并发名额
+            permit = self.limiter.acquire(cost)
+            if not self.breaker.allow():
+                self.limiter.release(permit, used_tokens=0)
+                raise CircuitOpenError(f"{self.name} 熔断中")
+            try:
+                result = call(max(deadline - time.monotonic(), 1))
+            except Exception as e:
+                self.limiter.release(permit, rate_limited=is_rate_limited(e))
+                if not is_retryable(e):
+                    self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                delay = policy.backoff(attempt, e)
+                attempt += 1
+                if attempt >= policy.max_attempts or time.monotonic() + delay >= deadline:
+                    raise
+                time.sleep(delay)
+            else:
+                self.limiter.release(permit, _used_tokens(result))
+                self.breaker.record_success()
+                return result
+
+    async def _with_retry_async(self, call: Callable[[float], Awaitable[T]], cost: int = 0, hold: bool = False) -> T:
+        """`_with_retry` 的异步版本，排队与退避等待不阻塞事件循环
+
+        hold 为 True 时（流式请求）成功后不归还名额、不记录熔断结果，由调用方在流结束时调用 `_finish_stream`
+        """
+        policy = self.retry_policy
+        deadline = time.monotonic() + policy.deadline
+        attempt = 0
+        while True:
+            permit = await self.limiter.acquire_async(cost)
+            if not self.breaker.allow():
+                self.limiter.release(permit, used_tokens=0)
+                raise CircuitOpenError(f"{self.name} 熔断中")
+            try:
+                result = await call(max(deadline - time.monotonic(), 1))
+            except asyncio.CancelledError:
+                self.limiter.release(permit)
+                self.breaker.release()
+                raise
+            except Exception as e:
+                self.limiter.release(permit, rate_limited=is_rate_limited(e))
+                if not is_retryable(e):
+                    self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                delay = policy.backoff(attempt, e)
+                attempt += 1
+                if attempt >= policy.max_attempts or time.monotonic() + delay >= deadline:
+                    raise
+                await asyncio.sleep(delay)
+            else:
+                if not hold:
+                    self.limiter.release(permit, _used_tokens(result))
+                    self.breaker.record_success()
+                return result
+
+    def _finish_stream(self, cost: int, used_tokens: Optional[int], completed: bool, error: Optional[BaseException]):
+        """流式请求结束时归还名额并按实际用量修正 TPM，熔断结果按整个流的成败记录"""
+        self.limiter.release(cost, used_tokens, rate_limited=error is not None and is_rate_limited(error))
+        if completed:
+            self.breaker.record_success()
+        elif error is not None and is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            # 调用方提前结束或非暂时性错误，只归还半开状态的探测名额
+            self.breaker.release()
+
+    def _create_completion(self, payload: dict, extra_body: Optional[dict]) -> ChatCompletion:
+        self._client: OpenAI
+        return self._with_retry(lambda timeout: self._client.chat.completions.create(**payload, extra_body=extra_body, timeout=timeout),
+                                self._estimate_cost(payload))
+
+    async def _create_completion_async(self, payload: dict, extra_body: Optional[dict], cost: Optional[int] = None,
+                                       hold: bool = False, **kwargs: Any) -> Any:
+        client = self._get_async_client()
+        return await self._with_retry_async(lambda timeout: client.chat.completions.create(**payload, extra_body=extra_body, timeout=timeout, **kwargs),
+                                            self._estimate_cost(payload) if cost is None else cost, hold)
 
     def _build_headers(self) -> dict:
         return {
@@ -23,43 +158,89 @@ class ModelPlatform:
         headers = self._build_headers()
         return self.send_request(payload, headers, extra_body, chat_request)
 
+    async def response_async(self, payload: dict, extra_body: Optional[dict], chat_request: Optional[ChatRequest]) -> dict:
+        headers = self._build_headers()
+        return await self.send_request_async(payload, headers, extra_body, chat_request)
+
+    def response_stream_async(self, payload: dict, extra_body: Optional[dict]) -> AsyncIterator[str]:
+        """流式请求，逐段返回生成的文本"""
+        return self.send_request_stream_async(payload, extra_body)
+
     def send_request(self, payload: dict, headers: dict, extra_body: Optional[dict] = None, chat_request: Optional[ChatRequest] = None) -> dict:
         """发送请求，如需requests实现，重写此函数"""
         result = self.send_request_openai(payload, extra_body, chat_request)
         return result if result else {}
 
+    async def send_request_async(self, payload: dict, headers: dict, extra_body: Optional[dict] = None, chat_request: Optional[ChatRequest] = None) -> dict:
+        """异步发送请求，如需httpx实现，重写此函数"""
+        result = await self.send_request_openai_async(payload, extra_body, chat_request)
+        return result if result else {}
+
     def send_request_openai(self, payload: dict, extra_body: Optional[dict] = None, chat_request: Optional[ChatRequest] = None) -> dict:
-        """使用 OpenAI SDK 发送请求"""
+        """使用 OpenAI SDK 发送请求，模型请求调用工具时执行工具并继续请求，直到得到回复或预算用尽"""
         if hasattr(self, "_client") is False:
             raise NotImplementedError("子类需要实现 OpenAI SDK 客户端")
-        self._client: OpenAI
-        completion : ChatCompletion = self._client.chat.completions.create(**payload, extra_body=extra_body)
-        # 处理 API 返回的所有工具调用请求
-        if not completion.choices[0].message.tool_calls:
-            return json.loads(completion.model_dump_json())
-        
-        if not chat_request:
-            raise ValueError("当使用FunctionCall时, chat_request 不能为空")
-        for tool_call in completion.choices[0].message.tool_calls:
-            if not isinstance(tool_call, ChatCompletionMessageFunctionToolCall):
-                continue
-            func_name = tool_call.function.name
-            func_args = tool_call.function.arguments
-            func_args_dict = json.loads(func_args)
-            if func_name not in [f for f in chat_request.instance_get_tool_names()]:
-                raise ValueError(f"模型请求调用未注册的函数: {func_name}")
-            if isinstance(func_args_dict, dict):
-                func_out = next(f for f in chat_request.instance_get_tools() if f.__name__ == func_name)(**func_args_dict)
-            else:
-                func_out = f"调用函数 {func_name} 失败，请直接告诉用户你无法完成这一操作。"
-            func_out += f"\n**禁止继续调用该函数。明确执行函数 {func_name} 的要求**"
-            payload["messages"].append({
-                "role": "tool",
-                "content": func_out,
-                "tool_call_id": tool_call.id
-            })
-        return self.send_request_openai(payload, extra_body, chat_request)
-    
+        executor: Optional[ToolExecutor] = None
+        while True:
+            completion : ChatCompletion = self._create_completion(payload, extra_body)
+            message = completion.choices[0].message
+            tool_calls = ToolExecutor.function_calls(message)
+            if not tool_calls or (executor and payload.get("tool_choice") == "none"):
+                return json.loads(completion.model_dump_json())
+            if not chat_request:
+                raise ValueError("当使用FunctionCall时, chat_request 不能为空")
+            executor = executor or ToolExecutor(chat_request, self.tool_budget)
+            payload["messages"].append(ToolExecutor.assistant_message(message, tool_calls))
+            payload["messages"].extend(executor.run(tool_calls))
+            if executor.exhausted(self._estimate_cost(payload)):
+                payload["tool_choice"] = "none"
+
+    async def send_request_openai_async(self, payload: dict, extra_body: Optional[dict] = None, chat_request: Optional[ChatRequest] = None) -> dict:
+        """使用 OpenAI SDK 异步发送请求，工具函数在线程池中执行以免阻塞事件循环"""
+        executor: Optional[ToolExecutor] = None
+        while True:
+            completion : ChatCompletion = await self._create_completion_async(payload, extra_body)
+            message = completion.choices[0].message
+            tool_calls = ToolExecutor.function_calls(message)
+            if not tool_calls or (executor and payload.get("tool_choice") == "none"):
+                return json.loads(completion.model_dump_json())
+            if not chat_request:
+                raise ValueError("当使用FunctionCall时, chat_request 不能为空")
+            executor = executor or ToolExecutor(chat_request, self.tool_budget)
+            payload["messages"].append(ToolExecutor.assistant_message(message, tool_calls))
+            payload["messages"].extend(await executor.run_async(tool_calls))
+            if executor.exhausted(self._estimate_cost(payload)):
+                payload["tool_choice"] = "none"
+
+    async def send_request_stream_async(self, payload: dict, extra_body: Optional[dict] = None) -> AsyncIterator[str]:
+        """使用 OpenAI SDK 发送流式请求，不支持 FunctionCall
+
+        并发名额在整个流期间占用，流结束后按最后一个 chunk 中的用量修正 TPM 预扣值
+        """
+        cost = self._estimate_cost(payload)
+        # 只重试建立连接阶段，已开始输出后出错直接抛出
+        stream = await self._create_completion_async(payload, extra_body, cost=cost, hold=True,
+                                                     stream=True, stream_options={"include_usage": True})
+        used_tokens: Optional[int] = None
+        completed = False
+        error: Optional[BaseException] = None
+        try:
+            async for chunk in stream:
+                used_tokens = _used_tokens(chunk) or used_tokens
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+            completed = True
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._finish_stream(cost, used_tokens, completed, error)
+            if not completed:
+                await stream.close()
+
     def send_img_request(self, payload: dict, headers: dict) -> dict:
         """发送图片生成请求，子类需要实现该方法"""
-        raise NotImplementedError("子类需要实现 send_img_request 方法")
\ No newline at end of file
+        raise NotImplementedError("子类需要实现 send_img_request 方法")
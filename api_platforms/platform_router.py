@@ -0,0 +1,236 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+from ncatbot.utils import get_log
+
+from .model_platform import ModelPlatform
+from .resilience import CircuitOpenError, is_retryable
+
+T = TypeVar("T")
+
+
+@dataclass(slots=True)
+class ModelEndpoint:
+    """一个可用的 平台/模型 组合"""
+    platform: ModelPlatform
+    model_name: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.platform.name}/{self.model_name}"
+
+
+@dataclass(slots=True)
+class EndpointStats:
+    """单个 平台/模型 组合的请求统计。
+
+    latency: 成功请求耗时的指数移动平均（秒），流式请求为首段内容的耗时
+    error_rate: 失败率的指数移动平均
+    samples: 已统计的请求数
+    recent: 最近成功请求的耗时，用于计算对冲阈值的分位数
+    """
+    latency: float = 0.0
+    error_rate: float = 0.0
+    samples: int = 0
+    recent: deque = field(default_factory=lambda: deque(maxlen=64))
+
+
+class PlatformRouter:
+    """在同一模型角色的多个 平台/模型 组合之间路由与故障转移
+
+    说明:
+        - 熔断中的平台排到最后，全部熔断时仍按顺序尝试一遍。
+        - `balance` 为 True 时按延迟与失败率的指数移动平均选择最优平台，否则按配置顺序；
+          按 `explore_ratio` 的概率随机优先一个平台，使备用平台的统计保持更新。
+        - `hedge` 为 True 时，异步请求在首选平台超过其耗时的 `hedge_percentile` 分位数仍未返回时，
+          向次优平台再发一份，取先成功的结果并取消另一份。使用工具或流式输出的请求不对冲。
+        - 单个平台内部的重试由 `ModelPlatform` 负责，这里只在该平台最终失败后切换到下一个。
+        - 流式请求只在产出第一段内容前切换，已经输出的内容无法撤回。
+    """
+
+    log = get_log("SiriusChatCore-PlatformRouter")
+    _EWMA_ALPHA = 0.2
+    _ERROR_PENALTY = 4.0
+    _HEDGE_MIN_SAMPLES = 10
+
+    def __init__(self, endpoints: list[ModelEndpoint]):
+        if not endpoints:
+            raise ValueError("至少需要一个可用的平台")
+        self.endpoints = endpoints
+        self.balance = True
+        self.explore_ratio = 0.05
+        self.hedge = False
+        self.hedge_percentile = 0.9
+        self.hedge_min_delay = 2.0
+        self._stats: dict[int, EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint: ModelEndpoint):
+        self.endpoints.append(endpoint)
+
+    def configure(self, balance: bool = True, explore_ratio: float = 0.05, hedge: bool = False,
+                  hedge_percentile: float = 0.9, hedge_min_delay: float = 2.0):
+        self.balance = balance
+        self.explore_ratio = explore_ratio
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+
+    def stats(self, endpoint: ModelEndpoint) -> EndpointStats:
+        with self._lock:
+            return self._stats.setdefault(id(endpoint), EndpointStats())
+
+    def _record(self, endpoint: ModelEndpoint, latency: Optional[float]):
+        """记录一次请求结果，latency 为 None 表示失败"""
+        alpha = self._EWMA_ALPHA
+        with self._lock:
+            stats = self._stats.setdefault(id(endpoint), EndpointStats())
+            error = 1.0 if latency is None else 0.0
+            stats.error_rate = error if stats.samples == 0 else (1 - alpha) * stats.error_rate + alpha * error
+            if latency is not None:
+                stats.latency = latency if not stats.recent else (1 - alpha) * stats.latency + alpha * latency
+                stats.recent.append(latency)
+            stats.samples += 1
+
+    def _score(self, stats: Optional[EndpointStats], default: float) -> float:
+        if stats is None or not stats.recent:
+            # 没有成功样本时乐观地视为与当前最优相同，按配置顺序决胜
+            return default if stats is None or stats.error_rate == 0 else float("inf")
+        return stats.latency * (1 + self._ERROR_PENALTY * stats.error_rate)
+
+    def candidates(self) -> list[ModelEndpoint]:
+        """本次请求的尝试顺序"""
+        available = [e for e in self.endpoints if e.platform.breaker.available()]
+        unavailable = [e for e in self.endpoints if e not in available]
+        if self.balance and len(available) > 1:
+            with self._lock:
+                stats = {id(e): self._stats.get(id(e)) for e in available}
+            known = [self._score(s, 0.0) for s in stats.values() if s is not None and s.recent]
+            best = min(known) if known else 0.0
+            order = {id(e): i for i, e in enumerate(available)}
+            available.sort(key=lambda e: (self._score(stats[id(e)], best), order[id(e)]))
+            if random.random() < self.explore_ratio:
+                explored = available.pop(random.randrange(len(available)))
+                available.insert(0, explored)
+        return available + unavailable
+
+    def _hedge_delay(self, endpoint: ModelEndpoint) -> Optional[float]:
+        """首选平台的对冲等待时间，样本不足时不对冲"""
+        with self._lock:
+            stats = self._stats.get(id(endpoint))
+            if stats is None or len(stats.recent) < self._HEDGE_MIN_SAMPLES:
+                return None
+            recent = sorted(stats.recent)
+        index = min(int(self.hedge_percentile * (len(recent) - 1)), len(recent) - 1)
+        return max(recent[index], self.hedge_min_delay)
+
+    @staticmethod
+    def _can_failover(error: BaseException) -> bool:
+        """只有熔断与暂时性错误才切换平台，请求本身的错误（如参数错误、工具执行失败）直接抛出"""
+        return isinstance(error, CircuitOpenError) or is_retryable(error)
+
+    def _on_failure(self, endpoint: ModelEndpoint, error: Exception):
+        level = self.log.debug if isinstance(error, CircuitOpenError) else self.log.warning
+        level(f"{endpoint.name} 请求失败，切换到备用平台: {error}")
+
+    def call(self, fn: Callable[[ModelEndpoint], T]) -> T:
+        candidates = self.candidates()
+        for i, endpoint in enumerate(candidates):
+            start = time.monotonic()
+            try:
+                result = fn(endpoint)
+            except Exception as e:
+                self._record(endpoint, None)
+                if i == len(candidates) - 1 or not self._can_failover(e):
+                    raise
+                self._on_failure(endpoint, e)
+            else:
+                self._record(endpoint, time.monotonic() - start)
+                return result
+        raise AssertionError("unreachable")
+
+    async def _timed(self, endpoint: ModelEndpoint, fn: Callable[[ModelEndpoint], Awaitable[T]]) -> T:
+        start = time.monotonic()
+        try:
+            result = await fn(endpoint)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._record(endpoint, None)
+            raise
+        self._record(endpoint, time.monotonic() - start)
+        return result
+
+    async def call_async(self, fn: Callable[[ModelEndpoint], Awaitable[T]], hedge: bool = True) -> T:
+        """异步请求，hedge 为 False 时即使开启了对冲也不对冲（如请求会执行工具）"""
+        candidates = self.candidates()
+        if hedge and self.hedge and len(candidates) > 1 and candidates[1].platform.breaker.available():
+            delay = self._hedge_delay(candidates[0])
+            if delay is not None:
+                return await self._call_hedged(fn, candidates, delay)
+        return await self._call_sequential(fn, candidates)
+
+    async def _call_sequential(self, fn: Callable[[ModelEndpoint], Awaitable[T]], candidates: list[ModelEndpoint]) -> T:
+        for i, endpoint in enumerate(candidates):
+            try:
+                return await self._timed(endpoint, fn)
+            except Exception as e:
+                if i == len(candidates) - 1 or not self._can_failover(e):
+                    raise
+                self._on_failure(endpoint, e)
+        raise AssertionError("unreachable")
+
+    async def _call_hedged(self, fn: Callable[[ModelEndpoint], Awaitable[T]], candidates: list[ModelEndpoint], delay: float) -> T:
+        primary, secondary, rest = candidates[0], candidates[1], candidates[2:]
+        tasks: dict[asyncio.Task, ModelEndpoint] = {asyncio.ensure_future(self._timed(primary, fn)): primary}
+        last_error: Optional[BaseException] = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.log.debug(f"{primary.name} 超过 {delay:.2f} 秒未返回，向 {secondary.name} 发送对冲请求")
+                tasks[asyncio.ensure_future(self._timed(secondary, fn))] = secondary
+            else:
+                # 首选平台在对冲前就已失败，次优平台按顺序接替
+                rest = [secondary] + rest
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    assert last_error is not None
+                    if not self._can_failover(last_error):
+                        raise last_error
+                    self._on_failure(tasks[task], last_error)  # type: ignore[arg-type]
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        if not rest:
+            assert last_error is not None
+            raise last_error
+        return await self._call_sequential(fn, rest)
+
+    async def stream(self, fn: Callable[[ModelEndpoint], AsyncIterator[T]]) -> AsyncIterator[T]:
+        candidates = self.candidates()
+        for i, endpoint in enumerate(candidates):
+            started = False
+            start = time.monotonic()
+            try:
+                async for item in fn(endpoint):
+                    if not started:
+                        started = True
+                        self._record(endpoint, time.monotonic() - start)
+                    yield item
+                return
+            except Exception as e:
+                if not started:
+                    self._record(endpoint, None)
+                if started or i == len(candidates) - 1 or not self._can_failover(e):
+                    raise
+                self._on_failure(endpoint, e)
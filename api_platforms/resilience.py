@@ -0,0 +1,137 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import openai
+
+_RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """平台熔断中，请求未发出"""
+
+
+@dataclass(slots=True)
+class RetryPolicy:
+    """重试策略
+
+    max_attempts: 单次请求最多尝试的次数（含第一次）
+    base_delay / max_delay: 指数退避的基数与上限（秒），实际等待时间为 [0, 退避值] 内的随机值
+    deadline: 单次请求包括所有重试在内的总耗时预算（秒），剩余预算不足以等待时不再重试
+    """
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    deadline: float = 60.0
+
+    def backoff(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """第 attempt 次（从 0 开始）失败后的等待秒数，服务端给出 Retry-After 时以其为下限"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+def _retry_after(error: Optional[BaseException]) -> Optional[float]:
+    if not isinstance(error, openai.APIStatusError):
+        return None
+    value = error.response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    return isinstance(error, openai.APIStatusError) and error.status_code == 429
+
+
+def is_retryable(error: BaseException) -> bool:
+    """限流、超时、连接错误与 5xx 视为可重试的暂时性错误"""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in _RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """平台熔断器
+
+    说明:
+        - 连续 `failure_threshold` 次暂时性错误后熔断 `recovery_timeout` 秒，期间请求直接失败以便尽快切换到备用平台。
+        - 熔断时间结束后进入半开状态，只放行一个探测请求，成功则恢复，失败则重新熔断。
+        - 通过 `for_key` 按平台地址共享，同一平台的所有模型共用一个熔断器。
+    """
+
+    _registry: dict[str, "CircuitBreaker"] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @classmethod
+    def for_key(cls, key: str) -> "CircuitBreaker":
+        with cls._registry_lock:
+            breaker = cls._registry.get(key)
+            if breaker is None:
+                breaker = cls._registry[key] = cls(key)
+            return breaker
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at < self.recovery_timeout:
+            return "open"
+        return "half_open"
+
+    def available(self) -> bool:
+        """是否可能放行请求，不占用半开状态的探测名额"""
+        with self._lock:
+            state = self._state(time.monotonic())
+            return state == "closed" or (state == "half_open" and not self._probing)
+
+    def allow(self) -> bool:
+        """请求前调用，返回是否放行"""
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """请求因非暂时性错误结束时调用，归还半开状态的探测名额"""
+        with self._lock:
+            self._probing = False
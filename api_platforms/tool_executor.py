@@ -0,0 +1,120 @@
+import asyncio
+import concurrent.futures
+import json
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageFunctionToolCall
+
+from ..message import ChatRequest
+
+
+@dataclass(slots=True)
+class ToolBudget:
+    """工具调用的预算
+
+    max_rounds: 一次请求中最多执行几轮工具调用，用尽后要求模型直接回答
+    max_tokens: 追加工具结果后请求的估算 token 数上限，超过后同样要求模型直接回答
+    tool_timeout: 单轮工具调用的超时秒数，同一轮的工具并发执行
+    """
+    max_rounds: int = 4
+    max_tokens: int = 16000
+    tool_timeout: float = 10.0
+
+
+class ToolExecutor:
+    """单个聊天请求的工具调用执行器
+
+    说明:
+        - 创建时按函数名建立索引，同一轮的多个工具调用在共享线程池中并发执行，耗时取决于最慢的一个。
+        - 超时的工具返回超时提示，线程无法强行终止，会在后台执行完毕。
+        - 调用未注册的函数、参数无法解析或执行出错时返回失败提示，由模型决定如何回复。
+    """
+
+    _pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+    _pool_lock = threading.Lock()
+
+    def __init__(self, chat_request: ChatRequest, budget: ToolBudget):
+        self._tools: dict[str, Callable] = chat_request.instance_get_tool_map()
+        self.budget = budget
+        self.rounds = 0
+
+    @classmethod
+    def _get_pool(cls) -> concurrent.futures.ThreadPoolExecutor:
+        with cls._pool_lock:
+            if cls._pool is None:
+                cls._pool = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="tool_executor")
+            return cls._pool
+
+    @staticmethod
+    def function_calls(message: ChatCompletionMessage) -> list[ChatCompletionMessageFunctionToolCall]:
+        return [c for c in message.tool_calls or [] if isinstance(c, ChatCompletionMessageFunctionToolCall)]
+
+    def exhausted(self, estimated_tokens: int) -> bool:
+        """预算是否已经用尽，用尽后下一次请求应禁止调用工具"""
+        return self.rounds >= self.budget.max_rounds or estimated_tokens >= self.budget.max_tokens
+
+    @staticmethod
+    def assistant_message(message: ChatCompletionMessage, tool_calls: list[ChatCompletionMessageFunctionToolCall]) -> dict:
+        """模型发起工具调用的 assistant 消息，需在工具结果之前追加到消息列表"""
+        return {
+            "role": "assistant",
+            "content": message.content or "",
+            "tool_calls": [c.model_dump(exclude_none=True) for c in tool_calls]
+        }
+
+    def _invoke(self, tool_call: ChatCompletionMessageFunctionToolCall) -> str:
+        func_name = tool_call.function.name
+        func = self._tools.get(func_name)
+        if func is None:
+            return f"函数 {func_name} 不存在，请不要调用未提供的函数。"
+        try:
+            func_args = json.loads(tool_call.function.arguments or "{}")
+        except ValueError:
+            func_args = None
+        if not isinstance(func_args, dict):
+            return f"调用函数 {func_name} 失败，请直接告诉用户你无法完成这一操作。"
+        try:
+            func_out = str(func(**func_args))
+        except Exception as e:
+            return f"调用函数 {func_name} 出错: {e}，请直接告诉用户你无法完成这一操作。"
+        return func_out + f"\n**禁止继续调用该函数。明确执行函数 {func_name} 的要求**"
+
+    @staticmethod
+    def _tool_message(tool_call: ChatCompletionMessageFunctionToolCall, content: str) -> dict:
+        return {
+            "role": "tool",
+            "content": content,
+            "tool_call_id": tool_call.id
+        }
+
+    @staticmethod
+    def _timeout_content(tool_call: ChatCompletionMessageFunctionToolCall) -> str:
+        return f"调用函数 {tool_call.function.name} 超时，请直接告诉用户你暂时无法完成这一操作。"
+
+    def run(self, tool_calls: list[ChatCompletionMessageFunctionToolCall]) -> list[dict]:
+        """并发执行一轮工具调用，按调用顺序返回 tool 消息"""
+        self.rounds += 1
+        pool = self._get_pool()
+        futures = [pool.submit(self._invoke, c) for c in tool_calls]
+        concurrent.futures.wait(futures, timeout=self.budget.tool_timeout)
+        return [
+            self._tool_message(c, f.result() if f.done() else self._timeout_content(c))
+            for c, f in zip(tool_calls, futures)
+        ]
+
+    async def run_async(self, tool_calls: list[ChatCompletionMessageFunctionToolCall]) -> list[dict]:
+        """`run` 的异步版本，工具函数在线程池中执行，不阻塞事件循环"""
+        self.rounds += 1
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+
+        async def invoke(tool_call: ChatCompletionMessageFunctionToolCall) -> dict:
+            try:
+                content = await asyncio.wait_for(loop.run_in_executor(pool, self._invoke, tool_call), self.budget.tool_timeout)
+            except asyncio.TimeoutError:
+                content = self._timeout_content(tool_call)
+            return self._tool_message(tool_call, content)
+
+        return list(await asyncio.gather(*(invoke(c) for c in tool_calls)))
@@ -11,11 +11,57 @@ class SiriusChatCoreConfig:
             "ChatModel": {"VolcengineArk": "deepseek-v3-1-250821"},
             "MemoticonModel": {"SiliconFlow": "Pro/Qwen/Qwen2.5-VL-7B-Instruct"},
             "SummaryModel": {"VolcengineArk": "deepseek-v3-1-250821"}
+        },
+        # model_selection 中每个角色可配置多个平台，按顺序作为主平台与备用平台
+        "resilience": {
+            "max_attempts": 3,  # 单个平台上的最多尝试次数
+            "base_delay": 0.5,  # 重试退避基数（秒）
+            "max_delay": 8,  # 重试退避上限（秒）
+            "deadline": 60,  # 单个平台上包括重试在内的总耗时预算（秒）
+            "failure_threshold": 5,  # 连续失败多少次后熔断
+            "recovery_timeout": 30  # 熔断持续秒数
+        },
+        "concurrency": {
+            "initial_limit": 4,  # 每个平台的初始并发上限，之后按 429 反馈自动调整
+            "min_limit": 1,
+            "max_limit": 32,
+            "tpm": {}  # 各平台每分钟 token 配额，如 {"SiliconFlow": 100000}，未配置的平台不限
+        },
+        "tools": {
+            "max_rounds": 4,  # 一次回复中最多执行几轮工具调用
+            "max_tokens": 16000,  # 追加工具结果后请求的估算 token 数上限
+            "tool_timeout": 10  # 单轮工具调用的超时秒数
+        },
+        "routing": {
+            "balance": True,  # 按延迟与失败率选择平台，False 时按配置顺序
+            "explore_ratio": 0.05,  # 随机选择平台以更新统计的概率
+            "hedge": False,  # 首选平台过慢时向次优平台发送对冲请求，会增加调用量
+            "hedge_percentile": 0.9,  # 超过首选平台耗时的该分位数后对冲
+            "hedge_min_delay": 2.0  # 对冲前的最短等待秒数
         }
     }
     chat_settings = {
         "filter_mode": False,
-        "private_chat_mode": True
+        "private_chat_mode": True,
+        "streaming_mode": False
+    }
+    send_rate_limit = {
+        "enabled": True,
+        "global_rate": 2.0,  # 全局每秒补充的发送令牌数
+        "global_burst": 5,  # 全局突发上限
+        "source_rate": 0.5,  # 每个群/私聊每秒补充的发送令牌数
+        "source_burst": 3,  # 每个群/私聊的突发上限
+        "priority_reserve": 1  # 全局令牌中只留给优先消息（@机器人、私聊）的数量
+    }
+    member_cache = {
+        "ttl": 600,  # 群成员信息缓存秒数
+        "negative_ttl": 60,  # 查询不到的成员的缓存秒数
+        "friend_ttl": 300  # 好友列表缓存秒数
+    }
+    filter_cache = {
+        "ttl": 86400,  # 审查结果缓存秒数
+        "maxsize": 4096,  # 内存中最多缓存的条数
+        "persist": True  # 是否同时保存到工作目录下的 SQLite 文件，重启后仍可命中
     }
     simulate_someone = {
         "enabled": False,
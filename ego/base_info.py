@@ -3,6 +3,8 @@ from pathlib import Path
 from typing import Optional
 import yaml
 
+from ..utils import KeywordMatcher
+
 
 @dataclass
 class BotBaseInfo:
@@ -39,6 +41,7 @@ class BotBaseInfo:
         
         self._work_path = work_path
         self._config_path = work_path / "BotBaseInfo.yaml"
+        self.version = 0  # 每次加载或修改人格信息后递增，用于失效已渲染的提示词
         
         # 生成配置文件（如果不存在）
         self._generate_config()
@@ -50,6 +53,8 @@ class BotBaseInfo:
         if someone:
             self._load_someone_style(someone)
 
+        self._build_mention_matcher()
+
     def _generate_config(self):
         """生成默认配置文件（如果不存在）"""
         if self._config_path.exists():
@@ -85,6 +90,7 @@ class BotBaseInfo:
             for key, value in config.items():
                 if hasattr(self, key):
                     setattr(self, key, value)
+        self.version += 1
 
     def _load_someone_style(self, someone: str):
         """从 simulate_someone 目录加载特定人的聊天风格"""
@@ -92,6 +98,7 @@ class BotBaseInfo:
         try:
             with open(someone_file, "r", encoding="utf-8") as f:
                 self.chat_style = f.read().splitlines()
+            self.version += 1
         except Exception as e:
             raise Exception(f"无法加载名为 {someone} 的信息文件，请确保该文件存在且格式正确。原因: {e}")
 
@@ -116,15 +123,13 @@ class BotBaseInfo:
     def reload_config(self):
         """重新加载配置文件"""
         self._load_config()
+        self._build_mention_matcher()
+
+    def _build_mention_matcher(self):
+        """根据名字与别名构建提及匹配器"""
+        patterns = [self.name, *self.alias] if self.alias else []
+        self._mention_matcher = KeywordMatcher(patterns, ignore_case=True)
 
     def is_mentioned(self, message: str) -> bool:
         """检查消息中是否提及了机器人"""
-        message = message.lower()
-        if not self.alias:
-            return False
-        if self.name.lower() in message:
-            return True
-        for nickname in self.alias:
-            if nickname.lower() in message:
-                return True
-        return False
\ No newline at end of file
+        return self._mention_matcher.contains_any(message)
\ No newline at end of file
@@ -1,18 +1,18 @@
-import base64
+import asyncio
 import threading
 from ncatbot.plugin_system import NcatBotPlugin, NcatBotEvent, on_message, on_notice
 from ncatbot.core import BaseMessageEvent, GroupMessageEvent, PrivateMessageEvent, NoticeEvent
 from ncatbot.core.event import At, AtAll, PlainText, Face, Image, MessageArray
-from ncatbot.utils import get_log, status
-import requests
+from ncatbot.utils import get_log
 from pathlib import Path
 
 from .config import SiriusChatCoreConfig
 from .ego import BotBaseInfo
 from .organs import TalkSystem, MemoticonSystem, MemorySystem
-from .models import ChatModel, FilterModel, MemoticonModel
-from .api_platforms import PLATFORMNAMEMAP
-from .message import MessageUnit
+from .models import ChatModel, FilterModel, MemoticonModel, SummaryModel, VerdictCache
+from .api_platforms import PLATFORMNAMEMAP, ClientPool, ModelPlatform, RetryPolicy, ToolBudget
+from .message import MessageUnit, MessageSender, MemberDirectory
+from .utils import LoopBridge
 
 class SiriusChatCore(NcatBotPlugin):
     name = "SiriusChatCore"
@@ -23,17 +23,38 @@ class SiriusChatCore(NcatBotPlugin):
     model_initialize = False
 
     async def on_load(self):
+        # 后台线程与事件循环中的异步发送都提交回插件主事件循环执行
+        LoopBridge.bind(asyncio.get_running_loop())
         self.plugin_config_register()
         self.plugin_init()
         # 启动模型初始化线程，保证原始on_load轻量化
         threading.Thread(target=self.model_init).start()
 
     async def on_reload(self) -> None:
-        pass
+        if not self.model_initialize:
+            return
+        # 重新读取各系统的 YAML 配置，依赖配置构建的状态（如关键词匹配器）随之重建
+        await asyncio.to_thread(self._reload_systems)
+
+    def _reload_systems(self):
+        for system in (self.talk_system, self.memoticon_system, self.memory_system):
+            system.reload_config()
+        self.log.info("各系统配置已重新加载。")
 
     async def on_close(self) -> None:
         self.talk_system.dispose()
+        self.memoticon_system.dispose()
+        self.memory_system.dispose()
+        ClientPool.close()
+        LoopBridge.unbind()
     
+    def metrics(self) -> dict:
+        """运行统计：审查初筛与合并审查、出站限速；模型尚未初始化时只有出站限速"""
+        metrics = {"send_rate_limit": MessageSender.rate_limit_metrics()}
+        if self.model_initialize:
+            metrics["moderation"] = self.talk_system.moderation_metrics()
+        return metrics
+
     @on_notice
     async def handle_notice(self, event: NoticeEvent):
         if not self.model_initialize:
@@ -45,17 +66,19 @@ class SiriusChatCore(NcatBotPlugin):
                 return  # 不是戳我，忽略
             if event.group_id is None:
                 source = f"P{event.user_id}"
-                friends = status.global_api.get_friend_list_sync()
-                current_friend = next((f for f in friends if f["user_id"] == event.user_id), None)
+                current_friend = await self.member_directory.get_friend(event.user_id)
                 if current_friend:
-                    user_nickname = current_friend["nickname"]
+                    user_nickname = current_friend.nickname
                     user_card = None
                 else:
                     return # 只回复好友的戳一戳
             else:
                 source = f"G{event.group_id}"
-                user_nickname = status.global_api.get_group_member_info_sync(event.group_id, event.user_id).nickname
-                user_card = status.global_api.get_group_member_info_sync(event.group_id, event.user_id).card
+                member = await self.member_directory.get_member(event.group_id, event.user_id)
+                if member is None:
+                    return # 查询不到成员信息，忽略
+                user_nickname = member.nickname
+                user_card = member.card
             self.log.info(f"收到戳一戳，来源: {source}, 用户ID: {event.user_id}")
             mu = MessageUnit(
                 user_nickname=user_nickname,
@@ -94,18 +117,21 @@ class SiriusChatCore(NcatBotPlugin):
         if len(imgs) == 1:
             img = imgs[0]
             if img.is_animated_image():
-                response = requests.get(img.url)
-                response.raise_for_status()
-                img_base64 = base64.b64encode(response.content).decode("utf-8")
-                self.memoticon_system.judge_meme(img_base64)
-                return  # 学习完直接跑路，不回复
+                self.memoticon_system.ingest(img.url, img.file)
+                return  # 交给后台学习，不回复
         # ======== 构造 MessageUnit 并交给 TalkSystem ========
+        at_ids = [seg.qq for seg in event.message if isinstance(seg, At)]
+        at_nicknames: dict = {}
+        if at_ids:
+            if not isinstance(event, GroupMessageEvent): # 该死的Pylance
+                raise ValueError("你的意思是你在私聊收到了@消息吗？这不应该发生啊？！")
+            # 所有@的成员并发查询，耗时与@的人数无关
+            members = await self.member_directory.get_members(event.group_id, at_ids)
+            at_nicknames = {qq: member.nickname if member else str(qq) for qq, member in zip(at_ids, members)}
         message = ""
         for seg in event.message:
             if isinstance(seg, At):
-                if not isinstance(event, GroupMessageEvent): # 该死的Pylance
-                    raise ValueError("你的意思是你在私聊收到了@消息吗？这不应该发生啊？！")
-                message += f"@{status.global_api.get_group_member_info_sync(event.group_id, seg.qq).nickname} "
+                message += f"@{at_nicknames[seg.qq]} "
             elif isinstance(seg, AtAll):
                 if not isinstance(event, GroupMessageEvent):
                     raise ValueError("你的意思是你在私聊收到了@消息吗？这不应该发生啊？！")
@@ -143,10 +169,48 @@ class SiriusChatCore(NcatBotPlugin):
     def plugin_init(self):
         """插件本体功能初始化"""
         self.register_handler("SiriusChatCore.chat_functions", self._on_chat_functions)
+        MessageSender.configure_rate_limit(self.config.get("send_rate_limit"))
+        self.member_directory = MemberDirectory(**self.config.get("member_cache", {}), log=self.log)
         self.log.info("开始监听 SiriusChatCore.chat_functions 事件...")
 
+    def _get_platform(self, platform_name: str) -> ModelPlatform:
+        """同名平台只创建一次，同一平台上的模型共享连接池、熔断器与限流器"""
+        platform = self._platforms.get(platform_name)
+        if platform is None:
+            platform = PLATFORMNAMEMAP[platform_name](self.config["model_settings"]["platforms_apikey"][platform_name])
+            resilience = self.config["model_settings"].get("resilience", {})
+            platform.retry_policy = RetryPolicy(
+                max_attempts=resilience.get("max_attempts", 3),
+                base_delay=resilience.get("base_delay", 0.5),
+                max_delay=resilience.get("max_delay", 8),
+                deadline=resilience.get("deadline", 60)
+            )
+            platform.breaker.failure_threshold = resilience.get("failure_threshold", 5)
+            platform.breaker.recovery_timeout = resilience.get("recovery_timeout", 30)
+            tools = self.config["model_settings"].get("tools", {})
+            platform.tool_budget = ToolBudget(
+                max_rounds=tools.get("max_rounds", 4),
+                max_tokens=tools.get("max_tokens", 16000),
+                tool_timeout=tools.get("tool_timeout", 10)
+            )
+            concurrency = self.config["model_settings"].get("concurrency", {})
+            platform.limiter.configure(
+                initial_limit=concurrency.get("initial_limit", 4),
+                min_limit=concurrency.get("min_limit", 1),
+                max_limit=concurrency.get("max_limit", 32),
+                tpm=concurrency.get("tpm", {}).get(platform_name, 0)
+            )
+            self._platforms[platform_name] = platform
+        return platform
+
+    def _get_endpoints(self, role: str) -> list[tuple[ModelPlatform, str]]:
+        """按配置顺序返回某个模型角色的所有 (平台, 模型名)"""
+        return [(self._get_platform(platform_name), model_name)
+                for platform_name, model_name in self.config["model_settings"]["model_selection"][role].items()]
+
     def model_init(self):
         """模型初始化"""
+        self._platforms: dict[str, ModelPlatform] = {}
         # ======== bot人格初始化 ========
         Path(self.workspace / "simulate_someone").mkdir(parents=True, exist_ok=True)
         if self.config["simulate_someone"]["enabled"]:
@@ -159,38 +223,59 @@ class SiriusChatCore(NcatBotPlugin):
         else:
             self._bot_info = BotBaseInfo(self.workspace)
         # ======== Chat Model 初始化 ========
-        platform_name, model_name = next(iter(self.config["model_settings"]["model_selection"]["ChatModel"].items()))
+        (platform, model_name), *fallbacks = self._get_endpoints("ChatModel")
         chat_model = ChatModel(
             model_name=model_name,
-            platform=PLATFORMNAMEMAP[platform_name](self.config["model_settings"]["platforms_apikey"][platform_name]),
-            bot_info=self._bot_info
+            platform=platform,
+            bot_info=self._bot_info,
+            enable_streaming=self.config["chat_settings"].get("streaming_mode", False)
         )
+        for platform, model_name in fallbacks:
+            chat_model.add_fallback(platform, model_name)
         # ======== Filter Model 初始化 ========
-        platform_name, model_name = next(iter(self.config["model_settings"]["model_selection"]["FilterModel"].items()))
         if self.config["chat_settings"]["filter_mode"]:
+            (platform, model_name), *fallbacks = self._get_endpoints("FilterModel")
+            cache_settings = self.config.get("filter_cache", {})
             filter_model = FilterModel(
                 model_name=model_name,
-                platform=PLATFORMNAMEMAP[platform_name](self.config["model_settings"]["platforms_apikey"][platform_name]),
+                platform=platform,
+                cache=VerdictCache(
+                    ttl=cache_settings.get("ttl", 86400),
+                    maxsize=cache_settings.get("maxsize", 4096),
+                    db_path=self.workspace / "filter_cache.db" if cache_settings.get("persist", True) else None,
+                    namespace=FilterModel.cache_namespace()
+                )
             )
+            for platform, model_name in fallbacks:
+                filter_model.add_fallback(platform, model_name)
         else:
             filter_model = None
         # ======== Memoticon Model 初始化 ========
-        platform_name, model_name = next(iter(self.config["model_settings"]["model_selection"]["MemoticonModel"].items()))
+        (platform, model_name), *fallbacks = self._get_endpoints("MemoticonModel")
         memoticon_model = MemoticonModel(
             model_name=model_name,
-            platform=PLATFORMNAMEMAP[platform_name](self.config["model_settings"]["platforms_apikey"][platform_name])
+            platform=platform
         )
+        for platform, model_name in fallbacks:
+            memoticon_model.add_fallback(platform, model_name)
         # ======== Summary Model 初始化 ========
-        platform_name, model_name = next(iter(self.config["model_settings"]["model_selection"]["SummaryModel"].items()))
-        summary_model = None
-        # summary_model = SummaryModel(
-        #     model_name=model_name,
-        #     platform=PLATFORMNAMEMAP[platform_name](self.config["model_settings"]["platforms_apikey"][platform_name])
-        # )
+        (platform, model_name), *fallbacks = self._get_endpoints("SummaryModel")
+        summary_model = SummaryModel(
+            model_name=model_name,
+            platform=platform
+        )
+        for platform, model_name in fallbacks:
+            summary_model.add_fallback(platform, model_name)
+        routing = self.config["model_settings"].get("routing", {})
+        for model in (chat_model, filter_model, memoticon_model, summary_model):
+            if model:
+                model.configure_routing(**routing)
         # ======== 系统初始化 ========
         self.memoticon_system = MemoticonSystem(self.event_bus, self.workspace, memoticon_model)
         self.memory_system = MemorySystem(self.event_bus, self.workspace, summary_model)
         self.talk_system = TalkSystem(self.event_bus, self.workspace, chat_model, self.memoticon_system, self.memory_system, filter_model)
         self.log.info("模型初始化完成.")
+        # 预取已订阅群的成员列表，不阻塞初始化
+        LoopBridge.submit(self.member_directory.prefetch_groups(self.config["subscribed_groups"]))
         self.model_initialize = True
 
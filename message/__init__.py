@@ -1,6 +1,9 @@
 from .message_unit import MessageUnit
 from .message_chain import MessageChain, MessageChainBuilder
 from .chat_request import ChatRequest
+from .send_rate_limiter import SendRateLimiter
 from .message_sender import MessageSender
+from .member_directory import MemberDirectory, MemberInfo
+from .outbound_dispatcher import OutboundDispatcher, OutboundMessage
 
-__all__ = ["MessageUnit", "MessageChain", "MessageChainBuilder", "ChatRequest", "MessageSender"]
\ No newline at end of file
+__all__ = ["MessageUnit", "MessageChain", "MessageChainBuilder", "ChatRequest", "MessageSender", "SendRateLimiter", "MemberDirectory", "MemberInfo", "OutboundDispatcher", "OutboundMessage"]
\ No newline at end of file
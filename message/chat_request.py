@@ -17,6 +17,7 @@ class ChatRequest:
     timestamp: Optional[int] = field(default=0)
     at_bot: Optional[bool] = field(default=False)
     tools: Optional[List[Callable]] = field(default=None, repr=False, compare=False)
+    _tool_map: Optional[Dict[str, Callable]] = field(default=None, init=False, repr=False, compare=False)
 
     def instance_get_tools(self) -> List[Callable]:
         """获取工具函数列表"""
@@ -24,4 +25,10 @@ class ChatRequest:
 
     def instance_get_tool_names(self) -> List[str]:
         """获取工具函数名称列表"""
-        return [f.__name__ for f in self.instance_get_tools()]
\ No newline at end of file
+        return list(self.instance_get_tool_map())
+
+    def instance_get_tool_map(self) -> Dict[str, Callable]:
+        """获取 函数名 -> 工具函数 的索引，首次调用时建立"""
+        if self._tool_map is None:
+            self._tool_map = {f.__name__: f for f in self.instance_get_tools()}
+        return self._tool_map
\ No newline at end of file
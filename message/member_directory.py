@@ -0,0 +1,102 @@
+import asyncio
+from dataclasses import dataclass
+from logging import Logger
+from typing import Iterable, Optional, Union
+from ncatbot.core.api import NapCatAPIError
+from ncatbot.utils import status
+
+from ..utils import AsyncTTLCache
+
+QQId = Union[str, int]
+
+
+@dataclass(slots=True)
+class MemberInfo:
+    """群成员或好友的基本信息"""
+    user_id: str
+    nickname: str
+    card: Optional[str] = None
+
+
+class MemberDirectory:
+    """群成员与好友信息的异步缓存
+
+    说明:
+        - 群成员按 (群号, QQ号) 缓存，接口明确返回失败（不在群内）的成员做负缓存，超时等暂时性错误不缓存；`prefetch_group` 用一次群成员列表请求填充整个群。
+        - 好友列表整体缓存，查询单个好友只做字典查找，不再线性扫描。
+        - 并发的相同查询只发出一次请求；需在插件主事件循环中使用。
+    """
+
+    def __init__(self, ttl: float = 600, negative_ttl: float = 60, friend_ttl: float = 300, log: Optional[Logger] = None):
+        self._log = log
+        self._members: AsyncTTLCache[tuple[int, int], MemberInfo] = AsyncTTLCache(ttl, negative_ttl, maxsize=65536)
+        self._group_lists: AsyncTTLCache[int, bool] = AsyncTTLCache(ttl)
+        self._friends: AsyncTTLCache[str, dict[int, MemberInfo]] = AsyncTTLCache(friend_ttl)
+
+    @staticmethod
+    def _member_from_info(info) -> MemberInfo:
+        return MemberInfo(user_id=str(info.user_id), nickname=info.nickname, card=info.card or None)
+
+    async def get_member(self, group_id: QQId, user_id: QQId) -> Optional[MemberInfo]:
+        """获取群成员信息，不在群内或查询失败时返回 None，查询失败的结果不缓存，下次查询会重试"""
+        key = (int(group_id), int(user_id))
+
+        async def load() -> Optional[MemberInfo]:
+            try:
+                return self._member_from_info(await status.global_api.get_group_member_info(key[0], key[1]))
+            except NapCatAPIError as e:
+                if self._log:
+                    self._log.debug(f"群 {key[0]} 中查询不到成员 {key[1]}: {e}")
+                return None
+
+        try:
+            return await self._members.get(key, load)
+        except Exception as e:
+            if self._log:
+                self._log.warning(f"查询群 {key[0]} 成员 {key[1]} 失败: {e}")
+            return None
+
+    async def get_members(self, group_id: QQId, user_ids: Iterable[QQId]) -> list[Optional[MemberInfo]]:
+        """并发获取多个群成员信息，顺序与 user_ids 一致"""
+        return list(await asyncio.gather(*(self.get_member(group_id, user_id) for user_id in user_ids)))
+
+    async def prefetch_group(self, group_id: QQId) -> bool:
+        """拉取整个群的成员列表写入缓存，返回是否成功"""
+        group_id = int(group_id)
+
+        async def load() -> Optional[bool]:
+            try:
+                member_list = await status.global_api.get_group_member_list(group_id)
+            except Exception as e:
+                if self._log:
+                    self._log.warning(f"拉取群 {group_id} 成员列表失败: {e}")
+                return None
+            for info in member_list.members:
+                self._members.set((group_id, int(info.user_id)), self._member_from_info(info))
+            if self._log:
+                self._log.debug(f"已缓存群 {group_id} 的 {member_list.member_count} 名成员。")
+            return True
+
+        return bool(await self._group_lists.get(group_id, load))
+
+    async def prefetch_groups(self, group_ids: Iterable[QQId]):
+        await asyncio.gather(*(self.prefetch_group(group_id) for group_id in group_ids))
+
+    async def get_friend(self, user_id: QQId) -> Optional[MemberInfo]:
+        """获取好友信息，不是好友时返回 None"""
+
+        async def load() -> Optional[dict[int, MemberInfo]]:
+            friends = await status.global_api.get_friend_list()
+            return {
+                int(f["user_id"]): MemberInfo(user_id=str(f["user_id"]), nickname=f.get("nickname", ""))
+                for f in friends
+            }
+
+        friends = await self._friends.get("all", load)
+        return friends.get(int(user_id)) if friends else None
+
+    def invalidate_member(self, group_id: QQId, user_id: QQId):
+        self._members.invalidate((int(group_id), int(user_id)))
+
+    def invalidate_friends(self):
+        self._friends.clear()
@@ -1,8 +1,26 @@
+import base64
 from dataclasses import dataclass, field
-from typing import Optional, List, Dict, Any, Iterable
+from typing import Optional, List, Dict, Any, Iterable, Union
 from .message_unit import MessageUnit
 
 MessageDict = Dict[str, Any]
+ImageBytes = Union[bytes, bytearray, memoryview]
+
+_IMAGE_SIGNATURES = (
+    (b"GIF8", "image/gif"),
+    (b"\x89PNG", "image/png"),
+)
+
+
+def _guess_image_mime(img_bytes: ImageBytes) -> str:
+    head = bytes(img_bytes[:12])
+    for signature, mime in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    # RIFF 容器还可能是 WAV、AVI 等，需再核对第 8-12 字节
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
 
 @dataclass(slots=True)
 class MessageChain:
@@ -68,16 +86,24 @@ class MessageChainBuilder:
         if len(self._messages) > 1 and self._messages[-1]["role"] == role:
             raise ValueError(f"{role} 消息不能连续发送")
 
-    def add_user_message(self, content: Optional[str], img_base64: Optional[str] = None) -> "MessageChainBuilder":
+    def add_user_message(self, content: Optional[str], img_base64: Optional[str] = None, img_bytes: Optional[ImageBytes] = None) -> "MessageChainBuilder":
+        """添加用户消息，图片可传入已编码的 img_base64，或原始字节 img_bytes（仅在此处编码一次）"""
         if not self._messages:
             raise ValueError("请先创建 system 消息")
         self._ensure_not_consecutive("user")
-        if img_base64:
+        if img_bytes is not None:
+            mime = _guess_image_mime(img_bytes)
+            img_url = f"data:{mime};base64,{base64.b64encode(img_bytes).decode('ascii')}"
+        elif img_base64:
+            img_url = f"data:image/jpeg;base64,{img_base64}"
+        else:
+            img_url = None
+        if img_url:
             payload: List[Dict[str, Any]] = [
                 {
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/jpeg;base64,{img_base64}",
+                        "url": img_url,
                         "detail": "low",
                     },
                 }
@@ -88,7 +114,29 @@ class MessageChainBuilder:
         elif content:
             self._messages.append({"role": "user", "content": content})
         else:
-            raise ValueError("必须提供 content 或 img_base64 其中之一")
+            raise ValueError("必须提供 content、img_base64 或 img_bytes 其中之一")
+        return self
+
+    def add_user_images(self, content: Optional[str], images: List[ImageBytes]) -> "MessageChainBuilder":
+        """添加包含多张图片的用户消息，图片按传入顺序排列，文本放在最后"""
+        if not self._messages:
+            raise ValueError("请先创建 system 消息")
+        if not images:
+            raise ValueError("images 不能为空")
+        self._ensure_not_consecutive("user")
+        payload: List[Dict[str, Any]] = [
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:{_guess_image_mime(img)};base64,{base64.b64encode(img).decode('ascii')}",
+                    "detail": "low",
+                },
+            }
+            for img in images
+        ]
+        if content:
+            payload.append({"type": "text", "text": content})
+        self._messages.append({"role": "user", "content": payload})
         return self
 
     def add_user_message_by_units(self, message_units: List[MessageUnit]) -> "MessageChainBuilder":
@@ -2,16 +2,47 @@ from typing import Optional
 from ncatbot.utils import status
 from ncatbot.core.event import MessageArray
 
+from .send_rate_limiter import SendRateLimiter
+
 class MessageSender:
+    _rate_limiter: Optional[SendRateLimiter] = None
+
+    @staticmethod
+    def configure_rate_limit(settings: Optional[dict]):
+        """按插件配置 send_rate_limit 启用或关闭出站限速"""
+        if not settings or not settings.get("enabled", False):
+            MessageSender._rate_limiter = None
+            return
+        MessageSender._rate_limiter = SendRateLimiter(
+            global_rate=settings.get("global_rate", 2.0),
+            global_burst=settings.get("global_burst", 5),
+            source_rate=settings.get("source_rate", 0.5),
+            source_burst=settings.get("source_burst", 3),
+            priority_reserve=settings.get("priority_reserve", 1)
+        )
+
+    @staticmethod
+    def rate_limit_metrics() -> dict:
+        """出站限速的排队与等待统计，未启用限速时为空"""
+        return MessageSender._rate_limiter.metrics() if MessageSender._rate_limiter else {}
+
+    @staticmethod
+    async def wait_rate_limit(source: str, priority: bool = False):
+        """异步等待出站限速令牌，私聊视为优先消息；未启用限速时立即返回"""
+        if MessageSender._rate_limiter:
+            await MessageSender._rate_limiter.acquire_async(source, priority or source.startswith("P"))
+
     @staticmethod
     async def send_message_to_source(source: str, 
                                      text: Optional[str] = None, 
                                      at: Optional[str] = None, 
                                      reply: Optional[str] = None, 
                                      image: Optional[str] = None, 
-                                     rtf: Optional[MessageArray] = None
+                                     rtf: Optional[MessageArray] = None,
+                                     priority: bool = False
                                      ):
-        """通过source发送消息到指定位置"""
+        """通过source发送消息到指定位置，priority 为 True 或私聊时走优先通道"""
+        await MessageSender.wait_rate_limit(source, priority)
         if source.startswith("G"):
             await status.global_api.post_group_msg(source[1:], text, at=at, reply=reply, image=image, rtf=rtf)
         elif source.startswith("P"):
@@ -25,9 +56,13 @@ class MessageSender:
                                      at: Optional[str] = None, 
                                      reply: Optional[str] = None, 
                                      image: Optional[str] = None, 
-                                     rtf: Optional[MessageArray] = None
+                                     rtf: Optional[MessageArray] = None,
+                                     priority: bool = False,
+                                     rate_limit: bool = True
                                      ):
-        """通过source发送消息到指定位置（同步版）"""
+        """通过source发送消息到指定位置（同步版），已通过 `wait_rate_limit` 取得令牌时 rate_limit 传 False"""
+        if rate_limit and MessageSender._rate_limiter:
+            MessageSender._rate_limiter.acquire(source, priority or source.startswith("P"))
         if source.startswith("G"):
             status.global_api.post_group_msg_sync(source[1:], text, at=at, reply=reply, image=image, rtf=rtf)
         elif source.startswith("P"):
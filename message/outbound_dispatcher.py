@@ -0,0 +1,226 @@
+import asyncio
+import heapq
+import itertools
+from collections import deque
+from dataclasses import dataclass, field
+from logging import Logger
+from typing import Callable, Dict, Optional
+
+from .message_sender import MessageSender
+from ..utils import AsyncLoopThread, LoopBridge
+
+
+@dataclass(slots=True)
+class OutboundMessage:
+    """待发送的消息
+
+    send_at: 计划发送时间（事件循环时钟，秒）
+    duration: 发送后该来源需要空出的时间，用于模拟打字
+    generation: 产生该消息的对话批次，用于取消过时的回复
+    priority: 是否走出站限速的优先通道
+    on_sent: 实际发出后的回调，在事件循环线程中执行
+    """
+    source: str
+    text: Optional[str] = None
+    image: Optional[str] = None
+    send_at: float = 0.0
+    duration: float = 0.0
+    generation: int = 0
+    priority: bool = False
+    cancelled: bool = False
+    on_sent: Optional[Callable[["OutboundMessage"], None]] = field(default=None, repr=False)
+
+
+@dataclass(slots=True)
+class _SourceOutbox:
+    """单个来源的发送状态。
+
+    pending: 尚未开始发送的消息，按发送顺序排列
+    ready: 已到发送时间、等待发送的消息
+    free_at: 该来源下一条消息最早的发送时间
+    sent_free_at: 已发出的最后一条消息结束打字的时间
+    sending: 是否有发送协程正在处理该来源
+    """
+    pending: deque = field(default_factory=deque)
+    ready: deque = field(default_factory=deque)
+    free_at: float = 0.0
+    sent_free_at: float = 0.0
+    sending: bool = False
+
+
+class OutboundDispatcher:
+    """出站消息调度器
+
+    说明:
+        - 消息入队时按打字速度计算发送时间，由一个协程按最小堆依次放行，等待期间不占用任何 worker。
+        - 同一来源的消息严格按入队顺序发送，前一条发出后需经过其打字时长才会发送下一条。
+        - `cancel` 可取消某来源尚未发出的消息，例如新消息到达后旧回复已经过时。
+        - 消息经 `LoopBridge` 在插件主事件循环中发送，不占用线程池。
+        - 除 `start` 与 `dispose` 外，方法需在 `loop_thread` 的事件循环中调用。
+    """
+
+    def __init__(self,
+                 loop_thread: AsyncLoopThread,
+                 typing_speed: float = 5.0,
+                 log: Optional[Logger] = None):
+        self._loop_thread = loop_thread
+        self.typing_speed = typing_speed
+        self._log = log
+        self._heap: list[tuple[float, int, OutboundMessage]] = []
+        self._seq = itertools.count()
+        self._outboxes: Dict[str, _SourceOutbox] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def start(self):
+        self._loop_thread.submit(self._start()).result(timeout=5)
+
+    def dispose(self):
+        """停止调度并丢弃未发送的消息"""
+        if self._loop_thread.loop.is_closed():
+            return
+        self._loop_thread.submit(self._dispose()).result(timeout=5)
+
+    async def _start(self):
+        self._wakeup = asyncio.Event()
+        self._spawn(self._dispatch())
+
+    async def _dispose(self):
+        dropped = sum(len(outbox.pending) for outbox in self._outboxes.values())
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._heap.clear()
+        self._outboxes.clear()
+        if dropped and self._log:
+            self._log.info(f"丢弃 {dropped} 条未发送的消息。")
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def typing_duration(self, text: Optional[str]) -> float:
+        if not text or self.typing_speed <= 0:
+            return 0.0
+        return len(text) / self.typing_speed
+
+    def enqueue(self,
+                source: str,
+                text: Optional[str] = None,
+                image: Optional[str] = None,
+                typing: bool = True,
+                generation: int = 0,
+                priority: bool = False,
+                on_sent: Optional[Callable[[OutboundMessage], None]] = None) -> OutboundMessage:
+        """加入发送队列，typing 为 False 时发送后不占用打字时间"""
+        now = asyncio.get_running_loop().time()
+        outbox = self._outboxes.get(source)
+        if outbox is None:
+            outbox = self._outboxes[source] = _SourceOutbox()
+        message = OutboundMessage(
+            source=source,
+            text=text,
+            image=image,
+            send_at=max(now, outbox.free_at),
+            duration=self.typing_duration(text) if typing else 0.0,
+            generation=generation,
+            priority=priority,
+            on_sent=on_sent
+        )
+        outbox.free_at = message.send_at + message.duration
+        outbox.pending.append(message)
+        heapq.heappush(self._heap, (message.send_at, next(self._seq), message))
+        if self._wakeup:
+            self._wakeup.set()
+        return message
+
+    def cancel(self, source: str, before_generation: Optional[int] = None) -> int:
+        """取消来源尚未发出的消息，指定 before_generation 时只取消更早批次的消息，返回取消的条数"""
+        outbox = self._outboxes.get(source)
+        if outbox is None:
+            return 0
+        kept: deque = deque()
+        cancelled = 0
+        for message in outbox.pending:
+            if before_generation is None or message.generation < before_generation:
+                message.cancelled = True
+                cancelled += 1
+            else:
+                kept.append(message)
+        if cancelled:
+            outbox.pending = kept
+            outbox.free_at = max(
+                [outbox.sent_free_at] + [m.send_at + m.duration for m in kept]
+            )
+        return cancelled
+
+    def pending_count(self, source: Optional[str] = None) -> int:
+        if source is not None:
+            outbox = self._outboxes.get(source)
+            return len(outbox.pending) if outbox else 0
+        return sum(len(outbox.pending) for outbox in self._outboxes.values())
+
+    async def _dispatch(self):
+        assert self._wakeup is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            send_at, _, message = self._heap[0]
+            delay = send_at - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            if message.cancelled:
+                continue
+            outbox = self._outboxes.get(message.source)
+            if outbox is None:
+                continue
+            outbox.ready.append(message)
+            if not outbox.sending:
+                outbox.sending = True
+                self._spawn(self._drain(message.source, outbox))
+
+    async def _drain(self, source: str, outbox: _SourceOutbox):
+        """依次发送来源已就绪的消息，发送耗时不阻塞其它来源"""
+        loop = asyncio.get_running_loop()
+        try:
+            while outbox.ready:
+                message: OutboundMessage = outbox.ready.popleft()
+                if message.cancelled:
+                    continue
+                # 发送本身可能耗时，保证与上一条之间仍留有打字时间
+                wait = outbox.sent_free_at - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    if message.cancelled:
+                        continue
+                # 开始发送后不再可取消
+                if outbox.pending and outbox.pending[0] is message:
+                    outbox.pending.popleft()
+                try:
+                    await LoopBridge.run_async(MessageSender.send_message_to_source(source, message.text, image=message.image, priority=message.priority))
+                except Exception as e:
+                    if self._log:
+                        self._log.error(f"向 {source} 发送消息失败: {e}")
+                else:
+                    if message.on_sent:
+                        message.on_sent(message)
+                finally:
+                    outbox.sent_free_at = loop.time() + message.duration
+        finally:
+            outbox.sending = False
+        if not outbox.pending and self._outboxes.get(source) is outbox:
+            # 打字时间结束后回收空闲来源
+            loop.call_at(max(outbox.free_at, outbox.sent_free_at), self._reap, source, outbox)
+
+    def _reap(self, source: str, outbox: _SourceOutbox):
+        if self._outboxes.get(source) is outbox and not outbox.pending and not outbox.sending:
+            del self._outboxes[source]
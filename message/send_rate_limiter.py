@@ -0,0 +1,210 @@
+import asyncio
+import threading
+import time
+from collections import Counter, deque
+from typing import Callable, Optional
+
+from ..utils import TokenBucket
+
+
+class _Waiter:
+    __slots__ = ("source", "priority", "wake", "granted")
+
+    def __init__(self, source: str, priority: bool, wake: Callable[[], None]):
+        self.source = source
+        self.priority = priority
+        self.wake = wake
+        self.granted = False
+
+
+class SendRateLimiter:
+    """出站消息限速器，全局与每个来源各有一个令牌桶
+
+    说明:
+        - 一条消息需要同时从全局桶与来源桶各取得一个令牌才能发送。
+        - 普通消息取令牌后全局桶至少要剩下 `priority_reserve` 个令牌，这部分只留给优先消息（@机器人、私聊），
+          因此大量群消息排队时优先消息仍能很快发出。
+        - 等待者按到达顺序排在同一个队列中，令牌补充后按队列顺序直接交给排在前面的等待者：
+          同一来源的消息不会互相插队，普通消息也不会越过排在前面、因预留额度而等待的普通消息；
+          只有来源桶不同或优先级不同的等待者才会被先放行。
+        - 队首需要等待时只设置一个定时器，到期后重新分配，不再由每个等待者轮询。
+        - 同步与异步调用共用同一个队列，`acquire` 会阻塞当前线程，`acquire_async` 只挂起当前协程。
+    """
+
+    _PRUNE_INTERVAL = 256
+
+    def __init__(self,
+                 global_rate: float = 2.0,
+                 global_burst: int = 5,
+                 source_rate: float = 0.5,
+                 source_burst: int = 3,
+                 priority_reserve: int = 1):
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_rate, global_burst)
+        self._source_rate = source_rate
+        self._source_burst = source_burst
+        self._priority_reserve = max(0, min(priority_reserve, global_burst - 1))
+        self._sources: dict[str, TokenBucket] = {}
+        self._queue: deque[_Waiter] = deque()
+        self._timer: Optional[threading.Timer] = None
+        self._timer_due = 0.0
+        self._acquired = 0
+        self._delayed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _bucket(self, source: str, now: float) -> TokenBucket:
+        bucket = self._sources.get(source)
+        if bucket is None:
+            bucket = self._sources[source] = TokenBucket(self._source_rate, self._source_burst, now)
+        return bucket
+
+    def _grant_locked(self):
+        """按队列顺序把令牌交给等待者，仍有人等待时按最近的可放行时间设置定时器，需持有锁"""
+        now = time.monotonic()
+        blocked: set[str] = set()
+        normal_blocked = False
+        delay: Optional[float] = None
+        for waiter in list(self._queue):
+            if waiter.source in blocked or (normal_blocked and not waiter.priority):
+                blocked.add(waiter.source)
+                continue
+            reserve = 0 if waiter.priority else self._priority_reserve
+            global_wait = self._global.time_until(1 + reserve, now)
+            if global_wait > 0:
+                delay = global_wait if delay is None else min(delay, global_wait)
+                if waiter.priority:
+                    # 优先消息都等不到全局令牌，后面的消息更不可能
+                    break
+                normal_blocked = True
+                blocked.add(waiter.source)
+                continue
+            bucket = self._bucket(waiter.source, now)
+            source_wait = bucket.time_until(1, now)
+            if source_wait > 0:
+                delay = source_wait if delay is None else min(delay, source_wait)
+                blocked.add(waiter.source)
+                continue
+            self._queue.remove(waiter)
+            self._take(bucket, now)
+            waiter.granted = True
+            waiter.wake()
+        if delay is not None:
+            self._schedule(delay, now)
+
+    def _take(self, bucket: TokenBucket, now: float):
+        self._global.take()
+        bucket.take()
+        self._acquired += 1
+        if self._acquired % self._PRUNE_INTERVAL == 0:
+            self._prune(now)
+
+    def _schedule(self, delay: float, now: float):
+        """保证在 delay 秒后重新分配一次，已有更早的定时器时不重复设置"""
+        due = now + delay
+        if self._timer is not None:
+            if self._timer_due <= due:
+                return
+            self._timer.cancel()
+        self._timer_due = due
+        self._timer = threading.Timer(delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._grant_locked()
+
+    def _prune(self, now: float):
+        """回收已回满且没有等待者的来源令牌桶"""
+        waiting = {waiter.source for waiter in self._queue}
+        for source in [s for s, b in self._sources.items() if s not in waiting and b.is_full(now)]:
+            del self._sources[source]
+
+    def _refund(self, source: str):
+        """归还已分配但未使用的令牌，需持有锁"""
+        now = time.monotonic()
+        for bucket in (self._global, self._sources.get(source)):
+            if bucket is not None and not bucket.unlimited:
+                bucket.refill(now)
+                bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+        self._acquired -= 1
+
+    def _enqueue(self, source: str, priority: bool, wake: Callable[[], None]) -> Optional[_Waiter]:
+        """排队等待令牌，无需等待即取得时返回 None"""
+        with self._lock:
+            if not self._queue:
+                now = time.monotonic()
+                bucket = self._bucket(source, now)
+                reserve = 0 if priority else self._priority_reserve
+                if self._global.time_until(1 + reserve, now) <= 0 and bucket.time_until(1, now) <= 0:
+                    self._take(bucket, now)
+                    return None
+            waiter = _Waiter(source, priority, wake)
+            self._queue.append(waiter)
+            self._grant_locked()
+            return None if waiter.granted else waiter
+
+    def _record_wait(self, waited: float):
+        with self._lock:
+            self._delayed += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+
+    def acquire(self, source: str, priority: bool = False) -> float:
+        """阻塞直到可以向 source 发送一条消息，返回等待的秒数"""
+        event = threading.Event()
+        start = time.monotonic()
+        if self._enqueue(source, priority, event.set) is None:
+            return 0.0
+        event.wait()
+        waited = time.monotonic() - start
+        self._record_wait(waited)
+        return waited
+
+    async def acquire_async(self, source: str, priority: bool = False) -> float:
+        """异步等待直到可以向 source 发送一条消息，返回等待的秒数；等待期间被取消时放弃排队或归还已分到的令牌"""
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        start = time.monotonic()
+        waiter = self._enqueue(source, priority, wake)
+        if waiter is None:
+            return 0.0
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    self._refund(source)
+                else:
+                    self._queue.remove(waiter)
+                self._grant_locked()
+            raise
+        waited = time.monotonic() - start
+        self._record_wait(waited)
+        return waited
+
+    def queue_depth(self, source: Optional[str] = None) -> int:
+        """正在等待令牌的消息数"""
+        with self._lock:
+            if source is not None:
+                return sum(1 for waiter in self._queue if waiter.source == source)
+            return len(self._queue)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": len(self._queue),
+                "priority_queue_depth": sum(1 for waiter in self._queue if waiter.priority),
+                "source_queue_depth": dict(Counter(waiter.source for waiter in self._queue)),
+                "acquired": self._acquired,
+                "delayed": self._delayed,
+                "avg_wait": self._total_wait / self._delayed if self._delayed else 0.0,
+                "max_wait": self._max_wait,
+                "tracked_sources": len(self._sources),
+            }
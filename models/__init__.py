@@ -1,6 +1,9 @@
 from .base_model import BaseModel
 from .chat_model import ChatModel
 from .filter_model import FilterModel
+from .filter_batcher import FilterBatcher
 from .memoticon_model import MemoticonModel
+from .summary_model import SummaryModel
+from .verdict_cache import VerdictCache
 
-__all__ = ["BaseModel", "ChatModel", "FilterModel", "MemoticonModel"]
\ No newline at end of file
+__all__ = ["BaseModel", "ChatModel", "FilterModel", "FilterBatcher", "MemoticonModel", "SummaryModel", "VerdictCache"]
\ No newline at end of file
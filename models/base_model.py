@@ -1,13 +1,19 @@
-from typing import Callable
+from typing import AsyncIterator, Callable
 from typing import Any, Optional
 
 from ..errors import ExecuteError
 
-from ..api_platforms import ModelPlatform
+from ..api_platforms import ModelEndpoint, ModelPlatform, PlatformRouter
 from ..message import MessageChain, MessageChainBuilder, ChatRequest
+from ..message.message_chain import ImageBytes
 from ..function_calls import FunctionBuilder
+from ..prompts import PromptManager
+from ..utils import OutputSchema, StructuredOutputError, parse_structured
 
 class BaseModel:
+    # 子类声明输出结构后由 `_process_data` 宽松解析，无法挽救时再发起一次修复请求
+    _output_schema: Optional[OutputSchema] = None
+
     def __init__(self, 
                  system_prompt: str, 
                  model_name: str,
@@ -40,13 +46,14 @@ class BaseModel:
         self._n = n
         self._response_format = response_format
         self._platform = platform
+        self._router = PlatformRouter([ModelEndpoint(platform, model_name)])
 
-    def create_initial_message_chain(self, user_message: Optional[str] = None, img_base64: Optional[str] = None) -> MessageChain:
+    def create_initial_message_chain(self, user_message: Optional[str] = None, img_base64: Optional[str] = None, img_bytes: Optional[ImageBytes] = None) -> MessageChain:
         """创建初始消息链，如果传入其他参数则下一条信息应为助手消息，传入消息作为用户消息"""
         mcb = MessageChainBuilder()
         mcb.create_new_message_chain(self._system_prompt)
-        if user_message or img_base64:
-            mcb.add_user_message(user_message, img_base64)
+        if user_message or img_base64 or img_bytes is not None:
+            mcb.add_user_message(user_message, img_base64, img_bytes)
         return mcb.build()
 
     def add_tool(self, func: Callable, desc: str = ""):
@@ -58,20 +65,94 @@ class BaseModel:
         except Exception as e:
             raise ValueError(f"构建工具失败: {e}")
     
-    def _response(self, chat_request: ChatRequest) -> dict:
-        """发送请求并返回响应结果，得到全部响应结果的内容"""
+    def add_fallback(self, platform: ModelPlatform, model_name: str):
+        """添加备用 平台/模型，前面的平台请求失败时按添加顺序切换"""
+        self._router.add(ModelEndpoint(platform, model_name))
+
+    def configure_routing(self, **options: Any):
+        """配置多平台路由，参数见 PlatformRouter.configure"""
+        self._router.configure(**options)
+
+    def _build_request(self, endpoint: ModelEndpoint, chat_request: ChatRequest, repair: bool = False) -> tuple[dict, Optional[dict]]:
+        """为指定平台构造请求体与 extra_body，每次尝试都重新构造，避免工具调用追加的消息残留"""
         payload = self._build_payload(chat_request.message_chain.to_list())
-        return self._platform.response(payload, self._extra_body, chat_request)
+        if repair:
+            # 修复请求只重排已有输出，不提供工具以免再次执行工具函数，并使用确定性采样
+            payload.pop("tools", None)
+            payload["temperature"] = 0
+        if endpoint.platform is self._platform and endpoint.model_name == self._model_name:
+            return payload, self._extra_body
+        payload["model"] = endpoint.model_name
+        return payload, self._build_extra_body(endpoint.platform)
+
+    def _response(self, chat_request: ChatRequest, repair: bool = False) -> dict:
+        """发送请求并返回响应结果，得到全部响应结果的内容"""
+        def request(endpoint: ModelEndpoint) -> dict:
+            payload, extra_body = self._build_request(endpoint, chat_request, repair)
+            return endpoint.platform.response(payload, extra_body, chat_request)
+        return self._router.call(request)
+
+    async def _response_async(self, chat_request: ChatRequest, repair: bool = False) -> dict:
+        """异步发送请求并返回响应结果"""
+        async def request(endpoint: ModelEndpoint) -> dict:
+            payload, extra_body = self._build_request(endpoint, chat_request, repair)
+            return await endpoint.platform.response_async(payload, extra_body, chat_request)
+        # 工具函数有副作用，使用工具时不对冲
+        return await self._router.call_async(request, hedge=repair or not hasattr(self, "_tools"))
     
+    async def _response_stream_async(self, chat_request: ChatRequest) -> AsyncIterator[str]:
+        """流式发送请求，逐段返回生成的文本"""
+        def request(endpoint: ModelEndpoint) -> AsyncIterator[str]:
+            payload, extra_body = self._build_request(endpoint, chat_request)
+            return endpoint.platform.response_stream_async(payload, extra_body)
+        async for delta in self._router.stream(request):
+            yield delta
+
+    @property
+    def enable_streaming(self) -> bool:
+        """是否启用流式输出，使用 FunctionCall 时不启用"""
+        return self._enable_streaming and not hasattr(self, "_tools")
+
+    @staticmethod
+    def _output_text(model_output: dict) -> str:
+        return model_output["choices"][0]["message"]["content"] or ""
+
     def _process_data(self, model_output: dict) -> dict:
-        """处理响应结果，提取有用信息，需要子类实现"""
-        raise NotImplementedError()
+        """处理响应结果，提取有用信息；声明了 `_output_schema` 时按其解析，否则需要子类实现"""
+        if self._output_schema is None:
+            raise NotImplementedError()
+        return parse_structured(self._output_text(model_output), self._output_schema)
+
+    def _create_repair_request(self, model_output: dict) -> ChatRequest:
+        assert self._output_schema is not None
+        mcb = MessageChainBuilder()
+        mcb.create_new_message_chain(PromptManager.get_json_repair_prompt())
+        mcb.add_user_message(f"字段：{', '.join(self._output_schema.fields)}\n原始输出：\n{self._output_text(model_output)}")
+        return ChatRequest(mcb.build())
 
     def get_process_data(self, chat_request: ChatRequest) -> dict:
         """获取处理后的数据"""
         try:
             model_output = self._response(chat_request)
-            return self._process_data(model_output)
+            try:
+                return self._process_data(model_output)
+            except StructuredOutputError:
+                if self._output_schema is None:
+                    raise
+                return self._process_data(self._response(self._create_repair_request(model_output), repair=True))
+        except Exception as e:
+            raise ExecuteError(f"获取处理后的数据失败: {e}")
+
+    async def get_process_data_async(self, chat_request: ChatRequest) -> dict:
+        """异步获取处理后的数据"""
+        try:
+            model_output = await self._response_async(chat_request)
+            try:
+                return self._process_data(model_output)
+            except StructuredOutputError:
+                if self._output_schema is None:
+                    raise
+                return self._process_data(await self._response_async(self._create_repair_request(model_output), repair=True))
         except Exception as e:
             raise ExecuteError(f"获取处理后的数据失败: {e}")
         
@@ -94,9 +175,10 @@ class BaseModel:
             payload["tools"] = self._tools
         return payload
 
-    def _build_extra_body(self) -> dict[str, Any]:
-        if self._platform.custom_extra_body:
-            return self._platform.custom_extra_body(self)
+    def _build_extra_body(self, platform: Optional[ModelPlatform] = None) -> dict[str, Any]:
+        platform = platform or self._platform
+        if platform.custom_extra_body:
+            return platform.custom_extra_body(self)
         return {
             "thinking": self._enable_thinking,
             "thinking_budget": self._thinking_budget
@@ -1,57 +1,84 @@
-import json
-from typing import Optional, override, Callable
+from typing import Any, AsyncIterator, Optional, override, Callable
 
 from .base_model import BaseModel
 from .filter_model import FilterModel
 from ..api_platforms import ModelPlatform
 from ..prompts import PromptManager
 from ..message import ChatRequest, MessageChainBuilder, MessageChain
+from ..message.message_chain import ImageBytes
+from ..utils import ChatStreamParser, OutputSchema
 
 class ChatModel(BaseModel):
-    def __init__(self, model_name: str, platform: ModelPlatform, bot_info):
+    _output_schema = OutputSchema({"emotion": str, "content": list, "diary": str},
+                                  required=["content"], defaults={"emotion": "平静", "diary": ""})
+
+    def __init__(self, model_name: str, platform: ModelPlatform, bot_info, enable_streaming: bool = False):
         self._init_tools = False
         self._chat_temp: list[dict] = []
         self._bot_info = bot_info
+        self._tools_prompt = ""
         system_prompt = PromptManager.get_chat_prompt(bot_info)
 
-        BaseModel.__init__(self, system_prompt, model_name, platform, temperature=0.7, top_p= 0.9, max_tokens=2048)
+        BaseModel.__init__(self, system_prompt, model_name, platform, temperature=0.7, top_p= 0.9, max_tokens=2048, enable_streaming=enable_streaming)
 
     def init_tools(self, tools: dict[Callable, str]):
         if self._init_tools:
             raise ValueError("工具已经初始化")
         for k,v in tools.items():
             self.add_tool(k, v)
-        self._system_prompt += PromptManager.get_chat_tools_prompt(self._tools)
+        self._tools_prompt = PromptManager.get_chat_tools_prompt(self._tools)
         self._init_tools = True
 
     @override
-    def create_initial_message_chain(self, user_message: Optional[str] = None, img_base64: Optional[str] = None) -> MessageChain:
-        """创建初始消息链，如果传入其他参数则下一条信息应为助手消息，传入消息作为用户消息"""
-        self._system_prompt = PromptManager.get_chat_prompt(self._bot_info)
+    def create_initial_message_chain(self, user_message: Optional[str] = None, img_base64: Optional[str] = None, img_bytes: Optional[ImageBytes] = None) -> MessageChain:
+        """创建初始消息链，如果传入其他参数则下一条信息应为助手消息，传入消息作为用户消息
+
+        系统提示词依次为：缓存的稳定前缀、工具说明、当前时间，易变内容放在最后以命中前缀缓存。
+        """
+        self._system_prompt = PromptManager.get_chat_prompt(self._bot_info) + self._tools_prompt + PromptManager.get_chat_volatile_prompt()
         mcb = MessageChainBuilder()
         mcb.create_new_message_chain(self._system_prompt)
-        if user_message or img_base64:
-            mcb.add_user_message(user_message, img_base64)
+        if user_message or img_base64 or img_bytes is not None:
+            mcb.add_user_message(user_message, img_base64, img_bytes)
         return mcb.build()
 
-    @override
-    def _process_data(self, model_output: dict) -> dict:
-        try:
-            content = json.loads(model_output["choices"][0]["message"]["content"])
-            if isinstance(content, dict):
-                return content
-            raise ValueError("无效的响应格式")
-        except Exception as e:
-            raise ValueError(f"处理数据失败: {e}")
+    def _extract_state(self, processed_data: dict) -> tuple[str, str]:
+        """提取心情与日记，缺失或无效时分别为 平静 与空字符串"""
+        emotion = processed_data.get("emotion")
+        emotion = emotion if emotion in ["喜悦", "愤怒", "悲伤", "厌恶", "平静", "尴尬", "失望", "渴望", "疑惑"] else "平静"
+        daily = processed_data.get("diary") or ""
+        return emotion, daily
 
     def process_func(self, chat_request: ChatRequest, filter: Optional[FilterModel]) -> tuple[dict, dict, str, str]:
         processed_data = self.get_process_data(chat_request)
         validation_data = {}
-        emotion = processed_data["emotion"] if processed_data["emotion"] in ["喜悦", "愤怒", "悲伤", "厌恶", "平静", "尴尬", "失望", "渴望", "疑惑"] else "平静"
-        daily = processed_data["diary"] if "diary" in processed_data else ""
+        emotion, daily = self._extract_state(processed_data)
+        if filter:
+            validation_data = filter.verify(processed_data.get("content", []))
+        return processed_data, validation_data, emotion, daily
+
+    async def process_func_async(self, chat_request: ChatRequest, filter: Optional[FilterModel]) -> tuple[dict, dict, str, str]:
+        processed_data = await self.get_process_data_async(chat_request)
+        validation_data = {}
+        emotion, daily = self._extract_state(processed_data)
         if filter:
-            cr = ChatRequest(filter.create_initial_message_chain(str(processed_data)))
-            validation_data = filter.get_process_data(cr)
+            validation_data = await filter.verify_async(processed_data.get("content", []))
         return processed_data, validation_data, emotion, daily
-        
 
+    async def process_stream_async(self, chat_request: ChatRequest) -> AsyncIterator[tuple[str, Any]]:
+        """流式处理请求
+
+        依次产出:
+            ("content", str): 每个完整的 content 元素
+            ("done", (processed_data, emotion, daily)): 流结束后的完整结果
+        """
+        parser = ChatStreamParser()
+        async for delta in self._response_stream_async(chat_request):
+            for item in parser.feed(delta):
+                yield "content", item
+        processed_data, remaining = parser.close()
+        for item in remaining:
+            yield "content", item
+        processed_data.setdefault("emotion", "平静")
+        emotion, daily = self._extract_state(processed_data)
+        yield "done", (processed_data, emotion, daily)
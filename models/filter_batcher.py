@@ -0,0 +1,89 @@
+import asyncio
+from typing import Optional
+
+from .filter_model import FilterModel
+
+
+class FilterBatcher:
+    """审查请求的跨来源合并器
+
+    说明:
+        - 各来源的待审查内容最多等待 `max_delay` 秒或攒够 `max_items` 条后合并为一次 `FilterModel.verify_async` 请求，
+          结果按 index 切分后分发给各调用者。
+        - 合并后的请求失败时，该批的所有调用者都会收到同一个异常。
+        - 单次内容已不少于 `max_items` 条或 `max_delay` 不大于 0 时直接请求，不参与合并。
+        - 只能在同一个事件循环中使用。
+    """
+
+    def __init__(self, filter: FilterModel, max_delay: float = 0.05, max_items: int = 32):
+        self._filter = filter
+        self.max_delay = max_delay
+        self.max_items = max_items
+        self._pending: list[tuple[list[str], asyncio.Future]] = []
+        self._pending_items = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+        self._batches = 0
+        self._callers = 0
+        self._items = 0
+
+    async def verify(self, contents: list[str]) -> dict:
+        """与 `FilterModel.verify_async` 相同，返回 {"verified": [...]}"""
+        if not contents:
+            return {"verified": []}
+        if self.max_delay <= 0 or len(contents) >= self.max_items:
+            self._record(1, len(contents))
+            return await self._filter.verify_async(contents)
+        if self._pending_items + len(contents) > self.max_items:
+            self._flush()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((contents, future))
+        self._pending_items += len(contents)
+        if self._pending_items >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending, self._pending_items = self._pending, [], 0
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[list[str], asyncio.Future]]):
+        contents = [content for part, _ in batch for content in part]
+        self._record(len(batch), len(contents))
+        try:
+            verified = (await self._filter.verify_async(contents))["verified"]
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        offset = 0
+        for part, future in batch:
+            if not future.done():
+                results = [{**item, "index": i} for i, item in enumerate(verified[offset:offset + len(part)])]
+                future.set_result({"verified": results})
+            offset += len(part)
+
+    def _record(self, callers: int, items: int):
+        self._batches += 1
+        self._callers += callers
+        self._items += items
+
+    def metrics(self) -> dict:
+        """batches 为实际发出的请求数，callers 为合并前的调用次数"""
+        return {
+            "batches": self._batches,
+            "callers": self._callers,
+            "items": self._items,
+            "avg_batch_items": round(self._items / self._batches, 2) if self._batches else 0.0
+        }
@@ -1,27 +1,112 @@
-import json
-from typing import Optional, override
+import asyncio
+import hashlib
+from typing import Any, Optional
 from .base_model import BaseModel
+from .verdict_cache import VerdictCache
 
-from ..errors import ExecuteError
 from ..api_platforms import ModelPlatform
 from ..prompts import PromptManager
+from ..message import ChatRequest
+from ..utils import OutputSchema
+
+# 模型漏掉某一项时的结果，不写入缓存
+_MISSING_VERDICT = {"can_output": False, "reason": "审查结果缺失"}
+
+
+def _as_bool(value: Any) -> bool:
+    """模型可能把布尔值输出为字符串"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes")
+    return bool(value)
+
 
 class FilterModel(BaseModel):
-    def __init__(self, model_name: str, platform: ModelPlatform):
+    _output_schema = OutputSchema({"verified": list}, required=["verified"], list_key="verified")
+
+    def __init__(self, model_name: str, platform: ModelPlatform, cache: Optional[VerdictCache] = None):
         system_prompt = PromptManager.get_filter_prompt()
         super().__init__(system_prompt, model_name, platform, temperature=0.1, max_tokens=2048, enable_thinking=True, thinking_budget=512)
+        self._cache = cache
+
+    @staticmethod
+    def cache_namespace() -> str:
+        """审查提示词的摘要，提示词变化后缓存的审查结果失效"""
+        return hashlib.blake2b(PromptManager.get_filter_prompt().encode(), digest_size=8).hexdigest()
+
+    @property
+    def cache(self) -> Optional[VerdictCache]:
+        return self._cache
+
+
+    def _parse_verdicts(self, data: dict, count: int) -> list[Optional[dict]]:
+        """按 index 把审查结果对齐到输入位置，index 缺失或无效时按顺序对齐，缺少的位置为 None"""
+        verdicts: list[Optional[dict]] = [None] * count
+        for position, item in enumerate(data.get("verified", [])):
+            if not isinstance(item, dict):
+                continue
+            index = item.get("index")
+            if not isinstance(index, int) or not 0 <= index < count or verdicts[index] is not None:
+                index = position
+            if index < count and verdicts[index] is None:
+                verdicts[index] = {"can_output": _as_bool(item.get("can_output", False)), "reason": str(item.get("reason", ""))}
+        return verdicts
+
+    @staticmethod
+    def _assemble(verdicts: list[Optional[dict]]) -> dict:
+        return {"verified": [{"index": i, **(verdict or _MISSING_VERDICT)} for i, verdict in enumerate(verdicts)]}
+
+    def _pending(self, contents: list[str], keys: list[str], found: dict[str, dict]) -> dict[str, str]:
+        """未命中缓存的 键 -> 内容，相同内容只审查一次"""
+        pending: dict[str, str] = {}
+        for content, key in zip(contents, keys):
+            if key not in found and key not in pending:
+                pending[key] = content
+        return pending
+
+    def _request(self, contents: list[str]) -> list[Optional[dict]]:
+        cr = ChatRequest(self.create_initial_message_chain(str({"content": contents})))
+        return self._parse_verdicts(self.get_process_data(cr), len(contents))
+
+    async def _request_async(self, contents: list[str]) -> list[Optional[dict]]:
+        cr = ChatRequest(self.create_initial_message_chain(str({"content": contents})))
+        return self._parse_verdicts(await self.get_process_data_async(cr), len(contents))
+
+    def verify(self, contents: list[str]) -> dict:
+        """审查回复内容列表，返回 {"verified": [...]}，只有未命中缓存的内容会发给模型"""
+        if not contents:
+            return {"verified": []}
+        if self._cache is None:
+            return self._assemble(self._request(contents))
+        keys = [self._cache.key(content) for content in contents]
+        found = self._cache.lookup(keys)
+        found.update(self._cache.lookup_persistent(k for k in set(keys) if k not in found))
+        pending = self._pending(contents, keys, found)
+        self._cache.record(len(contents) - len(pending), len(pending))
+        if pending:
+            fresh = {k: v for k, v in zip(pending, self._request(list(pending.values()))) if v is not None}
+            self._cache.store(fresh)
+            found.update(fresh)
+        return self._assemble([found.get(key) for key in keys])
 
-        
-
-    @override
-    def _process_data(self, model_output : dict) -> dict:
-        reply_msg = model_output["choices"][0]["message"]["content"].replace("```json", "").replace("```", "")
-        try:
-            reply_json = json.loads(reply_msg)
-            if isinstance(reply_json, list):
-                reply_json = {"verified": reply_json}
-            if isinstance(reply_json, dict) and "verified" in reply_json:
-                return reply_json
-            raise ValueError("无效的响应格式")
-        except Exception as e:
-            raise ExecuteError(f"过滤模型返回内容解析失败: {reply_msg}，错误信息: {e}")
+    async def verify_async(self, contents: list[str]) -> dict:
+        """异步审查回复内容列表，返回 {"verified": [...]}，持久层读写在线程中执行"""
+        if not contents:
+            return {"verified": []}
+        if self._cache is None:
+            return self._assemble(await self._request_async(contents))
+        cache = self._cache
+        keys = [cache.key(content) for content in contents]
+        found = cache.lookup(keys)
+        missing = [k for k in set(keys) if k not in found]
+        if missing and cache.persistent:
+            found.update(await asyncio.to_thread(cache.lookup_persistent, missing))
+        pending = self._pending(contents, keys, found)
+        cache.record(len(contents) - len(pending), len(pending))
+        if pending:
+            fresh = {k: v for k, v in zip(pending, await self._request_async(list(pending.values()))) if v is not None}
+            if cache.persistent:
+                await asyncio.to_thread(cache.store, fresh)
+            else:
+                cache.store(fresh)
+            found.update(fresh)
+        return self._assemble([found.get(key) for key in keys])
@@ -1,29 +1,25 @@
-import json
-from typing import override
+from typing import Optional, override
 
 
 from .base_model import BaseModel
+from ..errors import ExecuteError
 from ..api_platforms import ModelPlatform
 from ..prompts import PromptManager
-from ..message import ChatRequest
+from ..message import ChatRequest, MessageChainBuilder
+from ..message.message_chain import ImageBytes
+from ..utils import OutputSchema, StructuredOutputError, parse_structured
+
+_BATCH_SCHEMA = OutputSchema({"results": list}, required=["results"], list_key="results")
 
 class MemoticonModel(BaseModel):
     """表情包判别模型"""
+    _output_schema = OutputSchema({"is_meme": bool, "meme_type": list, "description": str},
+                                  required=["is_meme"], defaults={"meme_type": [], "description": ""})
+
     def __init__(self, model_name: str, platform: ModelPlatform):
         system_prompt = PromptManager.get_memoticon_prompt()
         super().__init__(system_prompt, model_name, platform, temperature=0, max_tokens=1024, enable_thinking=True, thinking_budget=512)
 
-    @override
-    def _process_data(self, model_output: dict) -> dict:
-        reply_msg = model_output["choices"][0]["message"]["content"].replace("```json", "").replace("```", "")
-        try:
-            reply_json = json.loads(reply_msg)
-            if isinstance(reply_json, dict) and "is_meme" in reply_json and "meme_type" in reply_json and "description" in reply_json:
-                return reply_json
-            raise ValueError(f"表情包判别模型返回内容不完整")
-        except Exception as e:
-            raise ValueError(f"表情包判别模型返回内容解析失败: {reply_msg}，错误信息: {e}")
-    
     @override
     def _build_payload(self, messages: list[dict]) -> dict:
         self._extra_body = self._build_extra_body()
@@ -39,7 +35,49 @@ class MemoticonModel(BaseModel):
             "n": self._n,
         }
 
-    def judge_meme(self, img_base64: str) -> dict:
-        msg_chain = self.create_initial_message_chain("判别这张图片", img_base64)
-        cr = ChatRequest(message_chain=msg_chain)
-        return self.get_process_data(cr)
\ No newline at end of file
+    def _create_judge_request(self, img: ImageBytes | str) -> ChatRequest:
+        """图片可为原始字节或 base64 字符串，原始字节只在构造请求时编码一次"""
+        if isinstance(img, str):
+            msg_chain = self.create_initial_message_chain("判别这张图片", img_base64=img)
+        else:
+            msg_chain = self.create_initial_message_chain("判别这张图片", img_bytes=img)
+        return ChatRequest(message_chain=msg_chain)
+
+    def judge_meme(self, img: ImageBytes | str) -> dict:
+        return self.get_process_data(self._create_judge_request(img))
+
+    async def judge_meme_async(self, img: ImageBytes | str) -> dict:
+        return await self.get_process_data_async(self._create_judge_request(img))
+
+    def _create_batch_judge_request(self, images: list[ImageBytes]) -> ChatRequest:
+        mcb = MessageChainBuilder()
+        mcb.create_new_message_chain(PromptManager.get_memoticon_batch_prompt())
+        mcb.add_user_images(f"判别这 {len(images)} 张图片", images)
+        return ChatRequest(mcb.build())
+
+    def _parse_batch(self, model_output: dict, count: int) -> list[Optional[dict]]:
+        """按 index 把判别结果对齐到输入位置，index 缺失或无效时按顺序对齐，缺少或残缺的位置为 None"""
+        results: list[Optional[dict]] = [None] * count
+        for position, item in enumerate(parse_structured(self._output_text(model_output), _BATCH_SCHEMA)["results"]):
+            if not isinstance(item, dict):
+                continue
+            index = item.get("index")
+            if not isinstance(index, int) or not 0 <= index < count or results[index] is not None:
+                index = position
+            if index < count and results[index] is None:
+                try:
+                    results[index] = self._output_schema.apply(item)
+                except StructuredOutputError:
+                    continue
+        return results
+
+    async def judge_memes_async(self, images: list[ImageBytes]) -> list[Optional[dict]]:
+        """一次请求判别多张图片，按输入顺序返回结果，模型漏判或输出无法解析的位置为 None"""
+        try:
+            model_output = await self._response_async(self._create_batch_judge_request(images))
+        except Exception as e:
+            raise ExecuteError(f"批量判别表情包失败: {e}")
+        try:
+            return self._parse_batch(model_output, len(images))
+        except StructuredOutputError:
+            return [None] * len(images)
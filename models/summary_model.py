@@ -0,0 +1,25 @@
+from .base_model import BaseModel
+from ..api_platforms import ModelPlatform
+from ..prompts import PromptManager
+from ..message import ChatRequest, MessageUnit
+from ..utils import OutputSchema
+
+class SummaryModel(BaseModel):
+    """对话摘要模型，将较早的短期记忆压缩为摘要"""
+    _output_schema = OutputSchema({"summary": str}, required=["summary"])
+
+    def __init__(self, model_name: str, platform: ModelPlatform):
+        system_prompt = PromptManager.get_summary_prompt()
+        super().__init__(system_prompt, model_name, platform, temperature=0.3, max_tokens=1024)
+
+    def _create_summary_request(self, previous_summary: str, message_units: list[MessageUnit]) -> ChatRequest:
+        messages = "\n".join(str(unit) for unit in message_units)
+        user_message = f"已有摘要：\n{previous_summary}\n新消息：\n{messages}" if previous_summary else f"新消息：\n{messages}"
+        return ChatRequest(self.create_initial_message_chain(user_message))
+
+    def summarize(self, previous_summary: str, message_units: list[MessageUnit]) -> str:
+        """合并已有摘要与消息，返回新的摘要"""
+        return self.get_process_data(self._create_summary_request(previous_summary, message_units))["summary"]
+
+    async def summarize_async(self, previous_summary: str, message_units: list[MessageUnit]) -> str:
+        return (await self.get_process_data_async(self._create_summary_request(previous_summary, message_units)))["summary"]
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Optional
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """审查缓存使用的规范化：全角转半角、去首尾空白、合并连续空白、英文小写"""
+    return _WHITESPACE_PATTERN.sub(" ", unicodedata.normalize("NFKC", text)).strip().lower()
+
+
+class VerdictCache:
+    """按内容寻址的审查结果缓存
+
+    说明:
+        - 键为 命名空间 + 规范化文本 的摘要，命名空间通常取审查提示词的摘要，提示词变化后旧结果自然失效。
+        - 内存层为带过期时间的 LRU；传入 `db_path` 时另有 SQLite 持久层，重启后仍可命中。
+        - 缓存的值为 {"can_output": bool, "reason": str}。
+        - 线程安全，持久层的读写会阻塞，异步调用方应放到线程中执行。
+    """
+
+    def __init__(self, ttl: float = 86400, maxsize: int = 4096, db_path: Optional[Path] = None, namespace: str = ""):
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._namespace = namespace
+        self._lock = threading.Lock()
+        self._data: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        if db_path is not None:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            with self._lock:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                with self._conn:
+                    self._conn.execute('''
+                        CREATE TABLE IF NOT EXISTS verdict (
+                            key TEXT PRIMARY KEY,
+                            verdict TEXT NOT NULL,
+                            expires_at REAL NOT NULL
+                        ) WITHOUT ROWID
+                    ''')
+                    self._conn.execute("DELETE FROM verdict WHERE expires_at < ?", (time.time(),))
+
+    @property
+    def persistent(self) -> bool:
+        return self._conn is not None
+
+    def key(self, text: str) -> str:
+        return hashlib.blake2b(f"{self._namespace}\0{normalize_text(text)}".encode(), digest_size=16).hexdigest()
+
+    def _put_locked(self, key: str, verdict: dict):
+        self._data[key] = (time.monotonic() + self._ttl, verdict)
+        self._data.move_to_end(key)
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+    def lookup(self, keys: Iterable[str]) -> dict[str, dict]:
+        """只查内存层，返回命中的 键 -> 审查结果"""
+        found: dict[str, dict] = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                item = self._data.get(key)
+                if item is None:
+                    continue
+                if item[0] < now:
+                    del self._data[key]
+                    continue
+                self._data.move_to_end(key)
+                found[key] = item[1]
+        return found
+
+    def lookup_persistent(self, keys: Iterable[str]) -> dict[str, dict]:
+        """查持久层，命中的结果同时写回内存层"""
+        keys = list(keys)
+        if self._conn is None or not keys:
+            return {}
+        found: dict[str, dict] = {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, verdict FROM verdict WHERE key IN ({','.join('?' * len(keys))}) AND expires_at >= ?",
+                (*keys, time.time())
+            ).fetchall()
+            for key, verdict in rows:
+                found[key] = json.loads(verdict)
+                self._put_locked(key, found[key])
+        return found
+
+    def store(self, verdicts: dict[str, dict]):
+        """写入审查结果，开启持久层时同时落盘"""
+        if not verdicts:
+            return
+        with self._lock:
+            for key, verdict in verdicts.items():
+                self._put_locked(key, verdict)
+            if self._conn is not None:
+                expires_at = time.time() + self._ttl
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO verdict (key, verdict, expires_at) VALUES (?, ?, ?)",
+                        [(key, json.dumps(verdict, ensure_ascii=False), expires_at) for key, verdict in verdicts.items()]
+                    )
+
+    def record(self, hits: int, misses: int):
+        with self._lock:
+            self._hits += hits
+            self._misses += misses
+
+    def metrics(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "size": len(self._data),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 3) if total else 0.0
+            }
+
+    def dispose(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
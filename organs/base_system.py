@@ -22,6 +22,10 @@ class SystemConfig:
         self._config_generator.generate_config()
         self._config_generator.reload_config()
 
+    def reload(self):
+        """从 YAML 重新加载配置"""
+        self._config_generator.reload_config()
+
 
 
 class BaseSystem(Generic[TConfig]):
@@ -43,3 +47,12 @@ class BaseSystem(Generic[TConfig]):
     @property
     def config(self) -> TConfig:
         return self._config
+
+    def reload_config(self):
+        """重新加载配置文件，并通知子类刷新依赖配置的状态"""
+        self._config.reload()
+        self._on_config_reloaded()
+
+    def _on_config_reloaded(self):
+        """配置重新加载后的钩子，子类按需重写"""
+        pass
@@ -0,0 +1,155 @@
+import re
+import sqlite3
+import threading
+import time
+from logging import Logger
+from pathlib import Path
+from typing import Iterable, Optional
+
+from ...utils import estimate_tokens
+
+_USER_ID_PATTERN = re.compile(r"<user_id:\s*(?P<user_id>[^/>]+?)\s*/>")
+_CJK_RUN_PATTERN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+")
+_WORD_PATTERN = re.compile(r"[0-9a-zA-Z_]+")
+
+
+def _tokenize(text: str) -> list[str]:
+    """将文本切分为检索词：中文按相邻二字切分，其余按单词切分"""
+    terms: list[str] = []
+    for run in _CJK_RUN_PATTERN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    terms.extend(word.lower() for word in _WORD_PATTERN.findall(text))
+    return terms
+
+
+class DiaryStore:
+    """长期日记存储，使用 SQLite FTS5 做全文检索
+
+    说明:
+        - 日记按来源存储，日记中出现的 `<user_id:.../>` 额外记录到 diary_user 表，便于按用户召回。
+        - 检索词由 `_tokenize` 预先切分后写入 FTS 表，不依赖 SQLite 的 trigram 分词器，两个字的中文词也能命中。
+        - 当前 SQLite 未编译 FTS5 时退化为按用户与时间召回。
+    """
+
+    def __init__(self, db_path: Path, log: Logger):
+        self._log = log
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=64)
+        self._fts_enabled = True
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            with self._conn:
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS diary (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        source TEXT NOT NULL,
+                        content TEXT NOT NULL,
+                        time INTEGER NOT NULL
+                    )
+                ''')
+                self._conn.execute('CREATE INDEX IF NOT EXISTS idx_diary_source_time ON diary (source, time)')
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS diary_user (
+                        user_id TEXT NOT NULL,
+                        diary_id INTEGER NOT NULL,
+                        PRIMARY KEY (user_id, diary_id)
+                    ) WITHOUT ROWID
+                ''')
+                try:
+                    self._conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS diary_fts USING fts5(terms, tokenize="unicode61")')
+                except sqlite3.OperationalError as e:
+                    self._fts_enabled = False
+                    self._log.warning(f"当前 SQLite 不支持 FTS5，日记将按用户与时间召回: {e}")
+
+    def dispose(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def extract_user_ids(content: str) -> list[str]:
+        return list(dict.fromkeys(m.group("user_id") for m in _USER_ID_PATTERN.finditer(content)))
+
+    def add(self, source: str, content: str, timestamp: Optional[int] = None) -> int:
+        """写入一条日记，返回日记 id"""
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO diary (source, content, time) VALUES (?, ?, ?)',
+                (source, content, timestamp)
+            )
+            diary_id = cursor.lastrowid
+            assert diary_id is not None
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO diary_user (user_id, diary_id) VALUES (?, ?)',
+                [(user_id, diary_id) for user_id in self.extract_user_ids(content)]
+            )
+            if self._fts_enabled:
+                self._conn.execute(
+                    'INSERT INTO diary_fts (rowid, terms) VALUES (?, ?)',
+                    (diary_id, " ".join(_tokenize(_USER_ID_PATTERN.sub(" ", content))))
+                )
+        return diary_id
+
+    def count(self, source: str) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM diary WHERE source=?', (source,)).fetchone()[0]
+
+    def _search_text(self, source: str, query: str, limit: int) -> list[tuple[int, str, int]]:
+        terms = list(dict.fromkeys(_tokenize(query)))
+        if not self._fts_enabled or not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        with self._lock:
+            return self._conn.execute('''
+                SELECT d.id, d.content, d.time FROM diary_fts
+                JOIN diary d ON d.id = diary_fts.rowid
+                WHERE diary_fts MATCH ? AND d.source = ?
+                ORDER BY bm25(diary_fts) LIMIT ?
+            ''', (match, source, limit)).fetchall()
+
+    def _search_users(self, source: str, user_ids: list[str], limit: int) -> list[tuple[int, str, int]]:
+        if not user_ids:
+            return []
+        placeholders = ",".join("?" * len(user_ids))
+        with self._lock:
+            return self._conn.execute(f'''
+                SELECT DISTINCT d.id, d.content, d.time FROM diary_user u
+                JOIN diary d ON d.id = u.diary_id
+                WHERE u.user_id IN ({placeholders}) AND d.source = ?
+                ORDER BY d.time DESC LIMIT ?
+            ''', (*user_ids, source, limit)).fetchall()
+
+    def search(self, source: str, query: str, user_ids: Iterable[str] = (), top_k: int = 5, token_budget: int = 512) -> list[str]:
+        """检索与 query 最相关的日记，结果按时间先后排列
+
+        排序规则为：同时提到相关用户的全文命中 > 其余全文命中 > 仅提到相关用户的最近日记；
+        在不超过 top_k 条与 token_budget 的前提下依次选取。
+        """
+        if top_k <= 0 or token_budget <= 0:
+            return []
+        user_ids = list(dict.fromkeys(user_ids))
+        text_hits = self._search_text(source, query, top_k * 4)
+        user_hits = self._search_users(source, user_ids, top_k * 4)
+        user_hit_ids = {row[0] for row in user_hits}
+        candidates = (
+            [row for row in text_hits if row[0] in user_hit_ids]
+            + [row for row in text_hits if row[0] not in user_hit_ids]
+            + user_hits
+        )
+        selected: dict[int, tuple[str, int]] = {}
+        used_tokens = 0
+        for diary_id, content, timestamp in candidates:
+            if len(selected) >= top_k:
+                break
+            if diary_id in selected:
+                continue
+            tokens = estimate_tokens(content)
+            if used_tokens + tokens > token_budget:
+                continue
+            selected[diary_id] = (content, timestamp)
+            used_tokens += tokens
+        return [content for _, (content, _) in sorted(selected.items(), key=lambda item: (item[1][1], item[0]))]
@@ -1,41 +1,231 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, replace
 from ncatbot.utils import get_log
 from ncatbot.plugin_system import EventBus
 from pathlib import Path
+from typing import Optional
 
+from .diary_store import DiaryStore
 from ..base_system import BaseSystem, SystemConfig
+from ...api_platforms import ClientPool
 from ...message import MessageUnit, MessageChain, MessageChainBuilder
+from ...models import SummaryModel
+from ...utils import AsyncLoopThread, estimate_tokens
 
 class MemoryConfig(SystemConfig):
-    short_term_capacity: int = 16  # 短期记忆容量
-    diary_capacity: int = 12  # 日记整合容量
+    short_term_capacity: int = 16  # 每个来源的短期记忆容量（消息条数）
+    short_term_token_budget: int = 2048  # 每个来源短期记忆的估算 token 上限
+    diary_capacity: int = 12  # 短期记忆达到该条数时，在后台将较早的消息压缩为摘要
+    compaction_token_threshold: int = 1536  # 短期记忆估算 token 达到该值时同样触发压缩
+    compaction_keep: int = 6  # 压缩时保留的最近消息条数
+    compaction_concurrency: int = 2  # 同时进行压缩的来源数量
+    diary_top_k: int = 5  # 每次对话最多召回的日记条数
+    diary_token_budget: int = 512  # 召回日记的估算 token 上限
+    short_term_idle_ttl: int = 86400  # 来源超过该秒数没有新消息时释放其短期记忆与摘要，0 为不释放
 
     def __init__(self, work_path: Path) -> None:
-        super().__init__(work_path, ["short_term_capacity"])
+        super().__init__(work_path, ["short_term_capacity", "short_term_token_budget", "diary_capacity", "compaction_token_threshold",
+                                     "compaction_keep", "compaction_concurrency", "diary_top_k", "diary_token_budget",
+                                     "short_term_idle_ttl"])
+
+@dataclass(slots=True)
+class _SourceMemory:
+    """单个来源的短期记忆。
+
+    units: 按时间顺序排列的消息单元，超出容量时从最旧的开始淘汰
+    tokens: 与 units 一一对应的估算 token 数
+    total_tokens: tokens 之和
+    head_seq: units[0] 的序号，每条消息入队时分配递增序号，用于在压缩完成后定位被压缩的消息
+    summary: 较早消息压缩后的摘要
+    compacting_until: 正在压缩的消息序号上界（不含），为 None 表示没有进行中的压缩
+    overflow: 未被压缩就因容量淘汰的消息，留给下一次压缩
+    last_active: 上次写入消息的时间（monotonic 秒），用于回收长期空闲的来源
+    """
+    units: deque = field(default_factory=deque)
+    tokens: deque = field(default_factory=deque)
+    total_tokens: int = 0
+    head_seq: int = 0
+    summary: str = ""
+    compacting_until: Optional[int] = None
+    overflow: list = field(default_factory=list)
+    last_active: float = field(default_factory=time.monotonic)
+    lock: threading.Lock = field(default_factory=threading.Lock)
 
 class MemorySystem(BaseSystem[MemoryConfig]):
     log = get_log("SiriusChatCore-MemorySystem")
-    def __init__(self, event_bus: EventBus, work_path: Path, summary_model):
+    _IDLE_SWEEP_INTERVAL = 600  # 两次空闲来源回收之间的最短间隔（秒）
+
+    def __init__(self, event_bus: EventBus, work_path: Path, summary_model: Optional[SummaryModel]):
         super().__init__(event_bus, work_path, MemoryConfig(work_path))
-        self.short_term_memory: list[MessageUnit] = []
-        self.diary_category: list[tuple[str, str]] = []
-        self.diary: str = ""
+        self._short_term: dict[str, _SourceMemory] = {}
+        self._short_term_lock = threading.Lock()
+        self._last_idle_sweep = time.monotonic()
+        self._diary_store = DiaryStore(self._work_path / "diary.db", self.log)
         self._summary_model = summary_model
+        self._compaction_thread: Optional[AsyncLoopThread] = None
+        if summary_model:
+            # 压缩在独立的事件循环中进行，不占用回复链路
+            self._compaction_semaphore = asyncio.Semaphore(max(1, self.config.compaction_concurrency))
+            self._compaction_thread = AsyncLoopThread("memory_compaction_thread")
+            self._compaction_thread.add_shutdown_hook(ClientPool.aclose_loop_clients)
+            self._compaction_thread.start()
+
+    def dispose(self):
+        if self._compaction_thread:
+            self._compaction_thread.stop()
+        self._diary_store.dispose()
+
+    def _get_source_memory(self, source: str) -> _SourceMemory:
+        """获取来源的短期记忆并标记为活跃，顺带按间隔回收长期空闲的来源"""
+        now = time.monotonic()
+        with self._short_term_lock:
+            if now - self._last_idle_sweep > self._IDLE_SWEEP_INTERVAL:
+                self._last_idle_sweep = now
+                self._evict_idle_sources(now)
+            memory = self._short_term.get(source)
+            if memory is None:
+                memory = self._short_term[source] = _SourceMemory()
+            memory.last_active = now
+            return memory
+
+    def _evict_idle_sources(self, now: float):
+        """释放长期没有新消息的来源，正在压缩的来源留到下次，需持有 _short_term_lock"""
+        ttl = self.config.short_term_idle_ttl
+        if ttl <= 0:
+            return
+        idle = [source for source, memory in self._short_term.items()
+                if now - memory.last_active > ttl and memory.compacting_until is None]
+        for source in idle:
+            del self._short_term[source]
+        if idle:
+            self.log.info(f"释放 {len(idle)} 个空闲来源的短期记忆。")
 
     def add_to_short_term(self, message: MessageUnit):
-        if message.is_self or message.is_notice:
-            self.short_term_memory.append(message)
-        elif self.short_term_memory and self.short_term_memory[-1].user_id == message.user_id:
-            self.short_term_memory[-1].message += f"\n{message.message}"  # 合并同一用户的连续消息
-            self.short_term_memory[-1].time = message.time  # 更新时间戳
-        else:
-            self.short_term_memory.append(message)
-        if len(self.short_term_memory) > self.config.short_term_capacity:
-            self.short_term_memory.pop()
-    
-    def get_memory(self, init_message_chain: MessageChain) -> MessageChain:
+        memory = self._get_source_memory(message.source)
+        with memory.lock:
+            last = memory.units[-1] if memory.units else None
+            if last and not (message.is_notice or last.is_notice) and last.is_self == message.is_self and (message.is_self or last.user_id == message.user_id):
+                # 合并同一用户的连续消息与机器人连续发出的回复，替换为新对象以免影响其它地方持有的消息单元
+                merged = replace(last, message=f"{last.message}\n{message.message}", time=message.time)
+                memory.units[-1] = merged
+                memory.total_tokens -= memory.tokens[-1]
+                memory.tokens[-1] = estimate_tokens(str(merged))
+            else:
+                memory.units.append(replace(message))
+                memory.tokens.append(estimate_tokens(str(message)))
+            memory.total_tokens += memory.tokens[-1]
+            # 从最旧的消息开始淘汰，至少保留最新一条
+            while len(memory.units) > 1 and (
+                len(memory.units) > self.config.short_term_capacity
+                or memory.total_tokens > self.config.short_term_token_budget
+            ):
+                self._evict_head(memory)
+            self._maybe_compact(message.source, memory)
+
+    def _evict_head(self, memory: _SourceMemory) -> MessageUnit:
+        """淘汰最旧的一条消息，需持有 memory.lock"""
+        unit = memory.units.popleft()
+        memory.total_tokens -= memory.tokens.popleft()
+        if self._summary_model and (memory.compacting_until is None or memory.head_seq >= memory.compacting_until):
+            memory.overflow.append(unit)
+            del memory.overflow[:-self.config.short_term_capacity]
+        memory.head_seq += 1
+        return unit
+
+    def _maybe_compact(self, source: str, memory: _SourceMemory):
+        """超过阈值时提交后台压缩，每个来源同一时间只有一个压缩任务，需持有 memory.lock"""
+        if not self._compaction_thread or memory.compacting_until is not None:
+            return
+        if len(memory.units) < self.config.diary_capacity and memory.total_tokens < self.config.compaction_token_threshold:
+            return
+        count = len(memory.units) - max(1, self.config.compaction_keep)
+        if count <= 0:
+            return
+        units = memory.overflow + [memory.units[i] for i in range(count)]
+        memory.overflow = []
+        memory.compacting_until = memory.head_seq + count
+        self._compaction_thread.submit(self._compact(source, memory, units, memory.summary))
+
+    async def _compact(self, source: str, memory: _SourceMemory, units: list[MessageUnit], previous_summary: str):
+        assert self._summary_model is not None
+        try:
+            async with self._compaction_semaphore:
+                summary = await self._summary_model.summarize_async(previous_summary, units)
+        except Exception as e:
+            self.log.warning(f"压缩 {source} 的短期记忆失败: {e}")
+            with memory.lock:
+                # 已不在队列中的消息（原有的 overflow 与压缩期间被淘汰的部分）放回 overflow，留给下一次压缩
+                assert memory.compacting_until is not None
+                still_queued = max(0, memory.compacting_until - memory.head_seq)
+                memory.overflow = units[:len(units) - still_queued] + memory.overflow
+                del memory.overflow[:-self.config.short_term_capacity]
+                memory.compacting_until = None
+            return
+        with memory.lock:
+            # 压缩期间可能已有部分消息因容量被淘汰，只移除仍在队列中的部分
+            assert memory.compacting_until is not None
+            while memory.units and memory.head_seq < memory.compacting_until:
+                memory.units.popleft()
+                memory.total_tokens -= memory.tokens.popleft()
+                memory.head_seq += 1
+            memory.summary = summary
+            memory.compacting_until = None
+            self.log.debug(f"已将 {source} 的 {len(units)} 条消息压缩为摘要: {summary}")
+            # 压缩期间积累的新消息可能已再次超过阈值
+            self._maybe_compact(source, memory)
+
+    def get_summary(self, source: str) -> str:
+        """获取来源较早对话的摘要"""
+        with self._short_term_lock:
+            memory = self._short_term.get(source)
+        if memory is None:
+            return ""
+        with memory.lock:
+            return memory.summary
+
+    def get_short_term(self, source: str) -> list[MessageUnit]:
+        """获取来源的短期记忆快照"""
+        with self._short_term_lock:
+            memory = self._short_term.get(source)
+        if memory is None:
+            return []
+        with memory.lock:
+            return list(memory.units)
+
+    def add_diary(self, source: str, content: str):
+        """记录一条日记到长期记忆"""
+        content = content.strip()
+        if not content:
+            return
+        self._diary_store.add(source, content)
+        self.log.debug(f"记录 {source} 的日记: {content}")
+
+    def search_diary(self, source: str, query_units: list[MessageUnit]) -> list[str]:
+        """按当前消息检索相关日记，不超过 diary_top_k 条与 diary_token_budget"""
+        query = "\n".join(unit.message for unit in query_units)
+        user_ids = [unit.user_id for unit in query_units if unit.user_id]
+        return self._diary_store.search(
+            source, query, user_ids,
+            top_k=self.config.diary_top_k,
+            token_budget=self.config.diary_token_budget
+        )
+
+    def get_memory(self, init_message_chain: MessageChain, source: str, query_units: Optional[list[MessageUnit]] = None) -> MessageChain:
+        """构造带记忆的消息链，query_units 为用于检索日记的当前消息，缺省时取短期记忆中最新的用户消息"""
         mcb = MessageChainBuilder.from_message_chain(init_message_chain)
-        if self.diary:
-            mcb.append_system_message(f"以前发生的事情你写成了日记，这是你的日记内容：\n{self.diary}")
-        if self.short_term_memory:
-            mcb.add_user_message_by_units(self.short_term_memory)
-        return mcb.build()
\ No newline at end of file
+        summary = self.get_summary(source)
+        if summary:
+            mcb.append_system_message(f"这是此前对话的摘要：\n{summary}")
+        short_term_memory = self.get_short_term(source)
+        if query_units is None:
+            query_units = [unit for unit in short_term_memory[-1:] if not unit.is_self]
+        diaries = self.search_diary(source, query_units) if query_units else []
+        if diaries:
+            diary = "\n".join(f"- {d}" for d in diaries)
+            mcb.append_system_message(f"以前发生的事情你写成了日记，这是与当前对话相关的日记内容：\n{diary}")
+        if short_term_memory:
+            mcb.add_user_message_by_units(short_term_memory)
+        return mcb.build()
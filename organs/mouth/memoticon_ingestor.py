@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import random
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+
+import httpx
+
+from ...api_platforms import ClientPool
+from ...message.message_chain import ImageBytes
+from ...models.memoticon_model import MemoticonModel
+from ...utils import AsyncLoopThread
+
+if TYPE_CHECKING:
+    from .memoticon_system import MemoticonSystem
+
+
+class MemoticonIngestor:
+    """表情包后台学习流水线
+
+    说明:
+        - `ingest` 可在任意线程调用，只做入队，立即返回。
+        - 入队前按文件标识去重（内存 LRU + 数据库），已学习过的图片不会再次下载。
+        - 有界队列，队列满时丢弃新图片；下载并发与 VLM 判别并发分别受限，判别请求按 RPM 限速。
+        - 去重后仍需判别的图片在 judge_batch_ms 内凑批，一次请求最多判别 judge_batch_size 张，
+          模型漏判的图片再单独判别。
+        - 学习失败的图片会从去重记录中移除，之后再次出现时可以重新学习。
+    """
+    _RECENT_KEYS_CAPACITY = 4096
+    _MAX_IMAGE_BYTES = 16 * 1024 * 1024
+
+    def __init__(self, memoticon_system: "MemoticonSystem", model: MemoticonModel):
+        self._system = memoticon_system
+        self._model = model
+        self._log = memoticon_system.log
+        config = memoticon_system.config
+        self._queue_size = config.ingest_queue_size
+        self._download_concurrency = config.download_concurrency
+        self._judge_semaphore: Optional[asyncio.Semaphore] = None
+        self._judge_concurrency = config.judge_concurrency
+        self._judge_interval = 60 / config.judge_rpm if config.judge_rpm > 0 else 0
+        self._next_judge_at = 0.0
+        self._judge_batch_size = max(1, config.judge_batch_size)
+        self._judge_batch_delay = max(0, config.judge_batch_ms) / 1000
+        self._pending_judges: list[tuple[ImageBytes, asyncio.Future[Optional[dict]]]] = []
+        self._batch_timer: Optional[asyncio.TimerHandle] = None
+        self._batch_tasks: set[asyncio.Task] = set()
+        self._recent_keys: OrderedDict[str, None] = OrderedDict()
+        self._queue: Optional[asyncio.Queue[tuple[str, str]]] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._workers: list[asyncio.Task] = []
+        self._loop_thread = AsyncLoopThread("memoticon_ingest_thread")
+        self._loop_thread.add_shutdown_hook(self._aclose)
+        self._loop_thread.add_shutdown_hook(ClientPool.aclose_loop_clients)
+
+    def start(self):
+        self._loop_thread.start()
+        self._loop_thread.submit(self._start()).result(timeout=5)
+
+    def dispose(self):
+        """取消并等待工作协程退出后再停止事件循环，避免关闭数据库时仍有图片在保存"""
+        try:
+            self._loop_thread.submit(self._cancel_workers()).result(timeout=5)
+        except Exception as e:
+            self._log.warning(f"等待表情包学习任务退出失败: {e}")
+        self._loop_thread.stop()
+
+    def ingest(self, url: str, key: Optional[str] = None):
+        """提交一张图片，key 为图片的稳定标识（如文件名），缺省时使用 url"""
+        self._loop_thread.call_soon(self._enqueue, url, key or url)
+
+    async def _start(self):
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._judge_semaphore = asyncio.Semaphore(self._judge_concurrency)
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(20, connect=5), follow_redirects=True)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self._download_concurrency)]
+
+    async def _cancel_workers(self):
+        if self._batch_timer:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        tasks = [*self._workers, *self._batch_tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+
+    async def _aclose(self):
+        if self._client:
+            await self._client.aclose()
+
+    def _remember(self, key: str) -> bool:
+        """记录 key，已存在时返回 False"""
+        if key in self._recent_keys:
+            self._recent_keys.move_to_end(key)
+            return False
+        self._recent_keys[key] = None
+        if len(self._recent_keys) > self._RECENT_KEYS_CAPACITY:
+            self._recent_keys.popitem(last=False)
+        return True
+
+    def _enqueue(self, url: str, key: str):
+        assert self._queue is not None
+        if not self._remember(key):
+            return
+        try:
+            self._queue.put_nowait((url, key))
+        except asyncio.QueueFull:
+            self._recent_keys.pop(key, None)
+            self._log.debug(f"表情包学习队列已满，丢弃图片: {key}")
+
+    async def _worker(self):
+        assert self._queue is not None
+        while True:
+            url, key = await self._queue.get()
+            try:
+                await self._process(url, key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 允许之后再次出现时重新学习
+                self._recent_keys.pop(key, None)
+                self._log.warning(f"学习表情包 {key} 失败: {e}")
+
+    async def _process(self, url: str, key: str):
+        if random.random() > self._system.config.save_prob:
+            return
+        if await asyncio.to_thread(self._system.has_source, key):
+            return
+        img, img_hash = await self._download(url)
+        img_hash = await self._system.judge_meme_async(memoryview(img), img_hash, judge=self._judge)
+        await asyncio.to_thread(self._system.save_source, key, img_hash)
+
+    async def _download(self, url: str) -> tuple[bytearray, str]:
+        """流式下载图片，边下载边计算 SHA-256，只保留一份原始字节"""
+        assert self._client is not None
+        hasher = hashlib.sha256()
+        img = bytearray()
+        async with self._client.stream("GET", url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                hasher.update(chunk)
+                img += chunk
+                if len(img) > self._MAX_IMAGE_BYTES:
+                    raise ValueError(f"图片超过 {self._MAX_IMAGE_BYTES} 字节")
+        return img, hasher.hexdigest()
+
+    async def _judge(self, img: ImageBytes) -> dict:
+        """把图片加入待判别批次并等待结果，批次中被模型漏判的图片单独判别"""
+        if self._judge_batch_size > 1:
+            future: asyncio.Future[Optional[dict]] = asyncio.get_running_loop().create_future()
+            self._pending_judges.append((img, future))
+            if len(self._pending_judges) >= self._judge_batch_size:
+                self._flush_judges()
+            elif self._batch_timer is None:
+                self._batch_timer = asyncio.get_running_loop().call_later(self._judge_batch_delay, self._flush_judges)
+            result = await future
+            if result is not None:
+                return result
+        async with self._judge_slot():
+            return await self._model.judge_meme_async(img)
+
+    def _flush_judges(self):
+        if self._batch_timer:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        batch, self._pending_judges = self._pending_judges, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._judge_batch(batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _judge_batch(self, batch: list[tuple[ImageBytes, "asyncio.Future[Optional[dict]]"]]):
+        """一次请求判别整批图片，结果为 None 的图片由等待方单独判别"""
+        try:
+            if len(batch) == 1:
+                # 单张图片直接交给等待方按单图判别
+                results: list[Optional[dict]] = [None]
+            else:
+                async with self._judge_slot():
+                    results = await self._model.judge_memes_async([img for img, _ in batch])
+                self._log.debug(f"批量判别 {len(batch)} 张图片，{sum(r is not None for r in results)} 张得到结果")
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    @asynccontextmanager
+    async def _judge_slot(self) -> AsyncIterator[None]:
+        """判别并发受 judge_concurrency 限制，并按 judge_rpm 均匀放行"""
+        assert self._judge_semaphore is not None
+        async with self._judge_semaphore:
+            now = time.monotonic()
+            wait = self._next_judge_at - now
+            self._next_judge_at = max(now, self._next_judge_at) + self._judge_interval
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield
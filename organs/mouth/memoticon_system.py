@@ -5,24 +5,37 @@ import random
 import sqlite3
 import os
 import base64
-from typing import Optional
+import threading
+from typing import Awaitable, Callable, Optional
 from typing_extensions import deprecated
 from PIL import Image
 from ncatbot.utils import get_log
 from ncatbot.plugin_system import EventBus
 import asyncio
 
+from .memoticon_ingestor import MemoticonIngestor
 from ..base_system import BaseSystem, SystemConfig
 from ...models.memoticon_model import MemoticonModel
 from ...message import MessageSender
+from ...message.message_chain import ImageBytes
+from ...utils import BKTree, LoopBridge, dhash
 
 class MemoticonConfig(SystemConfig):
     send_prob: float = 0.5  # 发送表情包的概率
     save_prob: float = 0.7  # 保存表情包的概率
     max_image_edge: int = 128  # 表情包图片保存的最大边长，超过则缩放
+    phash_threshold: int = 6  # 感知哈希汉明距离不超过该值视为同一张图片，小于 0 则关闭近似去重
+    ingest_queue_size: int = 64  # 待学习图片队列长度，队列满时丢弃新图片
+    download_concurrency: int = 4  # 同时下载图片的数量
+    judge_concurrency: int = 2  # 同时进行表情包判别的数量
+    judge_rpm: int = 30  # 每分钟最多发起的表情包判别请求次数，0 为不限制
+    judge_batch_size: int = 4  # 一次判别请求最多合并的图片数，1 为不合并
+    judge_batch_ms: int = 500  # 等待凑批的最长时间（毫秒）
 
     def __init__(self, work_path: Path) -> None:
-        super().__init__(work_path, ["send_prob", "save_prob", "max_image_edge"])
+        super().__init__(work_path, ["send_prob", "save_prob", "max_image_edge", "phash_threshold",
+                                     "ingest_queue_size", "download_concurrency", "judge_concurrency", "judge_rpm",
+                                     "judge_batch_size", "judge_batch_ms"])
     
 
 class MemoticonSystem(BaseSystem[MemoticonConfig]):
@@ -36,50 +49,249 @@ class MemoticonSystem(BaseSystem[MemoticonConfig]):
         self._model = model
         os.makedirs(self._img_dir, exist_ok=True)
         self._init_db()
+        self._ingestor = MemoticonIngestor(self, model)
+        self._ingestor.start()
 
     def _init_db(self):
-        conn = sqlite3.connect(self._db_path)
-        c = conn.cursor()
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS memoticon (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                hash TEXT UNIQUE,
-                tags TEXT,
-                description TEXT
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        """打开长连接（WAL 模式），建表并执行迁移"""
+        self._db_lock = threading.RLock()
+        self._conn = sqlite3.connect(self._db_path, check_same_thread=False, cached_statements=128)
+        with self._db_lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            with self._conn:
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS memoticon (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        hash TEXT UNIQUE,
+                        tags TEXT,
+                        description TEXT
+                    )
+                ''')
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS memoticon_tag (
+                        hash TEXT NOT NULL,
+                        tag TEXT NOT NULL,
+                        PRIMARY KEY (tag, hash)
+                    ) WITHOUT ROWID
+                ''')
+                self._conn.execute('CREATE INDEX IF NOT EXISTS idx_memoticon_tag_hash ON memoticon_tag (hash)')
+                # 图片来源标识（如QQ图片文件名）到哈希的映射，用于下载前去重
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS memoticon_source (
+                        key TEXT PRIMARY KEY,
+                        hash TEXT
+                    ) WITHOUT ROWID
+                ''')
+                # 判别为非表情包的图片，只记录哈希用于去重
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS memoticon_rejected (
+                        hash TEXT PRIMARY KEY,
+                        phash TEXT
+                    )
+                ''')
+                obsolete = self._migrate()
+            # 事务提交后再删除旧文件，提交前中断时旧文件仍在，重跑迁移即可
+            for path in obsolete:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    self.log.warning(f"删除迁移前的表情包图片 {path} 失败: {e}")
+        self._load_phash_index()
+
+    def _migrate(self) -> list[str]:
+        """按 user_version 执行数据库迁移，需在事务内调用，返回事务提交后应删除的旧图片路径"""
+        obsolete: list[str] = []
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version < 1:
+            # 将逗号分隔的 tags 列拆分到 memoticon_tag 表
+            rows = self._conn.execute('SELECT hash, tags FROM memoticon').fetchall()
+            for img_hash, tags in rows:
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO memoticon_tag (hash, tag) VALUES (?, ?)',
+                    [(img_hash, tag) for tag in self._split_tags(tags)]
+                )
+            self._conn.execute('PRAGMA user_version = 1')
+            self.log.info(f"表情包标签迁移完成，共 {len(rows)} 条记录。")
+        if version < 2:
+            # 为已有表情包补算感知哈希
+            self._conn.execute('ALTER TABLE memoticon ADD COLUMN phash TEXT')
+            rows = self._conn.execute('SELECT hash FROM memoticon').fetchall()
+            for (img_hash,) in rows:
+                try:
+                    with open(os.path.join(self._img_dir, f"{img_hash}.jpg"), "rb") as f:
+                        phash = dhash(f.read())
+                except OSError:
+                    continue
+                if phash is not None:
+                    self._conn.execute('UPDATE memoticon SET phash=? WHERE hash=?', (self._phash_to_str(phash), img_hash))
+            self._conn.execute('PRAGMA user_version = 2')
+            self.log.info(f"表情包感知哈希迁移完成，共 {len(rows)} 条记录。")
+        if version < 3:
+            # 哈希由 base64 文本的 SHA-256 改为原始字节的 SHA-256，按本地图片文件重算
+            # 事务内只复制出新文件名的图片，旧文件在提交后删除，中断后重跑不会丢失图片
+            rows = self._conn.execute('SELECT hash FROM memoticon').fetchall()
+            migrated = 0
+            for (old_hash,) in rows:
+                old_path = os.path.join(self._img_dir, f"{old_hash}.jpg")
+                try:
+                    with open(old_path, "rb") as f:
+                        data = f.read()
+                except OSError:
+                    continue
+                new_hash = hashlib.sha256(data).hexdigest()
+                if new_hash == old_hash:
+                    continue
+                new_path = os.path.join(self._img_dir, f"{new_hash}.jpg")
+                if not os.path.exists(new_path):
+                    with open(new_path, "wb") as f:
+                        f.write(data)
+                if self._conn.execute('SELECT 1 FROM memoticon WHERE hash=?', (new_hash,)).fetchone():
+                    # 新旧两种哈希对应同一张图片，保留已有的新记录
+                    self._conn.execute('DELETE FROM memoticon WHERE hash=?', (old_hash,))
+                else:
+                    self._conn.execute('UPDATE memoticon SET hash=? WHERE hash=?', (new_hash, old_hash))
+                    self._conn.execute('UPDATE OR IGNORE memoticon_tag SET hash=? WHERE hash=?', (new_hash, old_hash))
+                # 新哈希下已有相同标签时 UPDATE OR IGNORE 会留下旧行
+                self._conn.execute('DELETE FROM memoticon_tag WHERE hash=?', (old_hash,))
+                self._conn.execute('UPDATE memoticon_source SET hash=? WHERE hash=?', (new_hash, old_hash))
+                obsolete.append(old_path)
+                migrated += 1
+            self._conn.execute('PRAGMA user_version = 3')
+            self.log.info(f"表情包哈希迁移完成，共迁移 {migrated} 条记录。")
+        return obsolete
+
+    def _load_phash_index(self):
+        """从数据库加载感知哈希到 BK 树，条目为 (哈希, 是否为表情包)"""
+        self._phash_index: BKTree[tuple[str, bool]] = BKTree()
+        for img_hash, phash in self._fetchall('SELECT hash, phash FROM memoticon WHERE phash IS NOT NULL'):
+            self._phash_index.add(int(phash, 16), (img_hash, True))
+        for img_hash, phash in self._fetchall('SELECT hash, phash FROM memoticon_rejected WHERE phash IS NOT NULL'):
+            self._phash_index.add(int(phash, 16), (img_hash, False))
+
+    @staticmethod
+    def _phash_to_str(phash: int) -> str:
+        return f"{phash:016x}"
+
+    @staticmethod
+    def _split_tags(tags: Optional[str]) -> list[str]:
+        return [t.strip() for t in (tags or "").split(",") if t.strip()]
+
+    def _fetchone(self, sql: str, params: tuple = ()) -> Optional[tuple]:
+        with self._db_lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def _fetchall(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._db_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def dispose(self):
+        """停止后台学习并关闭数据库连接"""
+        self._ingestor.dispose()
+        with self._db_lock:
+            self._conn.close()
+
+    def ingest(self, url: str, key: Optional[str] = None):
+        """将图片交给后台学习流水线，立即返回"""
+        self._ingestor.ingest(url, key)
+
+    def has_source(self, key: str) -> bool:
+        return self._fetchone('SELECT 1 FROM memoticon_source WHERE key=?', (key,)) is not None
+
+    def save_source(self, key: str, img_hash: str):
+        with self._db_lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO memoticon_source (key, hash) VALUES (?, ?)', (key, img_hash))
     
-    def judge_meme(self, img_base64: str):
-        """判断图片是否为表情包，是则保存"""
+    def judge_meme(self, img: ImageBytes | str):
+        """判断图片是否为表情包，是则保存。图片可为原始字节或 base64 字符串"""
         if random.random() > self.config.save_prob:
             return
         # ncatbot 已经更新，不再需要resize
         # img_base64 = self.resize_image(img_base64)
-        img_hash = hashlib.sha256(img_base64.encode()).hexdigest()
-        conn = sqlite3.connect(self._db_path)
-        c = conn.cursor()
-        c.execute('SELECT hash FROM memoticon WHERE hash=?', (img_hash,))
-        if c.fetchone():
-            conn.close()
+        img = self._as_bytes(img)
+        img_hash, phash, judged = self._check_judged(img)
+        if judged:
             return
-        result = self._model.judge_meme(img_base64)
+        result = self._model.judge_meme(img)
+        self._save_judge_result(img, img_hash, phash, result)
+        return
+
+    async def judge_meme_async(self, img: ImageBytes | str, img_hash: Optional[str] = None,
+                               judge: Optional[Callable[[ImageBytes], Awaitable[dict]]] = None) -> str:
+        """异步判断图片是否为表情包，是则保存，返回图片哈希。不做 save_prob 抽样，由调用方决定
+
+        Args:
+            img: 图片原始字节或 base64 字符串
+            img_hash: 已在下载过程中增量计算好的哈希，缺省时重新计算
+            judge: 去重后仍需判别时调用的判别函数（如带限流与合批），缺省直接调用判别模型
+        """
+        img = self._as_bytes(img)
+        img_hash, phash, judged = await asyncio.to_thread(self._check_judged, img, img_hash)
+        if judged:
+            return img_hash
+        result = await (judge or self._model.judge_meme_async)(img)
+        await asyncio.to_thread(self._save_judge_result, img, img_hash, phash, result)
+        return img_hash
+
+    @staticmethod
+    def _as_bytes(img: ImageBytes | str) -> ImageBytes:
+        return base64.b64decode(img) if isinstance(img, str) else img
+
+    def _check_judged(self, img: ImageBytes, img_hash: Optional[str] = None) -> tuple[str, Optional[int], bool]:
+        """计算哈希并检查是否已判别过（精确或近似重复），返回 (哈希, 感知哈希, 是否已判别)"""
+        img_hash = img_hash or self.calculate_hash(img)
+        if self.has_image(img_hash) or self.is_rejected(img_hash):
+            return img_hash, None, True
+        phash = dhash(img)
+        if phash is not None:
+            similar = self.find_similar(phash)
+            if similar:
+                self.log.debug(f"图片与已判别的 {similar[0]} 近似重复，跳过判别")
+                return img_hash, phash, True
+        return img_hash, phash, False
+
+    def _save_judge_result(self, img: ImageBytes, img_hash: str, phash: Optional[int], result: dict):
         if result["is_meme"]:
             if result["meme_type"]:
-                result = self.save_image(img_base64, tags=",".join(result["meme_type"]), description=result["description"])
-                if result:
-                    self.log.info(result)
-        return
+                msg = self.save_image(img, tags=",".join(result["meme_type"]), description=result["description"], phash=phash, img_hash=img_hash)
+                if msg:
+                    self.log.info(msg)
+                return
+        self.save_rejected(img_hash, phash)
+
+    def find_similar(self, phash: int) -> Optional[tuple[str, bool]]:
+        """查找感知哈希最接近且在阈值内的已判别图片，返回 (哈希, 是否为表情包)"""
+        if self.config.phash_threshold < 0:
+            return None
+        with self._db_lock:
+            matches = self._phash_index.search(phash, self.config.phash_threshold)
+        return matches[0][1] if matches else None
+
+    def is_rejected(self, img_hash: str) -> bool:
+        return self._fetchone('SELECT 1 FROM memoticon_rejected WHERE hash=?', (img_hash,)) is not None
+
+    def save_rejected(self, img_hash: str, phash: Optional[int]):
+        """记录判别为非表情包的图片"""
+        phash_str = self._phash_to_str(phash) if phash is not None else None
+        with self._db_lock:
+            with self._conn:
+                self._conn.execute('INSERT OR IGNORE INTO memoticon_rejected (hash, phash) VALUES (?, ?)', (img_hash, phash_str))
+            if phash is not None:
+                self._phash_index.add(phash, (img_hash, False))
     
+    def pick_meme(self, emotion: str = "平静") -> Optional[str]:
+        """按 send_prob 决定是否发送表情包，返回要发送的图片路径"""
+        if random.random() > self.config.send_prob:
+            return None
+        return self.get_image(emotion)
+
     def send_meme(self, source, emotion: str = "平静"):
         """发送表情包"""
-        img_path = self.get_image(emotion)
+        img_path = self.pick_meme(emotion)
         if not img_path:
             return
-        if random.random() <= self.config.send_prob:
-            self.log.info(f"发送表情包到 {source}: {img_path}")
-            asyncio.run(MessageSender.send_message_to_source(source, image=img_path))
+        self.log.info(f"发送表情包到 {source}: {img_path}")
+        LoopBridge.run(MessageSender.send_message_to_source(source, image=img_path))
 
     @deprecated("ncatbot已经更新，不再需要缩放图片")
     def resize_image(self, img_base64: str) -> str:
@@ -112,8 +324,9 @@ class MemoticonSystem(BaseSystem[MemoticonConfig]):
             img_resized.save(buffer, format=img.format or "JPEG")
         return base64.b64encode(buffer.getvalue()).decode("utf-8")
     
-    def calculate_hash(self, base64_str: str):
-        return hashlib.sha256(base64_str.encode()).hexdigest()
+    def calculate_hash(self, img: ImageBytes | str) -> str:
+        """计算图片原始字节的 SHA-256，传入 base64 字符串时先解码"""
+        return hashlib.sha256(self._as_bytes(img)).hexdigest()
     
     @deprecated("ncatbot已经更新，不再需要缩放图片")
     def has_resized_image(self, base64_str: str) -> bool:
@@ -121,59 +334,58 @@ class MemoticonSystem(BaseSystem[MemoticonConfig]):
         return self.has_image(img_hash)
 
     def has_image(self, img_hash: str) -> bool:
-            conn = sqlite3.connect(self._db_path)
-            c = conn.cursor()
-            c.execute('SELECT hash FROM memoticon WHERE hash=?', (img_hash,))
-            if c.fetchone():
-                conn.close()
-                return True
-            conn.close()
-            return False
-
-    def save_image(self, base64_str: str, tags: str = "", description: str = "") -> Optional[str]:
+        return self._fetchone('SELECT 1 FROM memoticon WHERE hash=?', (img_hash,)) is not None
+
+    def save_image(self, img: ImageBytes | str, tags: str = "", description: str = "", phash: Optional[int] = None, img_hash: Optional[str] = None) -> Optional[str]:
         # 预防输出标签输出非预期的词语
         tags = tags.replace("可爱", "喜悦")
+        img_bytes = self._as_bytes(img)
         # 计算图片哈希
-        img_hash = self.calculate_hash(base64_str)
+        img_hash = img_hash or self.calculate_hash(img_bytes)
         img_path = os.path.join(self._img_dir, f"{img_hash}.jpg")
         try:
             if self.has_image(img_hash):
                 return None
-            conn = sqlite3.connect(self._db_path)
-            c = conn.cursor()
+            if phash is None:
+                phash = dhash(img_bytes)
+            phash_str = self._phash_to_str(phash) if phash is not None else None
             # 保存图片到本地
             with open(img_path, "wb") as f:
-                f.write(base64.b64decode(base64_str))
+                f.write(img_bytes)
             # 保存属性到数据库
-            c.execute('''
-                INSERT OR REPLACE INTO memoticon (hash, tags, description)
-                VALUES (?, ?, ?)
-            ''', (img_hash, tags, description))
-            conn.commit()
-            conn.close()
+            with self._db_lock:
+                with self._conn:
+                    self._conn.execute('''
+                        INSERT OR REPLACE INTO memoticon (hash, tags, description, phash)
+                        VALUES (?, ?, ?, ?)
+                    ''', (img_hash, tags, description, phash_str))
+                    self._conn.executemany(
+                        'INSERT OR IGNORE INTO memoticon_tag (hash, tag) VALUES (?, ?)',
+                        [(img_hash, tag) for tag in self._split_tags(tags)]
+                    )
+                if phash is not None:
+                    self._phash_index.add(phash, (img_hash, True))
             result_msg = f"保存表情包成功，哈希值: {img_hash}，标签: {tags}，描述: {description}，路径: {img_path}"
             return result_msg
         except Exception as e:
             raise ValueError(f"保存表情包失败: {e}")
 
     def get_image(self, tag: str) -> Optional[str]:
-        conn = sqlite3.connect(self._db_path)
-        c = conn.cursor()
-        c.execute('SELECT hash FROM memoticon WHERE tags LIKE ?', (f"%{tag}%",))
-        rows = c.fetchall()
-        conn.close()
-        if rows:
-            img = random.choice(rows)
+        # 两次查询都只走 memoticon_tag 的主键索引
+        with self._db_lock:
+            count = self._conn.execute('SELECT COUNT(*) FROM memoticon_tag WHERE tag=?', (tag,)).fetchone()[0]
+            if not count:
+                return None
+            img = self._conn.execute(
+                'SELECT hash FROM memoticon_tag WHERE tag=? LIMIT 1 OFFSET ?', (tag, random.randrange(count))
+            ).fetchone()
+        if img:
             img_path = os.path.join(self._img_dir, f"{img[0]}.jpg")
             return img_path
         return None
 
     def get_info(self, hash: str) -> Optional[dict]:
-        conn = sqlite3.connect(self._db_path)
-        c = conn.cursor()
-        c.execute('SELECT hash, tags, description FROM memoticon WHERE hash=?', (hash,))
-        row = c.fetchone()
-        conn.close()
+        row = self._fetchone('SELECT hash, tags, description FROM memoticon WHERE hash=?', (hash,))
         if row:
             return {
                 "hash": row[0],
@@ -183,9 +395,5 @@ class MemoticonSystem(BaseSystem[MemoticonConfig]):
         return None
 
     def list_memoticons(self) -> list:
-        conn = sqlite3.connect(self._db_path)
-        c = conn.cursor()
-        c.execute('SELECT hash FROM memoticon')
-        rows = c.fetchall()
-        conn.close()
+        rows = self._fetchall('SELECT hash FROM memoticon')
         return [r[0] for r in rows]
\ No newline at end of file
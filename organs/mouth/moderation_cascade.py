@@ -0,0 +1,87 @@
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Iterable, Literal
+
+from ...utils import KeywordMatcher
+
+_SEPARATOR_PATTERN = re.compile(r"[\W_]+")
+
+Decision = Literal["allow", "escalate", "block"]
+
+
+def _compact(text: str) -> str:
+    """全角转半角、小写并去掉空白与标点，使插入分隔符的写法也能命中"""
+    return _SEPARATOR_PATTERN.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+@dataclass(slots=True)
+class Screening:
+    """本地初筛结果。
+
+    decision: allow 直接放行，escalate 交给审查模型，block 直接拦截
+    score: 可疑度得分，为命中规则的权重之和
+    hits: 命中的关键词或规则
+    """
+    decision: Decision
+    score: float = 0.0
+    hits: list[str] = field(default_factory=list)
+
+
+class ModerationCascade:
+    """回复审查的本地初筛
+
+    说明:
+        - 过滤关键词与可疑词使用 Aho-Corasick 自动机在去掉空白与标点的文本上匹配，可疑规则为正则，各自带权重。
+        - 可疑度达到 `escalate_threshold` 或长度超过 `escalate_length` 的回复交给审查模型，其余直接放行。
+        - 命中过滤关键词时：有审查模型则交给模型判断，没有则直接拦截（与只用关键词过滤时一致）。
+        - `enabled` 为 False 时有审查模型则全部交给模型，不做初筛。
+    """
+
+    def __init__(self, block_keywords: Iterable[str], suspect_terms: dict[str, float], suspect_patterns: dict[str, float],
+                 escalate_threshold: float = 1.0, escalate_length: int = 60, enabled: bool = True):
+        self._block = KeywordMatcher(_compact(k) for k in block_keywords)
+        self._terms = KeywordMatcher(_compact(k) for k in suspect_terms)
+        self._term_weights = {_compact(k): float(v) for k, v in suspect_terms.items()}
+        self._patterns = [(re.compile(p), float(w)) for p, w in suspect_patterns.items()]
+        self._threshold = escalate_threshold
+        self._length = escalate_length
+        self._enabled = enabled
+        self._counts = {"screened": 0, "allowed": 0, "escalated": 0, "blocked": 0, "filter_blocked": 0}
+
+    def screen(self, text: str, has_filter: bool) -> Screening:
+        self._counts["screened"] += 1
+        compact = _compact(text)
+        block_hits = sorted({k for _, _, k in self._block.find_all(compact)})
+        if block_hits:
+            result = Screening("escalate" if has_filter else "block", self._threshold, block_hits)
+        elif not has_filter:
+            result = Screening("allow")
+        elif not self._enabled:
+            result = Screening("escalate")
+        else:
+            hits = sorted({k for _, _, k in self._terms.find_all(compact)})
+            score = sum(self._term_weights[k] for k in hits)
+            normalized = unicodedata.normalize("NFKC", text)
+            for pattern, weight in self._patterns:
+                if pattern.search(normalized):
+                    hits.append(pattern.pattern)
+                    score += weight
+            escalate = score >= self._threshold or len(text) > self._length
+            result = Screening("escalate" if escalate else "allow", score, hits)
+        self._counts[{"allow": "allowed", "escalate": "escalated", "block": "blocked"}[result.decision]] += 1
+        return result
+
+    def record_filter_block(self, count: int = 1):
+        """记录审查模型拦截的条数"""
+        self._counts["filter_blocked"] += count
+
+    def inherit_metrics(self, other: "ModerationCascade"):
+        """配置重新加载后沿用旧实例的统计"""
+        self._counts = other._counts
+
+    def metrics(self) -> dict:
+        counts = dict(self._counts)
+        screened = counts["screened"]
+        counts["escalation_rate"] = round(counts["escalated"] / screened, 3) if screened else 0.0
+        return counts
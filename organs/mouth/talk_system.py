@@ -1,22 +1,41 @@
+import asyncio
+import itertools
+import re
 import time
-from typing import Optional, Dict
+from typing import Optional
 from pathlib import Path
-from queue import Queue
-import threading
 from ncatbot.utils import get_log
 from ncatbot.plugin_system import EventBus
-from dataclasses import dataclass
 
 from .memoticon_system import MemoticonSystem
+from .moderation_cascade import ModerationCascade
 from ..brain.memory_system import MemorySystem
 from ..base_system import BaseSystem, SystemConfig
-from ...message import ChatRequest, MessageSender, MessageUnit
-from ...models import ChatModel, FilterModel
+from ...api_platforms import ClientPool
+from ...message import ChatRequest, MessageChainBuilder, MessageUnit, OutboundDispatcher, OutboundMessage
+from ...models import ChatModel, FilterBatcher, FilterModel
+from ...utils import AsyncLoopThread, SourceScheduler
 
 class TalkConfig(SystemConfig):
     filter_keywords: list[str] = ["台湾", "香港", "澳门", "习近平"]  # 过滤关键词列表
+    max_concurrency: int = 8  # 全局同时处理的对话请求上限
+    idle_timeout: int = 300  # 来源空闲多少秒后回收其对话通道
+    coalesce_quiet_ms: int = 1500  # 同一来源静默多少毫秒后将待处理消息合并为一次请求
+    coalesce_max_wait_ms: int = 5000  # 合并窗口的最长等待毫秒数
+    typing_speed: float = 5.0  # 模拟打字速度（字/秒），每条回复发出后按其长度空出打字时间，0 为不模拟
+    cancel_obsolete_replies: bool = True  # 同一来源有新消息需要回复时，取消旧回复中尚未发出的部分
+    moderation_cascade: bool = True  # 启用审查模型时先在本地初筛，只把可疑回复交给审查模型
+    suspect_terms: dict[str, float] = {"独立": 0.5, "主权": 0.5, "领土": 0.5, "分裂": 0.5, "政府": 0.3, "政治": 0.3, "国家": 0.2}  # 可疑词及其权重
+    suspect_patterns: dict[str, float] = {r"https?://": 1.0, r"\d{6,}": 0.3}  # 可疑正则及其权重
+    escalate_threshold: float = 1.0  # 可疑度达到该值的回复交给审查模型
+    escalate_length: int = 60  # 超过该长度的回复交给审查模型
+    filter_batch_ms: int = 50  # 各来源的审查请求最多等待多少毫秒后合并发送，0 为不合并
+    filter_batch_size: int = 32  # 合并审查请求的最大条数
+    metrics_log_interval: int = 300  # 每隔多少秒在 debug 日志中输出审查统计，0 为不输出
     def __init__(self, work_path: Path) -> None:
-        super().__init__(work_path, ["filter_keywords"])
+        super().__init__(work_path, ["filter_keywords", "max_concurrency", "idle_timeout", "coalesce_quiet_ms", "coalesce_max_wait_ms",
+                                     "typing_speed", "cancel_obsolete_replies", "moderation_cascade", "suspect_terms", "suspect_patterns",
+                                     "escalate_threshold", "escalate_length", "filter_batch_ms", "filter_batch_size", "metrics_log_interval"])
 
 class TalkSystem(BaseSystem[TalkConfig]):
     log = get_log("SiriusChatCore-TalkSystem")
@@ -24,104 +43,188 @@ class TalkSystem(BaseSystem[TalkConfig]):
         super().__init__(event_bus, work_path, TalkConfig(work_path))
         self._chat_model = chat_model
         self._filter = filter
+        self._filter_batcher = FilterBatcher(filter, self.config.filter_batch_ms / 1000, self.config.filter_batch_size) if filter else None
         self._memoticon_system = memoticon_system
         self._memory_system = memory_system
-        # 监控线程：定期清理长时间空闲的来源
-        self._monitor_thread = threading.Thread(name="mouth_monitor_thread", target=self._monitor_loop, daemon=True)
-        self._talk_processors = []
-        self._chat_requests : Dict[str, "_ChatChannelState"] = {}
-        self._lock = threading.Lock()
-        self._monitor_thread.start()
+        self._cascade = self._build_cascade()
+        # 所有来源共享一个事件循环与固定数量的 worker
+        self._loop_thread = AsyncLoopThread("mouth_loop_thread")
+        self._loop_thread.add_shutdown_hook(ClientPool.aclose_loop_clients)
+        self._loop_thread.start()
+        self._scheduler: SourceScheduler[MessageUnit] = SourceScheduler(
+            self._loop_thread,
+            self._talk_processor,
+            max_workers=self.config.max_concurrency,
+            idle_timeout=self.config.idle_timeout,
+            quiet_period=self.config.coalesce_quiet_ms / 1000,
+            max_wait=self.config.coalesce_max_wait_ms / 1000,
+            log=self.log
+        )
+        self._scheduler.start()
+        self._dispatcher = OutboundDispatcher(self._loop_thread, self.config.typing_speed, self.log)
+        self._dispatcher.start()
+        self._generation = itertools.count(1)
+        self._loop_thread.submit(self._log_metrics())
+        self.log.debug("对话调度器已启动。")
 
     def add_talk(self, source: str, current_message: MessageUnit):
-        # TODO: 构造MessageChain
         self._memory_system.add_to_short_term(current_message)
-        chat_request = ChatRequest(
-            message_chain=self._chat_model.create_initial_message_chain(str(current_message)),
+        self._scheduler.submit(source, current_message)
+
+    def _build_chat_request(self, source: str, message_units: list[MessageUnit]) -> ChatRequest:
+        """将合并窗口内同一来源的消息单元构造为一次聊天请求，上下文取自该来源的短期记忆"""
+        message_chain = self._memory_system.get_memory(self._chat_model.create_initial_message_chain(), source, message_units)
+        if message_chain.last_role() != "user":
+            mcb = MessageChainBuilder.from_message_chain(message_chain)
+            mcb.add_user_message_by_units(message_units)
+            message_chain = mcb.build()
+        return ChatRequest(
+            message_chain=message_chain,
             source=source,
-            current_message=current_message,
+            current_message=message_units[-1],
             timestamp=int(time.time()),
-            at_bot=self._chat_model._bot_info.is_mentioned(str(current_message))
+            at_bot=any(self._chat_model._bot_info.is_mentioned(str(unit)) for unit in message_units)
+        )
+
+    async def _talk_processor(self, source: str, message_units: list[MessageUnit]):
+        try:
+            if len(message_units) > 1:
+                self.log.debug(f"合并 {source} 的 {len(message_units)} 条消息为一次请求。")
+            generation = next(self._generation)
+            # 日记检索与写入共用数据库锁，放到线程中执行，以免阻塞所有来源共享的事件循环
+            chat_request = await asyncio.to_thread(self._build_chat_request, source, message_units)
+            if self._chat_model.enable_streaming:
+                emotion, daily = await self._talk_streaming(source, chat_request, generation)
+            else:
+                p_data, v_data, emotion, daily = await self._chat_model.process_func_async(chat_request, None)
+                await self._send_replies(source, p_data.get("content", []), emotion, generation, bool(chat_request.at_bot))
+            if daily:
+                await asyncio.to_thread(self._memory_system.add_diary, source, daily)
+            if self._memoticon_system:
+                img_path = await asyncio.to_thread(self._memoticon_system.pick_meme, emotion)
+                if img_path:
+                    self._cancel_obsolete(source, generation)
+                    self._dispatcher.enqueue(source, image=img_path, typing=False, generation=generation)
+
+        except Exception as e:
+            self.log.error(f"在处理 {source} 的回复时出现了错误: {e}")
+
+    async def _talk_streaming(self, source: str, chat_request: ChatRequest, generation: int) -> tuple[str, str]:
+        """流式生成回复，每个 content 元素完整后立即入队发送"""
+        emotion, daily = "平静", ""
+        async for kind, value in self._chat_model.process_stream_async(chat_request):
+            if kind == "content":
+                await self._send_replies(source, [value], emotion, generation, bool(chat_request.at_bot))
+            elif kind == "done":
+                _, emotion, daily = value
+        return emotion, daily
+
+    def _cancel_obsolete(self, source: str, generation: int):
+        """新一代回复入队前取消该来源尚未发出的旧回复；新请求失败或没有回复时旧回复照常发出
+
+        未发出的旧回复不在短期记忆中，新回复已基于最新上下文生成。
+        """
+        if not self.config.cancel_obsolete_replies:
+            return
+        cancelled = self._dispatcher.cancel(source, before_generation=generation)
+        if cancelled:
+            self.log.debug(f"取消 {source} 的 {cancelled} 条过时回复。")
+
+    def _build_cascade(self) -> ModerationCascade:
+        return ModerationCascade(
+            self.config.filter_keywords,
+            self.config.suspect_terms,
+            self.config.suspect_patterns,
+            escalate_threshold=self.config.escalate_threshold,
+            escalate_length=self.config.escalate_length,
+            enabled=self.config.moderation_cascade
         )
-        with self._lock:
-            if source not in self._chat_requests:
-                self._chat_requests[source] = _ChatChannelState(Queue(), int(time.time()))
-                t = threading.Thread(name=f"mouth_in_{source}", target=self._talk_processor, args=(source,), daemon=True)
-                t.start()
-                self._talk_processors.append(t)
-            self._chat_requests[source].queue.put(chat_request)
 
+    async def _moderate(self, replies: list[str]) -> list[tuple[bool, str]]:
+        """审查回复内容，返回每条回复的 (是否可以发送, 原因)；本地初筛放行的回复不经过审查模型"""
+        verdicts: list[tuple[bool, str]] = []
+        escalated: list[int] = []
+        # 配置重新加载会替换初筛实例，同一批回复的初筛与统计使用同一个实例
+        cascade = self._cascade
+        for i, reply in enumerate(replies):
+            screening = cascade.screen(reply, self._filter is not None)
+            if screening.decision == "block":
+                verdicts.append((False, "包含敏感词"))
+            else:
+                verdicts.append((True, ""))
+                if screening.decision == "escalate":
+                    escalated.append(i)
+                    self.log.debug(f"回复交给审查模型: {reply} 可疑度: {screening.score} 命中: {screening.hits}")
+        if not escalated or not self._filter_batcher:
+            return verdicts
+        v_data = await self._filter_batcher.verify([replies[i] for i in escalated])
+        for i, verification_result in zip(escalated, v_data["verified"]):
+            verdicts[i] = (bool(verification_result.get("can_output", False)), verification_result.get("reason", ""))
+            if not verdicts[i][0]:
+                cascade.record_filter_block()
+        return verdicts
 
-    def _talk_processor(self, source: str):
+    def moderation_metrics(self) -> dict:
+        """审查初筛的统计，escalation_rate 为交给审查模型的比例；启用审查模型时附带合并审查的统计"""
+        metrics = self._cascade.metrics()
+        if self._filter_batcher:
+            metrics["filter_batch"] = self._filter_batcher.metrics()
+        return metrics
+
+    async def _log_metrics(self):
+        """按 metrics_log_interval 周期性地在 debug 日志中输出审查统计，间隔随配置重新加载生效"""
         while True:
-            chat_request = self._chat_requests[source].queue.get()
-            with self._lock:
-                self._chat_requests[source].last_active = int(time.time())
-            if not chat_request and not isinstance(chat_request, ChatRequest):
+            interval = self.config.metrics_log_interval
+            await asyncio.sleep(interval if interval > 0 else 60)
+            if self.config.metrics_log_interval > 0:
+                self.log.debug(f"审查统计: {self.moderation_metrics()}")
+
+    async def _send_replies(self, source: str, replies: list[str], emotion: str, generation: int, priority: bool = False) -> list[str]:
+        """审查回复并加入发送队列，返回入队的回复；打字延迟由发送队列调度，不占用 worker
+
+        priority 为 True（如@机器人）时回复走出站限速的优先通道。
+        """
+        queued: list[str] = []
+        if not replies:
+            return queued
+        verdicts = await self._moderate(replies)
+        self._cancel_obsolete(source, generation)
+        for reply_msg, (can_output, reason) in zip(replies, verdicts):
+            if not can_output:
+                self.log.info(f"过滤发送给 {source} 的消息: {reply_msg} 原因: {reason}")
+                self._dispatcher.enqueue(source, "该消息已被过滤。", typing=False, generation=generation, priority=priority)
                 continue
-            try:
-                p_data, v_data, emotion, daily = self._chat_model.process_func(chat_request, self._filter)
-                if v_data:
-                    for original_content, verification_result in zip(p_data["content"], v_data["verified"]):
-                        can_output = verification_result.get("can_output", False)
-                        reason = verification_result.get("reason", "")
-                        if not can_output:
-                            self.log.info(f"过滤发送给 {source} 的消息: {original_content} 原因: {reason}")
-                            MessageSender.send_message_to_source_sync(source, f"该消息已被过滤。")
-                        else:
-                            self.log.info(f"向 {source} 发送消息: {original_content}")
-                            MessageSender.send_message_to_source_sync(source, original_content)
-                        time.sleep(len(original_content) / 5)  # 模拟打字延迟
-                else:
-                    for reply_msg in p_data.get("content", []):
-                        if not self.is_message_allowed(reply_msg):
-                            self.log.info(f"过滤发送给 {source} 的消息: {reply_msg} 原因: 包含敏感词")
-                            MessageSender.send_message_to_source_sync(source, f"该消息已被过滤。")
-                            continue
-                        self.log.info(f"向 {source} 发送消息: {reply_msg}，当前心情: {emotion}")
-                        MessageSender.send_message_to_source_sync(source, reply_msg)
-                        time.sleep(len(reply_msg) / 5)  # 模拟打字延迟
-                if daily:
-                    self.log.info(f"记录日记: {daily}")
-                if self._memoticon_system:
-                    self._memoticon_system.send_meme(source, emotion)
-                
-            except Exception as e:
-                self.log.error(f"在处理 {source} 的回复时出现了错误: {e}")
-
-    def is_message_allowed(self, message: str) -> bool:
-        """检查消息是否包含过滤关键词"""
-        for keyword in self.config.filter_keywords:
-            if keyword in message:
-                return False
-        return True
-
-    def _monitor_loop(self):
-        self.log.debug("对话监控线程已启动。")
-        while True:
-            time.sleep(10)
-            with self._lock:
-                to_remove = []
-                for source, state in self._chat_requests.items():
-                    if state.queue.empty() and time.time() - state.last_active > 300:  # 300秒未活跃则关闭
-                        to_remove.append(source)
-                for source in to_remove:
-                    self.log.info(f"关闭 {source} 的对话处理线程。")
-                    del self._chat_requests[source]
+            self.log.info(f"向 {source} 发送消息: {reply_msg}，当前心情: {emotion}")
+            self._dispatcher.enqueue(source, reply_msg, generation=generation, priority=priority, on_sent=self._on_reply_sent)
+            queued.append(reply_msg)
+        return queued
 
-    def dispose(self):
-        with self._lock:
-            for source in list(self._chat_requests.keys()):
-                self.log.info(f"关闭 {source} 的对话处理线程。")
-                del self._chat_requests[source]
-        self.log.info("对话系统已关闭。")
+    def _on_reply_sent(self, message: OutboundMessage):
+        """回复实际发出后才写入短期记忆，被取消的回复不会出现在上下文中；连续发出的多条回复在短期记忆中合并为一条"""
+        self._memory_system.add_to_short_term(MessageUnit(
+            message=message.text or "",
+            time=str(int(time.time())),
+            source=message.source,
+            is_self=True
+        ))
 
-@dataclass(slots=True)
-class _ChatChannelState:
-    """单个来源的对话通道状态。
+    def _on_config_reloaded(self):
+        try:
+            cascade = self._build_cascade()
+        except (re.error, TypeError, ValueError) as e:
+            self.log.error(f"审查初筛配置无效，沿用原有配置: {e}")
+        else:
+            cascade.inherit_metrics(self._cascade)
+            self._cascade = cascade
+        if self._filter_batcher:
+            self._filter_batcher.max_delay = self.config.filter_batch_ms / 1000
+            self._filter_batcher.max_items = self.config.filter_batch_size
+        self._dispatcher.typing_speed = self.config.typing_speed
 
-    queue: 消息请求队列
-    last_active: 上次活跃时间戳（秒）
-    """
-    queue: Queue
-    last_active: int
\ No newline at end of file
+    def dispose(self):
+        self._scheduler.dispose()
+        self._dispatcher.dispose()
+        self._loop_thread.stop()
+        if self._filter and self._filter.cache:
+            self._filter.cache.dispose()
+        self.log.info("对话系统已关闭。")
@@ -9,6 +9,9 @@ SELFINFOPROMPT = """\
 CHATLIMITPROMPT = """\
 请用**自然、口语化的方式输出内容**，回答简短、有代入感，**不使用括号表现动作**。
 **不能查证真伪的内容回复你不知道。**你目前所获取的知识截止于2024年7月，在此以后的事情你一律不知道，除非提示词中有所提及。
+"""
+
+CHATTIMEPROMPT = """\
 现在的时间是 {}。
 """
 
@@ -20,6 +20,25 @@ MEMOTICONPROMPT = """\
 4.若图片涉及敏感内容，is_meme=false。
 """
 
+MEMOTICONBATCHPROMPT = """\
+你是一位经验丰富的表情包分拣员，擅长快速、准确地判断图片是否属于表情包。你会收到若干张图片，按出现顺序从 0 开始编号，请逐张独立判断，并以指定 JSON 格式输出结果。
+表情包定义: 以人物、动物、卡通形象或其他视觉元素为主体，通过表情、动作或配文（包括文字叠加或内置字幕）来传达明确情绪，并常用于网络聊天、社群互动中表达态度或情感的图片。纯文字截图、海报、广告、风景照、商品图等都不属于表情包。
+输出格式（完全遵循JSON格式）: 
+{"results": [
+{
+"index": "int，图片编号，从 0 开始",
+"is_meme": "bool，true 表示是表情包，false 表示不是",
+"meme_type": "当 is_meme 为 true 时必填，列表形式，必须从[\"喜悦\", \"愤怒\", \"悲伤\", \"厌恶\", \"平静\", \"尴尬\", \"失望\", \"渴望\", \"疑惑\"]中选择所有你认为图片所表达的心情的词语，不出现没有提及到的词语；若 is_meme 为 false，此字段留空列表 []",
+"description": "string，对图片内容的简洁描述，不超过 20 个汉字"
+}, ...]}
+要求：
+1.禁止输出任何多余文字或解释，仅返回一段合法 JSON。
+2.results 中每张图片恰好一项，按编号顺序排列，每张图片的判断不受其他图片影响。
+3.描述必须客观简洁，不得出现敏感或歧视性词汇。
+4.若图片模糊无法识别，按非表情包处理：is_meme=false。
+5.若图片涉及敏感内容，is_meme=false。
+"""
+
 FILTERPROMPT = """\
 你是一个内容审查模型，以下是你的审查任务，最终输出**格式为{"verified":[{"index":0,"can_output": "...", "reason": "..."},{"index":1,"can_output": "...", "reason": "..."},...]}的JSON字符串**。
 任务：审查输入内容是否有损中国国家主权，并输出JSON。
@@ -30,4 +49,20 @@ can_output" 为布尔值，true 表示合规，false 不合规。
 reason"：使用至多10个字表明不合规的理由，禁止在其中重复不合规的信息
 **输出必须为JSON字符串，无需(\\t\\n)修饰**，禁止输出其它任何内容。
 **only output important short thinking while thinking output**
-"""
\ No newline at end of file
+"""
+JSONREPAIRPROMPT = """\
+你是一个JSON修复工具。输入是另一个模型的原始输出，它本应是一个JSON对象，但格式有误、被截断或夹杂了多余文字。
+要求：
+1.只修复格式，保留原始输出中的所有信息，不增删、不改写内容。
+2.输出的JSON对象必须包含输入中给出的字段；原始输出中确实缺失的字段，按字段含义填入空值（空字符串、空列表或false）。
+3.**仅输出修复后的JSON字符串**，禁止输出其它任何内容。
+"""
+SUMMARYPROMPT = """\
+你是一个对话摘要模型，负责把较早的群聊/私聊记录压缩成简短的摘要，供聊天模型回忆上下文。
+输入内容：可能包含“已有摘要”和若干条按时间排列的消息，消息格式为<message><time:.../><user:.../><user_qqid:.../>...</message>，不带 user 标签的是你自己（聊天机器人）发送的消息。
+要求：
+1.将已有摘要与新消息合并为一段新的摘要，保留话题、结论、各人的关键观点与尚未完成的事情，删去寒暄与重复内容。
+2.**所有出现的人物必须以“<user_id:.../>”来表示**，其中为该用户的 user_qqid，不出现任何用户昵称；你自己用“我”表示。
+3.摘要不超过200个汉字。
+输出格式：**仅输出格式为{"summary": "..."}的JSON字符串**，禁止输出其它任何内容。
+"""
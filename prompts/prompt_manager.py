@@ -1,11 +1,14 @@
 import time
 
 from ..ego.base_info import BotBaseInfo
-from .ego_prompt import SELFINFOPROMPT, CHATSTRUCTURELIMITPROMPT, CHATLIMITPROMPT
+from .ego_prompt import SELFINFOPROMPT, CHATSTRUCTURELIMITPROMPT, CHATLIMITPROMPT, CHATTIMEPROMPT
 from .message_prompt import MESSAGEUNITPROMPT
-from .model_prompt import CHATTOOLSPROMPT, MEMOTICONPROMPT, FILTERPROMPT
+from .model_prompt import CHATTOOLSPROMPT, MEMOTICONPROMPT, MEMOTICONBATCHPROMPT, FILTERPROMPT, JSONREPAIRPROMPT, SUMMARYPROMPT
 
 class PromptManager:
+    # id(bot_info) -> (bot_info, version, prompt)，人格信息未变化时复用已渲染的系统提示词
+    _chat_prompt_cache: dict[int, tuple[BotBaseInfo, int, str]] = {}
+
     @staticmethod
     def _get_self_info_prompt(bot_info: BotBaseInfo) -> str:
         if bot_info.more_info == "无":
@@ -24,7 +27,11 @@ class PromptManager:
         )
     @staticmethod
     def _get_chat_limit_prompt() -> str:
-        return CHATLIMITPROMPT.format(str(time.strftime("%Y年%m月%d日 %H:%M", time.localtime())))
+        return CHATLIMITPROMPT
+
+    @staticmethod
+    def _get_chat_time_prompt() -> str:
+        return CHATTIMEPROMPT.format(str(time.strftime("%Y年%m月%d日 %H:%M", time.localtime())))
 
     @staticmethod
     def _get_chat_structure_limit_prompt() -> str:
@@ -32,15 +39,29 @@ class PromptManager:
 
     @staticmethod
     def get_chat_prompt(bot_info: BotBaseInfo) -> str:
+        """聊天系统提示词的稳定前缀，按 bot_info 的版本缓存
+
+        只包含不随时间变化的内容，保证请求前缀一致以命中服务商的前缀缓存，
+        时间、日记、工具等易变内容需追加在其后。
+        """
+        cached = PromptManager._chat_prompt_cache.get(id(bot_info))
+        if cached and cached[0] is bot_info and cached[1] == bot_info.version:
+            return cached[2]
         prompts = [
             PromptManager._get_self_info_prompt(bot_info), # 角色信息
             PromptManager.get_message_unit_prompt(), # 介绍MessageUnit的组成
-            PromptManager._get_chat_limit_prompt(), # 聊天时间限制
+            PromptManager._get_chat_limit_prompt(), # 聊天限制
             PromptManager._get_chat_structure_limit_prompt() # 聊天结构限制
             ]
         prompt = "\n".join(prompts)
+        PromptManager._chat_prompt_cache[id(bot_info)] = (bot_info, bot_info.version, prompt)
         return prompt
 
+    @staticmethod
+    def get_chat_volatile_prompt() -> str:
+        """聊天系统提示词中随时间变化的部分，追加在稳定前缀之后"""
+        return PromptManager._get_chat_time_prompt()
+
     @staticmethod
     def get_message_unit_prompt() -> str:
         return MESSAGEUNITPROMPT
@@ -55,7 +76,19 @@ class PromptManager:
     @staticmethod
     def get_memoticon_prompt() -> str:
         return MEMOTICONPROMPT
+
+    @staticmethod
+    def get_memoticon_batch_prompt() -> str:
+        return MEMOTICONBATCHPROMPT
     
     @staticmethod
     def get_filter_prompt() -> str:
-        return FILTERPROMPT
\ No newline at end of file
+        return FILTERPROMPT
+
+    @staticmethod
+    def get_summary_prompt() -> str:
+        return SUMMARYPROMPT
+
+    @staticmethod
+    def get_json_repair_prompt() -> str:
+        return JSONREPAIRPROMPT
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 插件根目录本身是一个依赖 ncatbot 的包，测试直接从根目录导入各子包，与当前工作目录无关
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,73 @@
+import pytest
+
+from utils import OutputSchema, StructuredOutputError, parse_json_object, parse_structured
+
+
+def test_complete_json_with_fence_and_prose():
+    text = '好的，结果如下：\n```json\n{"summary": "ok", "extra": [1, 2]}\n```'
+    assert parse_json_object(text) == {"summary": "ok", "extra": [1, 2]}
+
+
+def test_truncated_list_element_is_dropped():
+    text = '[{"index":0,"can_output":true},{"index":1,"can_o'
+    assert parse_json_object(text) == [{"index": 0, "can_output": True}]
+
+
+def test_truncated_element_without_string_is_dropped():
+    text = '[{"index":0,"can_output":true},{"index":1'
+    assert parse_json_object(text) == [{"index": 0, "can_output": True}]
+
+
+def test_truncated_first_element_leaves_empty_list():
+    assert parse_json_object('[{"index":0,"can_o') == []
+
+
+def test_truncated_nested_list_keeps_outer_fields():
+    text = '{"emotion": "开心", "content": ["第一句", "第二'
+    assert parse_json_object(text) == {"emotion": "开心", "content": ["第一句"]}
+
+
+def test_truncated_nested_list_first_item():
+    text = '{"emotion": "开心", "content": ["第一'
+    assert parse_json_object(text) == {"emotion": "开心", "content": []}
+
+
+def test_truncated_list_after_prose_prefix():
+    text = '结果：{"verified": [{"index":0,"can_output":true},{"index":1,"can_output":fa'
+    assert parse_json_object(text) == {"verified": [{"index": 0, "can_output": True}]}
+
+
+def test_truncated_object_string_is_closed():
+    assert parse_json_object('{"emotion": "平静", "diary": "今天') == {"emotion": "平静", "diary": "今天"}
+
+
+def test_truncated_after_escape():
+    assert parse_json_object('{"summary": "a\\') == {"summary": "a"}
+
+
+def test_unparseable_output_raises():
+    with pytest.raises(StructuredOutputError):
+        parse_json_object("没有 JSON")
+
+
+@pytest.mark.parametrize("value, expected", [(1, True), (0, False), (True, True), ("yes", True), ("false", False)])
+def test_schema_coerces_bool(value, expected):
+    assert OutputSchema({"can_output": bool}).apply({"can_output": value})["can_output"] is expected
+
+
+def test_schema_rejects_other_ints_as_bool():
+    with pytest.raises(StructuredOutputError):
+        OutputSchema({"can_output": bool}, required=["can_output"]).apply({"can_output": 2})
+
+
+def test_schema_defaults_and_list_key():
+    schema = OutputSchema({"verified": list}, required=["verified"], list_key="verified")
+    assert parse_structured('[{"index": 0, "can_output": 1}]', schema) == {"verified": [{"index": 0, "can_output": 1}]}
+    schema = OutputSchema({"emotion": str, "content": list, "diary": str},
+                          required=["content"], defaults={"emotion": "平静", "diary": ""})
+    assert parse_structured('{"content": "你好"}', schema) == {"content": ["你好"], "emotion": "平静", "diary": ""}
+
+
+def test_schema_missing_required_field_raises():
+    with pytest.raises(StructuredOutputError):
+        parse_structured('{"emotion": "平静"}', OutputSchema({"content": list}, required=["content"]))
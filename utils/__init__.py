@@ -1,4 +1,16 @@
 
 from .config_generator import ConfigGenerator
+from .loop_thread import AsyncLoopThread
+from .loop_bridge import LoopBridge
+from .source_scheduler import SourceScheduler
+from .chat_stream_parser import ChatStreamParser
+from .keyword_matcher import KeywordMatcher
+from .bk_tree import BKTree, hamming_distance
+from .image_hash import dhash
+from .token_estimator import estimate_tokens
+from .token_bucket import TokenBucket
+from .ttl_cache import AsyncTTLCache
+from .structured_output import OutputSchema, StructuredOutputError, parse_json_object, parse_structured
 
-__all__ = ["ConfigGenerator"]
\ No newline at end of file
+__all__ = ["ConfigGenerator", "AsyncLoopThread", "LoopBridge", "SourceScheduler", "ChatStreamParser", "KeywordMatcher", "BKTree", "hamming_distance", "dhash", "estimate_tokens", "TokenBucket", "AsyncTTLCache",
+           "OutputSchema", "StructuredOutputError", "parse_json_object", "parse_structured"]
@@ -0,0 +1,67 @@
+from typing import Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class _BKNode(Generic[T]):
+    __slots__ = ("value", "items", "children")
+
+    def __init__(self, value: int, item: T):
+        self.value = value
+        self.items: list[T] = [item]
+        self.children: dict[int, "_BKNode[T]"] = {}
+
+
+class BKTree(Generic[T]):
+    """基于汉明距离的 BK 树，用于感知哈希的近邻查询
+
+    说明:
+        - 查询距离不超过 max_distance 的所有条目时，利用三角不等式剪枝，只访问距离区间内的子树。
+        - 相同哈希值的条目挂在同一节点上。
+        - 非线程安全，由调用方加锁。
+    """
+
+    def __init__(self):
+        self._root: Optional[_BKNode[T]] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: int, item: T):
+        self._size += 1
+        if self._root is None:
+            self._root = _BKNode(value, item)
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node.value)
+            if distance == 0:
+                node.items.append(item)
+                return
+            child = node.children.get(distance)
+            if child is None:
+                node.children[distance] = _BKNode(value, item)
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> list[tuple[int, T]]:
+        """返回所有距离不超过 max_distance 的 (距离, 条目)，按距离升序"""
+        if self._root is None:
+            return []
+        result: list[tuple[int, T]] = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node.value)
+            if distance <= max_distance:
+                result.extend((distance, item) for item in node.items)
+            for d, child in node.children.items():
+                if distance - max_distance <= d <= distance + max_distance:
+                    stack.append(child)
+        result.sort(key=lambda x: x[0])
+        return result
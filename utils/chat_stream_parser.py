@@ -0,0 +1,107 @@
+import json
+from typing import Any, Optional
+
+from .structured_output import parse_json_object
+
+
+class ChatStreamParser:
+    """聊天输出 `{"emotion": ..., "content": [...], "diary": ...}` 的增量解析器
+
+    说明:
+        - `feed` 接收流式返回的文本片段，返回本次新完成的 content 元素，元素完整后即可发送。
+        - 只扫描新增的字符，不回溯已扫描的部分；对象之前的代码块标记等多余文本会被跳过。
+        - `close` 在流结束后解析完整结果，补齐增量阶段未能产出的 content 元素（例如模型把 content 输出成了字符串）。
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False
+        self._current_key: Optional[str] = None
+        self._in_content = False
+        self._finished = False
+        self.fields: dict[str, Any] = {}
+        self.content: list[str] = []
+
+    @property
+    def emotion(self) -> Optional[str]:
+        return self.fields.get("emotion")
+
+    def feed(self, chunk: str) -> list[str]:
+        """输入新的文本片段，返回新完成的 content 元素"""
+        self._buffer += chunk
+        completed: list[str] = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer) and not self._finished:
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._on_string(json.loads(buffer[self._string_start:i + 1]), completed)
+            elif self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._expect_key = True
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if self._depth == 1 and ch == "[" and self._current_key == "content":
+                    self._in_content = True
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1:
+                    self._in_content = False
+                elif self._depth == 0:
+                    self._finished = True
+            elif self._depth == 1:
+                if ch == ",":
+                    self._expect_key = True
+                elif ch == ":":
+                    self._expect_key = False
+            i += 1
+        self._pos = i
+        return completed
+
+    def _on_string(self, value: str, completed: list[str]):
+        if self._depth == 1:
+            if self._expect_key:
+                self._current_key = value
+            elif self._current_key:
+                self.fields[self._current_key] = value
+        elif self._depth == 2 and self._in_content:
+            self.content.append(value)
+            completed.append(value)
+
+    def close(self) -> tuple[dict, list[str]]:
+        """结束解析，返回完整结果与增量阶段尚未产出的 content 元素"""
+        try:
+            result = parse_json_object(self._buffer)
+            if not isinstance(result, dict):
+                raise ValueError("无效的响应格式")
+        except Exception:
+            if not self.fields and not self.content:
+                raise ValueError(f"流式响应解析失败: {self._buffer}")
+            result = dict(self.fields)
+        content = result.get("content", self.content)
+        if isinstance(content, str):
+            try:
+                content = json.loads(content)
+            except Exception:
+                content = [content]
+        if not isinstance(content, list):
+            content = []
+        content = [str(c) for c in content]
+        remaining = content[len(self.content):] if content[:len(self.content)] == self.content else []
+        result["content"] = self.content + remaining
+        return result, remaining
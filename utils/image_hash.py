@@ -0,0 +1,26 @@
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image
+
+
+def dhash(img_bytes: bytes, hash_size: int = 8) -> Optional[int]:
+    """计算图片的差异哈希（dHash），动图取第一帧；无法解码时返回 None
+
+    说明:
+        - 缩放为 (hash_size + 1) x hash_size 的灰度图，比较水平相邻像素得到 hash_size^2 位整数。
+        - 对缩放、重新压缩、格式转换不敏感，用汉明距离衡量两张图片的相似程度。
+    """
+    try:
+        with Image.open(BytesIO(img_bytes)) as img:
+            img.seek(0)
+            small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+            pixels = list(small.getdata())
+    except Exception:
+        return None
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
@@ -0,0 +1,94 @@
+from collections import deque
+from typing import Iterable, Optional
+
+Match = tuple[int, int, str]
+
+
+class KeywordMatcher:
+    """Aho-Corasick 多模式匹配自动机
+
+    说明:
+        - 构建一次后复用，单次匹配耗时只与文本长度和命中数有关，与关键词数量无关。
+        - 匹配结果为 (start, end, keyword)，`text[start:end]` 即命中的片段。
+        - `ignore_case` 为 True 时按 `str.lower` 匹配，返回的 keyword 为原始关键词。
+    """
+
+    __slots__ = ("_ignore_case", "_goto", "_fail", "_output", "_patterns")
+
+    def __init__(self, patterns: Iterable[str], ignore_case: bool = False):
+        self._ignore_case = ignore_case
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[list[int]] = [[]]
+        self._patterns: list[str] = []
+        seen: set[str] = set()
+        for pattern in patterns:
+            if not pattern or pattern in seen:
+                continue
+            seen.add(pattern)
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern: str):
+        index = len(self._patterns)
+        self._patterns.append(pattern)
+        node = 0
+        for ch in (pattern.lower() if self._ignore_case else pattern):
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = nxt
+        self._output[node].append(index)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._output[nxt].extend(self._output[self._fail[nxt]])
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    @property
+    def patterns(self) -> list[str]:
+        return list(self._patterns)
+
+    def _iter(self, text: str):
+        if not self._patterns:
+            return
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for i, ch in enumerate(text.lower() if self._ignore_case else text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for index in output[node]:
+                yield i, index
+
+    def find_all(self, text: str) -> list[Match]:
+        """返回所有命中，按结束位置排序"""
+        result = []
+        for end, index in self._iter(text):
+            pattern = self._patterns[index]
+            result.append((end + 1 - len(pattern), end + 1, pattern))
+        return result
+
+    def search(self, text: str) -> Optional[Match]:
+        """返回第一个命中（结束位置最靠前），没有命中则返回 None"""
+        for end, index in self._iter(text):
+            pattern = self._patterns[index]
+            return end + 1 - len(pattern), end + 1, pattern
+        return None
+
+    def contains_any(self, text: str) -> bool:
+        return self.search(text) is not None
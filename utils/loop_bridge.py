@@ -0,0 +1,63 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Coroutine, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LoopBridge:
+    """指向插件主事件循环的桥
+
+    说明:
+        - 插件加载时在主事件循环中调用 `bind`，之后任意线程或其它事件循环都可以把协程提交到主循环执行，
+          不再为每次调用 `asyncio.run` 新建事件循环，也避免在其它循环中使用绑定主循环的对象。
+        - `submit` 返回 concurrent.futures.Future；`run` 阻塞等待结果，不能在主循环线程中调用；
+          `run_async` 供其它事件循环中的协程等待结果。
+    """
+
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    _thread_id: Optional[int] = None
+
+    @classmethod
+    def bind(cls, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """绑定主事件循环，缺省为当前正在运行的事件循环"""
+        cls._loop = loop or asyncio.get_running_loop()
+        cls._thread_id = threading.get_ident()
+
+    @classmethod
+    def unbind(cls):
+        cls._loop = None
+        cls._thread_id = None
+
+    @classmethod
+    def is_bound(cls) -> bool:
+        return cls._loop is not None and not cls._loop.is_closed()
+
+    @classmethod
+    def in_loop_thread(cls) -> bool:
+        return cls._thread_id == threading.get_ident()
+
+    @classmethod
+    def submit(cls, coro: Coroutine[Any, Any, T]) -> "concurrent.futures.Future[T]":
+        """线程安全地把协程提交到主事件循环"""
+        if not cls.is_bound():
+            coro.close()
+            raise RuntimeError("LoopBridge 尚未绑定事件循环")
+        assert cls._loop is not None
+        return asyncio.run_coroutine_threadsafe(coro, cls._loop)
+
+    @classmethod
+    def run(cls, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        """在主事件循环中执行协程并阻塞等待结果"""
+        if cls.in_loop_thread():
+            coro.close()
+            raise RuntimeError("不能在主事件循环线程中阻塞等待，请直接 await")
+        return cls.submit(coro).result(timeout)
+
+    @classmethod
+    async def run_async(cls, coro: Coroutine[Any, Any, T]) -> T:
+        """在主事件循环中执行协程，由当前事件循环等待结果"""
+        if cls._loop is asyncio.get_running_loop():
+            return await coro
+        return await asyncio.wrap_future(cls.submit(coro))
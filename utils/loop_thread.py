@@ -0,0 +1,68 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Awaitable, Callable, Coroutine, TypeVar
+
+T = TypeVar("T")
+
+
+class AsyncLoopThread:
+    """在独立守护线程中运行的 asyncio 事件循环
+
+    说明:
+        - `submit` / `call_soon` 可在任意线程调用，任务在该事件循环中执行。
+        - `add_shutdown_hook` 注册的协程函数会在事件循环退出前依次执行，用于释放绑定该循环的资源。
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(name=name, target=self._run, daemon=True)
+        self._shutdown_hooks: list[Callable[[], Awaitable[Any]]] = []
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    def is_current(self) -> bool:
+        """当前线程是否为该事件循环所在线程"""
+        return threading.current_thread() is self._thread
+
+    def start(self) -> "AsyncLoopThread":
+        self._thread.start()
+        return self
+
+    def add_shutdown_hook(self, hook: Callable[[], Awaitable[Any]]):
+        self._shutdown_hooks.append(hook)
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> "concurrent.futures.Future[T]":
+        """线程安全地提交协程，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def call_soon(self, callback: Callable[..., Any], *args: Any):
+        """线程安全地在事件循环中调度回调"""
+        self._loop.call_soon_threadsafe(callback, *args)
+
+    def stop(self, timeout: float = 5):
+        """停止事件循环并等待线程退出"""
+        if not self._thread.is_alive():
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if not self.is_current():
+            self._thread.join(timeout)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_forever()
+        finally:
+            try:
+                tasks = [t for t in asyncio.all_tasks(self._loop) if not t.done()]
+                for task in tasks:
+                    task.cancel()
+                self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+                for hook in self._shutdown_hooks:
+                    self._loop.run_until_complete(hook())
+                self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            finally:
+                self._loop.close()
@@ -0,0 +1,165 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from logging import Logger
+from typing import Awaitable, Callable, Dict, Generic, List, Optional, TypeVar
+
+from .loop_thread import AsyncLoopThread
+
+T = TypeVar("T")
+
+
+@dataclass(slots=True)
+class _SourceState:
+    """单个来源的调度状态。
+
+    pending: 待处理的任务
+    last_active: 上次活跃时间（monotonic 秒）
+    first_pending: 当前这批待处理任务中第一个到达的时间
+    last_pending: 当前这批待处理任务中最后一个到达的时间
+    scheduled: 是否已在就绪队列中或正在被处理
+    timer: 合并窗口的定时器
+    """
+    pending: deque = field(default_factory=deque)
+    last_active: float = field(default_factory=time.monotonic)
+    first_pending: float = 0.0
+    last_pending: float = 0.0
+    scheduled: bool = False
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class SourceScheduler(Generic[T]):
+    """按来源调度的有界异步任务调度器
+
+    说明:
+        - 固定数量的 worker 协程消费就绪队列，全局并发数不超过 `max_workers`。
+        - 同一来源同一时刻至多由一个 worker 处理，保证来源内的处理顺序。
+        - 来源处理完一批任务后重新排到就绪队列末尾，来源之间轮转公平。
+        - 合并窗口: 来源在 `quiet_period` 秒内没有新任务，或距这批第一个任务已过 `max_wait` 秒时，
+          才进入就绪队列，届时该来源所有待处理任务作为一批交给 handler。窗口等待不占用 worker。
+        - 空闲超过 `idle_timeout` 秒的来源状态会被真正回收。
+    """
+
+    def __init__(self,
+                 loop_thread: AsyncLoopThread,
+                 handler: Callable[[str, List[T]], Awaitable[None]],
+                 max_workers: int = 8,
+                 idle_timeout: float = 300,
+                 quiet_period: float = 0,
+                 max_wait: float = 0,
+                 log: Optional[Logger] = None):
+        if max_workers < 1:
+            raise ValueError("max_workers 必须大于 0")
+        self._loop_thread = loop_thread
+        self._handler = handler
+        self._max_workers = max_workers
+        self._idle_timeout = idle_timeout
+        self._quiet_period = max(quiet_period, 0)
+        self._max_wait = max(max_wait, self._quiet_period)
+        self._log = log
+        self._sources: Dict[str, _SourceState] = {}
+        self._ready: Optional[asyncio.Queue[str]] = None
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        self._loop_thread.submit(self._start()).result(timeout=5)
+
+    def submit(self, source: str, item: T):
+        """提交任务，可在任意线程调用"""
+        self._loop_thread.call_soon(self._enqueue, source, item)
+
+    def dispose(self):
+        """停止所有 worker 并丢弃未处理的任务"""
+        if self._loop_thread.loop.is_closed():
+            return
+        self._loop_thread.submit(self._dispose()).result(timeout=5)
+
+    @property
+    def source_count(self) -> int:
+        return len(self._sources)
+
+    async def _start(self):
+        self._ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self._max_workers)]
+        self._tasks.append(asyncio.create_task(self._reaper()))
+
+    async def _dispose(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        for state in self._sources.values():
+            if state.timer:
+                state.timer.cancel()
+        self._sources.clear()
+
+    def _enqueue(self, source: str, item: T):
+        state = self._sources.get(source)
+        if state is None:
+            state = self._sources[source] = _SourceState()
+        now = time.monotonic()
+        if not state.pending:
+            state.first_pending = now
+        state.pending.append(item)
+        state.last_pending = now
+        state.last_active = now
+        self._schedule(source, state)
+
+    def _schedule(self, source: str, state: _SourceState):
+        if state.scheduled or not state.pending or self._ready is None:
+            return
+        if state.timer:
+            state.timer.cancel()
+            state.timer = None
+        now = time.monotonic()
+        due = min(state.last_pending + self._quiet_period, state.first_pending + self._max_wait)
+        if due > now:
+            state.timer = asyncio.get_running_loop().call_later(due - now, self._on_window_closed, source)
+            return
+        state.scheduled = True
+        self._ready.put_nowait(source)
+
+    def _on_window_closed(self, source: str):
+        state = self._sources.get(source)
+        if state is None:
+            return
+        state.timer = None
+        self._schedule(source, state)
+
+    async def _worker(self, index: int):
+        assert self._ready is not None
+        while True:
+            source = await self._ready.get()
+            state = self._sources.get(source)
+            if state is None or not state.pending:
+                if state:
+                    state.scheduled = False
+                continue
+            items = list(state.pending)
+            state.pending.clear()
+            try:
+                await self._handler(source, items)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self._log:
+                    self._log.error(f"worker-{index} 处理 {source} 的任务时出现了错误: {e}")
+            finally:
+                state.last_active = time.monotonic()
+                state.scheduled = False
+            self._schedule(source, state)
+
+    async def _reaper(self):
+        interval = max(min(self._idle_timeout / 2, 10), 0.1)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            to_remove = [
+                source for source, state in self._sources.items()
+                if not state.scheduled and not state.pending and now - state.last_active > self._idle_timeout
+            ]
+            for source in to_remove:
+                del self._sources[source]
+                if self._log:
+                    self._log.info(f"回收 {source} 的空闲对话通道。")
@@ -0,0 +1,194 @@
+import json
+import re
+from typing import Any, Iterable, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson 只用于加速，未安装时使用标准库
+    orjson = None
+
+_FENCE_PATTERN = re.compile(r"```[a-zA-Z]*")
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class StructuredOutputError(ValueError):
+    """模型输出无法解析为要求的 JSON 结构"""
+
+
+def _loads(text: str) -> Any:
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _scan(text: str, start: int) -> tuple[Optional[int], list[str], list[int], bool, list[tuple[int, tuple[str, ...]]]]:
+    """从 start 处的 `{` 或 `[` 开始扫描
+
+    Returns:
+        (对象结束位置，未闭合时为 None；未闭合的括号栈；栈中各括号相对 start 的位置；是否停在字符串内；
+        各逗号相对 start 的位置与当时的括号栈)
+    """
+    stack: list[str] = []
+    opens: list[int] = []
+    commas: list[tuple[int, tuple[str, ...]]] = []
+    in_string = escape = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+            opens.append(i - start)
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+                opens.pop()
+            if not stack:
+                return i + 1, [], [], False, commas
+        elif ch == ",":
+            commas.append((i - start, tuple(stack)))
+    return None, stack, opens, in_string, commas
+
+
+def _close(fragment: str, stack: Iterable[str]) -> str:
+    return fragment.rstrip().rstrip(",") + "".join(_CLOSERS[ch] for ch in reversed(list(stack)))
+
+
+def _repair(text: str, stack: list[str], opens: list[int], in_string: bool,
+            commas: list[tuple[int, tuple[str, ...]]]) -> Any:
+    """修复被截断的对象或列表
+
+    截断在列表元素中间时丢弃残缺的元素，只在列表元素之间的逗号或列表开头处截断；
+    否则优先补齐引号与括号，失败时逐个退回到前一个逗号处截断。
+    """
+    list_depth = max((depth for depth, ch in enumerate(stack) if ch == "["), default=-1)
+    if list_depth != -1 and (in_string or list_depth < len(stack) - 1):
+        # 残缺的元素（如缺少字段的对象）解析出来也不可信
+        cuts = [(pos, snapshot) for pos, snapshot in commas if snapshot[-1] == "["]
+        cuts.extend((opens[depth] + 1, tuple(stack[:depth + 1])) for depth, ch in enumerate(stack) if ch == "[")
+        cuts.sort(key=lambda cut: cut[0], reverse=True)
+        candidates = [_close(text[:pos], snapshot) for pos, snapshot in cuts]
+    else:
+        fragment = text
+        if in_string:
+            # 截断在转义符之后时丢掉转义符再补引号
+            fragment = (text[:-1] if text.endswith("\\") else text) + '"'
+        candidates = [_close(fragment, stack)]
+        candidates.extend(_close(text[:pos], snapshot) for pos, snapshot in reversed(commas))
+    for candidate in candidates:
+        try:
+            result = _loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(result, (dict, list)):
+            return result
+    return None
+
+
+def _find_open(text: str, begin: int) -> int:
+    positions = [p for p in (text.find("{", begin), text.find("[", begin)) if p != -1]
+    return min(positions) if positions else -1
+
+
+def parse_json_object(text: str) -> Any:
+    """宽松地解析模型输出中的 JSON
+
+    依次尝试：直接解析、去掉代码块标记后解析、提取第一个完整的 JSON 对象或列表、修复被截断的对象或列表。
+    """
+    try:
+        return _loads(text)
+    except ValueError:
+        pass
+    text = _FENCE_PATTERN.sub("", text).strip()
+    try:
+        return _loads(text)
+    except ValueError:
+        pass
+    start = _find_open(text, 0)
+    while start != -1:
+        end, stack, opens, in_string, commas = _scan(text, start)
+        if end is None:
+            result = _repair(text[start:], stack, opens, in_string, commas)
+            if result is not None:
+                return result
+            break
+        try:
+            return _loads(text[start:end])
+        except ValueError:
+            start = _find_open(text, start + 1)
+    raise StructuredOutputError(f"无法从输出中解析 JSON: {text[:200]}")
+
+
+def _coerce(value: Any, expected: type) -> Any:
+    """尽量把值转换为期望的类型，无法转换时返回 None"""
+    if isinstance(value, expected):
+        return value
+    if expected is bool and isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if expected is bool and isinstance(value, str):
+        lowered = value.strip().lower()
+        return True if lowered in ("true", "1", "yes") else False if lowered in ("false", "0", "no", "") else None
+    if expected is list:
+        if isinstance(value, str):
+            try:
+                parsed = _loads(value)
+            except ValueError:
+                parsed = None
+            return parsed if isinstance(parsed, list) else [value] if value else []
+        return None if value is None else [value]
+    if expected is str and isinstance(value, (int, float)):
+        return str(value)
+    return None
+
+
+class OutputSchema:
+    """模型输出的结构约定
+
+    Args:
+        types: 字段名 -> 期望类型，类型不符时尝试转换
+        required: 必须存在且类型正确的字段，缺失时视为解析失败
+        defaults: 可缺省字段的默认值，缺失或无法转换时使用
+        list_key: 模型直接输出列表时，包装为 {list_key: 列表}
+    """
+
+    __slots__ = ("types", "required", "defaults", "list_key")
+
+    def __init__(self, types: dict[str, type], required: Iterable[str] = (), defaults: Optional[dict[str, Any]] = None,
+                 list_key: Optional[str] = None):
+        self.types = types
+        self.required = tuple(required)
+        self.defaults = defaults or {}
+        self.list_key = list_key
+
+    @property
+    def fields(self) -> list[str]:
+        return list(self.types)
+
+    def apply(self, data: Any) -> dict:
+        if isinstance(data, list) and self.list_key:
+            data = {self.list_key: data}
+        if not isinstance(data, dict):
+            raise StructuredOutputError(f"输出不是 JSON 对象: {str(data)[:200]}")
+        result = dict(data)
+        for name, expected in self.types.items():
+            value = _coerce(result[name], expected) if name in result else None
+            if value is not None:
+                result[name] = value
+            elif name in self.required:
+                raise StructuredOutputError(f"输出缺少字段 {name}: {str(data)[:200]}")
+            elif name in self.defaults:
+                default = self.defaults[name]
+                result[name] = default.copy() if isinstance(default, (list, dict)) else default
+        return result
+
+
+def parse_structured(text: str, schema: OutputSchema) -> dict:
+    """解析模型输出并按 schema 补齐缺省字段，无法挽救时抛出 StructuredOutputError"""
+    return schema.apply(parse_json_object(text))
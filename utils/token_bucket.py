@@ -0,0 +1,50 @@
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """令牌桶
+
+    说明:
+        - 令牌以 `rate` 个/秒的速度补充，最多积累 `capacity` 个，即允许的突发量。
+        - `rate` 不大于 0 时视为不限速。
+        - 本身不加锁，由调用方保证并发安全。
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: Optional[float] = None):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic() if now is None else now
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def refill(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def time_until(self, amount: float = 1, now: Optional[float] = None) -> float:
+        """距离桶内至少有 amount 个令牌还需等待的秒数"""
+        if self.unlimited:
+            return 0.0
+        self.refill(now)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float = 1):
+        """取走令牌，允许透支，透支部分由后续补充抵消"""
+        if not self.unlimited:
+            self.tokens -= amount
+
+    def is_full(self, now: Optional[float] = None) -> bool:
+        if self.unlimited:
+            return True
+        self.refill(now)
+        return self.tokens >= self.capacity
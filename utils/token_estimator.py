@@ -0,0 +1,11 @@
+import re
+
+_CJK_PATTERN = re.compile(r"[　-〿぀-ヿ㐀-䶿一-鿿가-힯＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的 token 数：中日韩字符按每字 1 个计，其余字符按每 4 个 1 个计"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class AsyncTTLCache(Generic[K, V]):
+    """带过期时间的异步缓存
+
+    说明:
+        - 命中的值在 `ttl` 秒内有效；加载结果为 None 时按 `negative_ttl` 秒缓存，避免反复查询不存在的键。
+        - 同一个键同时只有一个加载请求在进行，其它调用者等待同一个结果（single-flight）。
+        - 加载抛出的异常会传给所有等待者，但不会被缓存。
+        - 超过 `maxsize` 时淘汰最久未使用的键。
+        - 只能在同一个事件循环中使用。
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float = 0, maxsize: int = 4096):
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._maxsize = maxsize
+        self._data: OrderedDict[K, tuple[float, Optional[V]]] = OrderedDict()
+        self._inflight: Dict[K, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _lookup(self, key: K) -> tuple[bool, Optional[V]]:
+        item = self._data.get(key)
+        if item is None:
+            return False, None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def peek(self, key: K) -> Optional[V]:
+        """只读缓存，不触发加载"""
+        return self._lookup(key)[1]
+
+    def set(self, key: K, value: Optional[V]):
+        ttl = self._ttl if value is not None else self._negative_ttl
+        if ttl <= 0:
+            self._data.pop(key, None)
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: K):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    async def get(self, key: K, loader: Callable[[], Awaitable[Optional[V]]]) -> Optional[V]:
+        """获取缓存值，未命中时调用 loader 加载"""
+        hit, value = self._lookup(key)
+        if hit:
+            return value
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其它等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)